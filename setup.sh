@@ -54,7 +54,7 @@ if [[ "$*" == *"--skip-pip"* ]]; then
     printf "[PIP] Skipping installing Python packages\n"
 else
     printf "[PIP] Installing Python Packages...\n"
-    pip install pySerial pandas influxdb-client
+    pip install pySerial influxdb-client numpy pyarrow
     if [ $? -ne 0 ]; then
         printf "[PIP] Error installing PyPI packages\n"
         exit 1
@@ -83,7 +83,7 @@ if [ "$baro" = "y" ]; then
 fi
 
 if [ "$anem" = "y" ]; then
-    wind_cmd="python3 ${git_location}/src/windLogger/windLogger.py -d ${anem_log_loc}"
+    wind_cmd="python3 ${git_location}/src/windLogger/windLogger.py -d ${anem_log_loc} -n ${anem_num}"
 
     printf "[ANEMOMETER] Creating run files...\n"
     echo "#!/bin/bash" > $git_location/run/wind.sh
@@ -121,10 +121,78 @@ if [ "$influxdb" = "y" ]; then
     chmod +x $git_location/run/datasender.sh
     chown $box_user:$box_user $git_location/run/datasender.sh
 
+    echo "#!/bin/bash" > $git_location/run/datasender-daemon.sh
+    echo "${datasender_cmd} ${influxdb_cmd} --daemon" >> $git_location/run/datasender-daemon.sh
+    chmod +x $git_location/run/datasender-daemon.sh
+    chown $box_user:$box_user $git_location/run/datasender-daemon.sh
+
     printf "[INFLUXDB] Deploying systemd service files...\n"
     cp $git_location/services/datasender* /etc/systemd/system/
     systemctl daemon-reload
-    systemctl enable datasender.timer
+    if [ "$influxdb_daemon" = "y" ]; then
+        systemctl disable datasender.timer
+        systemctl enable datasender-daemon
+    else
+        systemctl disable datasender-daemon
+        systemctl enable datasender.timer
+    fi
+fi
+
+# check if log compression is required
+if [ "$compress" = "y" ]; then
+    compressor_cmd="python3 ${git_location}/src/logCompressor/logCompressor.py --daemon -c ${compress_codec}"
+
+    if [ "$baro" = "y" ]; then
+        compressor_cmd="$compressor_cmd -l ${baro_log_loc}"
+    fi
+
+    if [ "$anem" = "y" ]; then
+        compressor_cmd="$compressor_cmd -l ${anem_log_loc}"
+    fi
+
+    printf "[COMPRESSOR] Creating run files...\n"
+    echo "#!/bin/bash" > $git_location/run/compressor.sh
+    echo "${compressor_cmd}" >> $git_location/run/compressor.sh
+    chmod +x $git_location/run/compressor.sh
+    chown $box_user:$box_user $git_location/run/compressor.sh
+
+    printf "[COMPRESSOR] Deploying systemd service files...\n"
+    cp $git_location/services/log-compressor.service /etc/systemd/system/log-compressor.service
+    systemctl daemon-reload
+    systemctl enable log-compressor
+fi
+
+# check if log compaction is required
+if [ "$compact" = "y" ]; then
+    compactor_cmd="python3 ${git_location}/src/logCompactor/logCompactor.py"
+
+    if [ "$baro" = "y" ]; then
+        compactor_cmd="$compactor_cmd -l ${baro_log_loc}"
+    fi
+
+    if [ "$anem" = "y" ]; then
+        compactor_cmd="$compactor_cmd -l ${anem_log_loc}"
+    fi
+
+    # only compact what has been uploaded
+    if [ "$influxdb" = "y" ]; then
+        compactor_cmd="$compactor_cmd -u"
+    fi
+
+    if [ "$compact_daily" = "y" ]; then
+        compactor_cmd="$compactor_cmd -D"
+    fi
+
+    printf "[COMPACTOR] Creating run files...\n"
+    echo "#!/bin/bash" > $git_location/run/compactor.sh
+    echo "${compactor_cmd}" >> $git_location/run/compactor.sh
+    chmod +x $git_location/run/compactor.sh
+    chown $box_user:$box_user $git_location/run/compactor.sh
+
+    printf "[COMPACTOR] Deploying systemd service files...\n"
+    cp $git_location/services/log-compactor* /etc/systemd/system/
+    systemctl daemon-reload
+    systemctl enable log-compactor.timer
 fi
 
 if [ "$frp" = "y" ]; then
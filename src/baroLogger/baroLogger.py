@@ -25,45 +25,99 @@ import argparse
 from datetime import datetime
 import socket
 import json
+import queue
+import threading
+import selectors
+import select
+import collections
+
+# modules shared with the other loggers live in src/common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from p4Timestamp import P4TimestampParser, isoFromNs
+from logWriter import addWriterArguments, writerFromArgs
+from baroBinary import BinaryLogWriter, NO_TIME
 
 modelList = [ "6000-16B-IS", "6000-16B" ]
 
 #
-# class to read a line of data - this class is claimed to be more efficient than
-# the pyserial readline - obtains higher throughput and works better with Raspberry
-# Pis and Arduinos - as is, it does not have a timeout and will hang if a barometer
-# loses power or otherwise fails to respond - here we've modified the original code
-# to return on serial port timeout
+# class to read lines of data - replaces the ReadLine class from
+# https://github.com/pyserial/pyserial/issues/216, which sliced and reallocated
+# its buffer for every line and asked the port for in_waiting (an ioctl) before
+# every read
 #
-# original code obtained from: https://github.com/pyserial/pyserial/issues/216
+# bytes are read straight into a preallocated buffer with os.readv and every
+# complete line that is available is returned in one call as a memoryview into
+# that buffer, so there are no per-line copies - when the buffer fills up the
+# unfinished line at the end is moved back to the front, so returned lines are
+# always contiguous - the returned views are only valid until the next call
+#
+# with wait set, readlines_batch waits up to the port timeout for a complete line
+# and returns an empty list on serial port timeout - without it, it does a single
+# read and should only be used once a selector has reported the port readable
 #
 
-class ReadLine:
-    def __init__(self, s):
-        self.buf = bytearray()
+class RingReadLine:
+    def __init__(self, s, size=65536):
         self.s = s
-    
-    def readline(self):
-        i = self.buf.find(b"\n")
-        if i >= 0:
-            r = self.buf[:i+1]
-            self.buf = self.buf[i+1:]
-            return r
-        while True:
-            i = max(1, min(2048, self.s.in_waiting))
-            data = self.s.read(i)
-            
-            # return on serial port timeout
-            if not data:
-                return data
-
-            i = data.find(b"\n")
-            if i >= 0:
-                r = self.buf + data[:i+1]
-                self.buf[0:] = data[i+1:]
-                return r
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.head = 0
+        self.tail = 0
+        try:
+            self.fd = s.fileno()
+        except (AttributeError, OSError):
+            self.fd = None
+
+    def fill(self, wait):
+        if self.tail == len(self.buf):
+            if self.head == 0:
+                # a single line filled the whole buffer, throw it away
+                self.tail = 0
             else:
-                self.buf.extend(data)
+                partial = bytes(self.view[self.head:self.tail])
+                self.buf[:len(partial)] = partial
+                self.head = 0
+                self.tail = len(partial)
+        free = self.view[self.tail:]
+        try:
+            if self.fd is not None:
+                if wait and not select.select([self.fd], [], [], self.s.timeout)[0]:
+                    return 0
+                n = os.readv(self.fd, [free])
+            else:
+                data = self.s.read(max(1, min(len(free), self.s.in_waiting)))
+                n = len(data)
+                free[:n] = data
+        except OSError:
+            # the port went away, treat it like a timeout
+            return 0
+        self.tail += n
+        return n
+
+    def scan(self):
+        lines = []
+        start = self.head
+        i = self.buf.find(b"\n", start, self.tail)
+        while i >= 0:
+            lines.append(self.view[start:i+1])
+            start = i + 1
+            i = self.buf.find(b"\n", start, self.tail)
+        if start == self.tail:
+            self.head = self.tail = 0
+        else:
+            self.head = start
+        return lines
+
+    def readlines_batch(self, wait=True):
+        lines = self.scan()
+        while not lines:
+            # return an empty list on serial port timeout
+            if not self.fill(wait):
+                break
+            lines = self.scan()
+            if not wait:
+                break
+        return lines
 
 #
 # function to send a barometer command and return the response - waitFlag = 1 returns
@@ -91,6 +145,141 @@ def sendCommand(strOut, dqPort, waitFlag, verbosemodeFlag):
         print("    response: " + strIn[:-2])
     return strIn[5:-2]
 
+#
+# thread to drain one barometer - each barometer gets its own reader so a port
+# that times out (or a barometer that dies) only delays its own samples - lines
+# are stamped with the host time as soon as they are read and pushed onto a
+# bounded queue shared with the single writer in main - if the writer falls
+# behind and the queue is full the sample is dropped and counted rather than
+# letting the serial buffer back up - a barometer is considered failed and
+# the thread exits after 3 consecutive timeouts
+#
+
+class BaroReader(threading.Thread):
+    def __init__(self, dqIndex, dqSN, dqDevice, sampleQueue, stopEvent):
+        threading.Thread.__init__(self, name="BaroReader-" + dqSN, daemon=True)
+        self.dqIndex = dqIndex
+        self.dqSN = dqSN
+        self.dqDevice = dqDevice
+        self.sampleQueue = sampleQueue
+        self.stopEvent = stopEvent
+        self.failures = 0
+        self.failed = False
+        self.samples = 0
+        self.timeouts = 0
+        self.drops = 0
+
+    def run(self):
+        while not self.stopEvent.is_set():
+            lines = self.dqDevice.readlines_batch()
+            if not lines:
+                dateStr = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S")
+                print("  " + self.dqSN + ", TIMEOUT DURING READ AT: " + dateStr + "\n")
+                self.timeouts += 1
+                self.failures += 1
+                if self.failures >= 3:
+                    print("  " + self.dqSN + ", APPEARS TO HAVE FAILED AT: " + dateStr + "\n")
+                    self.failed = True
+                    break
+                continue
+            self.failures = 0
+            sysNs = time.time_ns()
+            for line in lines:
+                self.samples += 1
+                try:
+                    self.sampleQueue.put_nowait((self.dqIndex, sysNs, str(line, "ascii", "replace")))
+                except queue.Full:
+                    self.drops += 1
+
+#
+# single threaded alternative to the reader threads - every barometer serial port
+# is registered with a selector (epoll on linux) and only ports that actually have
+# bytes waiting are read, so no time is spent blocked in a per-port timeout - the
+# get() and qsize() methods mirror the sample queue so main can log from either,
+# and like the queue it holds at most maxSize samples, dropping and counting new
+# ones while it is full - a port that stays silent for a full timeout period
+# counts as a timeout and is considered failed and unregistered after 3
+# consecutive timeouts
+#
+
+class BaroPortState:
+    def __init__(self, dqIndex, dqSN, dqDevice):
+        self.dqIndex = dqIndex
+        self.dqSN = dqSN
+        self.dqDevice = dqDevice
+        self.lastDataTime = time.monotonic()
+        self.failures = 0
+        self.failed = False
+        self.samples = 0
+        self.timeouts = 0
+        self.drops = 0
+
+class BaroMultiplexer:
+    def __init__(self, dqDeviceList, dqSerialNumberList, timeout, maxSize):
+        self.timeout = timeout
+        self.maxSize = maxSize
+        self.pending = collections.deque()
+        self.selector = selectors.DefaultSelector()
+        self.portStates = []
+        for dqIndex, dqSN, dqDevice in zip(range(len(dqDeviceList)), dqSerialNumberList, dqDeviceList):
+            portState = BaroPortState(dqIndex, dqSN, dqDevice)
+            self.portStates.append(portState)
+            self.selector.register(dqDevice.fd, selectors.EVENT_READ, portState)
+
+    def qsize(self):
+        return len(self.pending)
+
+    # like queue.Queue.get, timeout None blocks until there is a sample - but with
+    # every port failed there never will be, and Empty is raised either way
+    def get(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.pending:
+            if not self.selector.get_map():
+                raise queue.Empty
+            if deadline is None:
+                self.poll(self.timeout)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise queue.Empty
+            self.poll(min(remaining, self.timeout))
+        return self.pending.popleft()
+
+    def poll(self, timeout):
+        events = self.selector.select(timeout)
+        sysNs = time.time_ns()
+        now = time.monotonic()
+        for key, mask in events:
+            portState = key.data
+            lines = portState.dqDevice.readlines_batch(wait=False)
+            if not lines:
+                continue
+            portState.lastDataTime = now
+            portState.failures = 0
+            for line in lines:
+                if len(self.pending) >= self.maxSize:
+                    portState.drops += 1
+                    continue
+                self.pending.append((portState.dqIndex, sysNs, str(line, "ascii", "replace")))
+            portState.samples += len(lines)
+
+        # count a timeout for every port that has been quiet for a full timeout period
+        for portState in self.portStates:
+            if portState.failed or now - portState.lastDataTime < self.timeout:
+                continue
+            portState.lastDataTime = now
+            dateStr = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S")
+            print("  " + portState.dqSN + ", TIMEOUT DURING READ AT: " + dateStr + "\n")
+            portState.timeouts += 1
+            portState.failures += 1
+            if portState.failures >= 3:
+                print("  " + portState.dqSN + ", APPEARS TO HAVE FAILED AT: " + dateStr + "\n")
+                portState.failed = True
+                self.selector.unregister(portState.dqDevice.fd)
+
+    def close(self):
+        self.selector.close()
+
 #
 # main method
 #
@@ -114,6 +303,25 @@ def main():
                         default="./",
                         help="top level directory for log files, use \"\" around names with white space (default = ./)")
     parser.add_argument("-n", "--numsensors", help="Number of barometers", type=int, default=2)
+    parser.add_argument("-p", "--ports",
+                        nargs="+",
+                        help="serial ports to look for barometers on instead of every usbserial port, e.g. the ports of baroSim.py")
+    parser.add_argument("-m", "--multiplex",
+                        help="read all barometers from a single thread using select/epoll instead of one reader thread per barometer",
+                        action="store_true")
+    parser.add_argument("-q", "--queuesize",
+                        type=int,
+                        default=1000,
+                        help="maximum number of samples waiting to be logged before new samples are dropped (default = 1000)")
+    parser.add_argument("-f", "--format",
+                        choices=["csv", "binary"],
+                        default="csv",
+                        help="log file format, CSV lines or fixed width binary records (.bin, see src/common/baroBinary.py) (default = csv)")
+    parser.add_argument("-s", "--stats",
+                        type=float,
+                        default=60,
+                        help="seconds between queue depth and drop counter reports, 0 to disable (default = 60)")
+    addWriterArguments(parser)
 
     #
     # parse user input
@@ -158,8 +366,10 @@ def main():
     print("\nChecking for usbserial ports...\n")
 
     usbPortList = []
+    if args.ports:
+        usbPortList = args.ports
     # for Raspberry PI
-    if sys.platform.startswith('linux') or sys.platform.startswith('cygwin'):
+    elif sys.platform.startswith('linux') or sys.platform.startswith('cygwin'):
         # this excludes your current terminal "/dev/tty"
         portList = glob.glob('/dev/tty[A-Za-z]*')
         for port in portList:
@@ -356,12 +566,12 @@ def main():
 
     print("\nStarting continuous sampling...")
 
-    # define a readline object for each barometer - because its more efficient,
-    # we will use the readline object's readline method to read the serial ports
+    # define a line reader object for each barometer - because its more efficient,
+    # we will use the reader's readlines_batch method to read the serial ports
     # instead of using the pyserial readline method
     dqDeviceList = []
     for dqPort in dqPortList:
-        dqDevice = ReadLine(dqPort)
+        dqDevice = RingReadLine(dqPort)
         dqDeviceList.append(dqDevice)
 
     # set the serial port timeout for each barometer to be larger than the sample period
@@ -370,84 +580,108 @@ def main():
     for dqPort in dqPortList:
         dqPort.timeout = 1.5 * dqSamplePeriod
 
-    # initialize current hour to a negative number to force a new log file with first sample
-    logFile = None
-    currentUTCHour = -1
+    # log files are opened and rotated hourly by the writer with the first sample of each hour
+    logWriter = None
+    binaryFlag = not testmodeFlag and args.format == "binary"
+    if binaryFlag:
+        logWriter = writerFromArgs(args, logDir, "BAROLOG", writerClass=BinaryLogWriter,
+                                   hostname=cur_hostname, sensors=dqSerialNumberList)
+    elif not testmodeFlag:
+        logWriter = writerFromArgs(args, logDir, "BAROLOG")
 
-    # define a failure list for detecting and handling barometer failures
-    dqFailuresList = [];
-    for dqPort in dqPortList:
-        dqFailures = 0;
-        dqFailuresList.append(dqFailures)
+    # timestamps from the barometers all share one fixed layout, see p4Timestamp
+    timestampParser = P4TimestampParser()
 
     # send a P4 command to to each barometer start continuous sampling
     for dqPort in dqPortList:
         sendCommand('*0100P4', dqPort, waitFlag, verbosemodeFlag)
 
+    # either multiplex all barometers in this thread, or start a reader thread per
+    # barometer with all of them feeding one bounded sample queue
+    stopEvent = threading.Event()
+    dqReaderList = []
+    if args.multiplex:
+        sampleQueue = BaroMultiplexer(dqDeviceList, dqSerialNumberList, 1.5 * dqSamplePeriod, args.queuesize)
+        dqStatsList = sampleQueue.portStates
+    else:
+        sampleQueue = queue.Queue(maxsize=args.queuesize)
+        for dqIndex, dqSN, dqDevice in zip(range(len(dqPortList)), dqSerialNumberList, dqDeviceList):
+            dqReader = BaroReader(dqIndex, dqSN, dqDevice, sampleQueue, stopEvent)
+            dqReaderList.append(dqReader)
+            dqReader.start()
+        dqStatsList = dqReaderList
+
     #
     # sample until user quits, e.g., via cntl-C
     #
 
     print("\nRunning...quit with ctrl-C...\n")
 
+    lastStatsTime = time.monotonic()
+
     try:
     
         while True:
-            
+
             #
-            # open a new log file on change in hour of day
+            # report queue depth and per barometer counters
             #
-            
-            if not testmodeFlag:
-#                if datetime.utcnow().minute != currentUTCHour:
-#                    currentUTCHour = datetime.utcnow().minute
-                if datetime.utcnow().hour != currentUTCHour:
-                    currentUTCHour = datetime.utcnow().hour
-                    if logFile is not None:
-                        logFile.close()
-                    logDirectoryName = os.path.join(logDir, "BAROLOG_{0:%Y%m%d}".format(datetime.utcnow()))
-                    os.makedirs(logDirectoryName, exist_ok=True)
-                    logFileName = "BAROLOG_{0:%Y%m%d-%H}.txt".format(datetime.utcnow())
-                    logFilePath = os.path.join(logDirectoryName, logFileName)
-                    logFile = open(logFilePath,'a')
-                    print("  opening log file: " + logFilePath + "\n")
 
+            if args.stats > 0 and time.monotonic() - lastStatsTime >= args.stats:
+                lastStatsTime = time.monotonic()
+                print("  queue depth: " + str(sampleQueue.qsize()) + "/" + str(args.queuesize))
+                if logWriter is not None:
+                    print("    log writer: " + logWriter.stats())
+                for dqStats in dqStatsList:
+                    print("    " + dqStats.dqSN + ": samples=" + str(dqStats.samples) + ", timeouts=" + str(dqStats.timeouts) + ", dropped=" + str(dqStats.drops) + (", FAILED" if dqStats.failed else ""))
+                print("")
+
+            # write out buffered samples that have been waiting too long
+            if logWriter is not None:
+                logWriter.poll()
+
+            #
+            # take the next sample off the queue - the timeout only exists so that
+            # the stats above still get printed when every barometer has failed
             #
-            # read and log pressure samples
+
+            try:
+                dqIndex, sysNs, strIn = sampleQueue.get(timeout=1)
+            except queue.Empty:
+                continue
+
             #
-            # here we use the readline object readline method instead of the pyserial
-            # readline method - note also that a barometer is considered failed and
-            # is ignored after 3 consecutive timeouts
+            # log the pressure sample
             #
-            
-            for dqIndex, dqSN, dqDevice, dqFailures in zip(range(len(dqPortList)), dqSerialNumberList, dqDeviceList, dqFailuresList):
-                if dqFailures < 3:
-                    binIn = dqDevice.readline()
-                    if not binIn:
-                        dateStr = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S")
-                        print("  " + dqSN + ", TIMEOUT DURING READ AT: " + dateStr + "\n")
-                        dqFailures += 1
-                        dqFailuresList[dqIndex] = dqFailures
-                        if dqFailures >= 3:
-                            print("  " + dqSN + ", APPEARS TO HAVE FAILED AT: " + dateStr + "\n")
-                        continue
-                    dqFailures = 0
-                    dqFailuresList[dqIndex] = dqFailures
-                    strIn = binIn.decode()
-                    in_parts = strIn.split(",")
-
-                    sys_timestamp = datetime.utcnow().isoformat() + "Z"
-
-                    try:
-                        cur_timestamp = datetime.strptime(in_parts[1].rstrip(), "%m/%d/%y %H:%M:%S.%f").isoformat() + "Z"
-                        cur_value = in_parts[2].rstrip()
-                    except:
-                        cur_timestamp = "ERROR"
-                        cur_value = strIn
-                    
-                    # log actual data
-                    logLine = cur_hostname + "," + dqSN + "," + sys_timestamp + "," + cur_timestamp + "," + cur_value
-                    logFile.write(logLine + "\n")
+
+            in_parts = strIn.split(",")
+
+            # binary records keep the timestamps as epoch ns and the pressure as a float
+            if binaryFlag:
+                try:
+                    cur_ns = timestampParser.epochNs(in_parts[1].rstrip())
+                    cur_pressure = float(in_parts[2])
+                except:
+                    cur_ns = NO_TIME
+                    cur_pressure = float("nan")
+                logWriter.writeSample(dqIndex, sysNs, cur_ns, cur_pressure)
+                continue
+
+            sys_timestamp = isoFromNs(sysNs) + "Z"
+
+            try:
+                cur_timestamp = timestampParser.isoformat(in_parts[1].rstrip()) + "Z"
+                cur_value = in_parts[2].rstrip()
+            except:
+                cur_timestamp = "ERROR"
+                cur_value = strIn
+
+            # log actual data
+            logLine = cur_hostname + "," + dqSerialNumberList[dqIndex] + "," + sys_timestamp + "," + cur_timestamp + "," + cur_value
+            if testmodeFlag:
+                print(logLine)
+            else:
+                logWriter.write(sysNs, logLine + "\n", dqSerialNumberList[dqIndex])
 
     except (KeyboardInterrupt, SystemExit):
     
@@ -457,18 +691,21 @@ def main():
         
         print("Quitting...\n")
 
-         # close rabbitmq connection
-        if args.hostname != "":
-            connection.close()
-        
+        # stop the reader threads before touching the serial ports again
+        stopEvent.set()
+        for dqReader in dqReaderList:
+            dqReader.join()
+        if args.multiplex:
+            sampleQueue.close()
+
         for dqPort in dqPortList:
             # send a command to stop P4 continuous sampling - any command will do
             sendCommand('*0100SN', dqPort, 0, verbosemodeFlag)
             time.sleep(0.2)
             dqPort.close()
         
-        if not testmodeFlag:
-            logFile.close()
+        if logWriter is not None:
+            logWriter.close()
 
 #
 # main
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+#
+# baroSim.py - pseudo-terminal simulator of Paroscientific 6000-16B-IS barometers
+#            - creates one pty per simulated barometer and links it as
+#              DIR/ttyUSBsimN, so baroLogger can be pointed at them with -p
+#            - answers the *0100MN / *0100SN probes, the configuration queries
+#              baroLogger checks (VR, XM, UN, ... TH, IA) and *0100EW writes,
+#              including GR clock sets, with the factory infrasound settings
+#            - *0100P4 starts continuous records at the TH rate on an absolute
+#              schedule, *0001,MM/dd/yy HH:MM:SS.fff,PPPP.PPPPPP - any other
+#              command stops them, as on the real units
+#            - can drop out for a while (no records at all) and emit garbage or
+#              torn lines, and counts the records it could not write because
+#              nobody drained the pty (what a serial overrun loses)
+#            - prints per barometer emitted/overrun counts every STATS seconds,
+#              compare them with baroLogger's samples/dropped stats to find how
+#              many barometers and what rate one process sustains
+#
+#   usage: ./baroSim.py [-h] [-n NUMBER] [-d DIR] [-r RATE] [-f DIGITS]
+#                       [--dropout DROPOUT] [--dropoutlength SECONDS]
+#                       [--garbage GARBAGE] [-s STATS] [-v]
+#
+
+import os
+import tty
+import math
+import time
+import random
+import select
+import argparse
+import threading
+from datetime import datetime, timedelta
+
+NS_PER_SECOND = 1000000000
+
+# factory settings, as checked by baroLogger
+SETTINGS = {
+    "MN": "6000-16B-IS",
+    "VR": "Q1.03",
+    "XM": "1",
+    "UN": "2",
+    "MD": "0",
+    "XN": "0",
+    "TS": "1",
+    "GE": "1",
+    "TJ": "0",
+    "TF": ".00",
+    "TP": "0",
+    "GT": "1",
+    "GD": "0",
+    "TH": "20,P4;>OK",
+    "IA": "6",
+}
+
+class SimBarometer(threading.Thread):
+    def __init__(self, serialNumber, linkPath, args, stopEvent):
+        threading.Thread.__init__(self, name="SimBarometer-" + serialNumber, daemon=True)
+        self.serialNumber = serialNumber
+        self.args = args
+        self.stopEvent = stopEvent
+        self.settings = dict(SETTINGS, SN=serialNumber)
+        self.settings["TH"] = str(args.rate) + ",P4;>OK"
+        self.clockOffsetNs = 0
+        self.streaming = False
+        self.writeNext = False
+        self.dropoutUntil = 0
+        self.phase = random.uniform(0, 2 * math.pi)
+
+        self.master, self.slave = os.openpty()
+        # raw like a serial port, and the slave end stays open here so the pty
+        # does not hang up whenever the logger closes it
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.ptyPath = os.ttyname(self.slave)
+        self.linkPath = linkPath
+        if os.path.lexists(linkPath):
+            os.remove(linkPath)
+        os.symlink(self.ptyPath, linkPath)
+        self.resetStats()
+
+    def resetStats(self):
+        self.emitted = 0
+        self.overruns = 0
+        self.garbage = 0
+        self.dropouts = 0
+        self.commands = 0
+
+    def rate(self):
+        return int(self.settings["TH"][:self.settings["TH"].find(",")])
+
+    def send(self, line):
+        try:
+            os.write(self.master, line.encode() + b"\r\n")
+            return True
+        except BlockingIOError:
+            self.overruns += 1
+            return False
+
+    def reply(self, setting):
+        self.send("*0001" + setting + "=" + self.settings[setting])
+
+    def handleCommand(self, command):
+        self.commands += 1
+        if self.args.verbose:
+            print("  " + self.serialNumber + " command: " + command)
+        # any command ends continuous sampling
+        self.streaming = False
+        if not command.startswith("*0100") or len(command) < 7:
+            return
+        code = command[5:7]
+        if code == "EW":
+            # the next command is a write, possibly on the same line
+            rest = command[7:]
+            if rest:
+                self.handleWrite(rest)
+            else:
+                self.writeNext = True
+        elif self.writeNext:
+            self.writeNext = False
+            self.handleWrite(command)
+        elif code == "P4":
+            self.streaming = True
+            self.nextNs = time.monotonic_ns()
+        elif code in self.settings:
+            self.reply(code)
+
+    def handleWrite(self, command):
+        if not command.startswith("*0100") or "=" not in command:
+            return
+        code, value = command[5:].split("=", 1)
+        if code == "GR":
+            deviceTime = datetime.strptime(value, "%m/%d/%y %H:%M:%S")
+            self.clockOffsetNs = round((deviceTime - datetime.utcnow()).total_seconds() * NS_PER_SECOND)
+            self.send("*0001GR=" + value)
+        else:
+            self.settings[code] = value
+            self.reply(code)
+
+    def record(self, nowNs):
+        deviceNs = time.time_ns() + self.clockOffsetNs
+        deviceTime = datetime(1970, 1, 1) + timedelta(microseconds=deviceNs // 1000)
+        fraction = str(deviceTime.microsecond).zfill(6)[:self.args.digits]
+        pressure = 1013.25 + 0.05 * math.sin(2 * math.pi * 0.1 * nowNs / NS_PER_SECOND + self.phase) + random.gauss(0, 0.0005)
+        return "*0001," + deviceTime.strftime("%m/%d/%y %H:%M:%S") + "." + fraction + ",{0:.6f}".format(pressure)
+
+    def emit(self, nowNs):
+        if nowNs < self.dropoutUntil:
+            return
+        if self.args.dropout > 0 and random.random() < self.args.dropout / self.rate():
+            self.dropouts += 1
+            self.dropoutUntil = nowNs + round(self.args.dropoutlength * NS_PER_SECOND)
+            return
+        line = self.record(nowNs)
+        if self.args.garbage > 0 and random.random() < self.args.garbage:
+            self.garbage += 1
+            if random.random() < 0.5:
+                # torn record, the rest of it never arrives
+                line = line[:random.randrange(1, len(line))]
+            else:
+                line = "".join(chr(random.randrange(33, 127)) for i in range(random.randrange(1, 40)))
+        if self.send(line):
+            self.emitted += 1
+
+    def run(self):
+        pending = b""
+        while not self.stopEvent.is_set():
+            timeout = 0.1
+            if self.streaming:
+                timeout = max(0, (self.nextNs - time.monotonic_ns()) / NS_PER_SECOND)
+            readable, writable, errored = select.select([self.master], [], [], timeout)
+            if readable:
+                try:
+                    pending += os.read(self.master, 4096)
+                except (BlockingIOError, OSError):
+                    pass
+                while b"\n" in pending:
+                    line, pending = pending.split(b"\n", 1)
+                    self.handleCommand(line.decode("ascii", "replace").strip())
+            if self.streaming:
+                nowNs = time.monotonic_ns()
+                if nowNs >= self.nextNs:
+                    self.emit(nowNs)
+                    # next point on the grid, dropping points that are already past
+                    periodNs = NS_PER_SECOND // self.rate()
+                    self.nextNs += max(1, (nowNs - self.nextNs) // periodNs + 1) * periodNs
+
+    def close(self):
+        os.remove(self.linkPath)
+        os.close(self.master)
+        os.close(self.slave)
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulates Paroscientific 6000-16B-IS barometers on pseudo-terminals.')
+    parser.add_argument("-n", "--number", help="number of barometers (default = 2)", type=int, default=2)
+    parser.add_argument("-d", "--dir", help="directory for the ttyUSBsimN links (default = /tmp/baroSim)", default="/tmp/baroSim")
+    parser.add_argument("-r", "--rate", help="initial TH sample rate in Hz (default = 20)", type=int, default=20)
+    parser.add_argument("-f", "--digits", help="digits of the timestamp seconds fraction (default = 3)", type=int, choices=range(1, 7), default=3)
+    parser.add_argument("--dropout", help="dropouts per barometer per second (default = 0)", type=float, default=0.0)
+    parser.add_argument("--dropoutlength", help="seconds without records per dropout (default = 2)", type=float, default=2.0)
+    parser.add_argument("--garbage", help="fraction of records replaced by garbage or torn lines (default = 0)", type=float, default=0.0)
+    parser.add_argument("-s", "--stats", help="seconds between count reports (default = 10)", type=float, default=10)
+    parser.add_argument("-v", "--verbose", help="show every command received", action="store_true")
+    args = parser.parse_args()
+
+    os.makedirs(args.dir, exist_ok=True)
+    stopEvent = threading.Event()
+    barometers = []
+    for i in range(args.number):
+        barometer = SimBarometer(str(150000 + i), os.path.join(args.dir, "ttyUSBsim" + str(i)), args, stopEvent)
+        print("  SN=" + barometer.serialNumber + " on " + barometer.linkPath + " -> " + barometer.ptyPath)
+        barometers.append(barometer)
+    print("\nbaroLogger -n " + str(args.number) + " -p " + " ".join(barometer.linkPath for barometer in barometers))
+    print("\nSimulating " + str(args.number) + " barometer(s)\nQuit with CTRL+C\n")
+
+    for barometer in barometers:
+        barometer.start()
+    try:
+        while True:
+            time.sleep(args.stats)
+            for barometer in barometers:
+                print("  " + barometer.serialNumber + ": " + ("streaming at " + str(barometer.rate()) + " Hz" if barometer.streaming else "idle")
+                      + ", emitted=" + str(barometer.emitted) + ", overruns=" + str(barometer.overruns)
+                      + ", garbage=" + str(barometer.garbage) + ", dropouts=" + str(barometer.dropouts) + ", commands=" + str(barometer.commands))
+            print("")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stopEvent.set()
+        for barometer in barometers:
+            barometer.join()
+            barometer.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+#
+# benchReadLine.py - micro-benchmark of the barometer line readers
+#                  - compares the original ReadLine class against RingReadLine
+#                  - P4 records are pushed through a pipe by a feeder thread so
+#                    both readers see real read()/ioctl() syscalls
+#
+#   usage: ./benchReadLine.py [-h] [-l LINES]
+#
+
+import os
+import fcntl
+import termios
+import struct
+import threading
+import time
+import argparse
+
+from baroLogger import RingReadLine
+
+#
+# the original line reader from baroLogger (https://github.com/pyserial/pyserial/issues/216),
+# kept here as the baseline
+#
+
+class ReadLine:
+    def __init__(self, s):
+        self.buf = bytearray()
+        self.s = s
+
+    def readline(self):
+        i = self.buf.find(b"\n")
+        if i >= 0:
+            r = self.buf[:i+1]
+            self.buf = self.buf[i+1:]
+            return r
+        while True:
+            i = max(1, min(2048, self.s.in_waiting))
+            data = self.s.read(i)
+
+            # return on serial port timeout
+            if not data:
+                return data
+
+            i = data.find(b"\n")
+            if i >= 0:
+                r = self.buf + data[:i+1]
+                self.buf[0:] = data[i+1:]
+                return r
+            else:
+                self.buf.extend(data)
+
+#
+# just enough of a pyserial port on top of the read end of a pipe
+#
+
+class PipePort:
+    def __init__(self, fd):
+        self.fd = fd
+        self.timeout = 1
+
+    def fileno(self):
+        return self.fd
+
+    @property
+    def in_waiting(self):
+        return struct.unpack("I", fcntl.ioctl(self.fd, termios.FIONREAD, b"\0\0\0\0"))[0]
+
+    def read(self, size):
+        return os.read(self.fd, size)
+
+def feed(fd, numLines):
+    line = b"*0001,05/01/23 12:00:00.050,1013.123456\r\n"
+    chunk = line * 100
+    for i in range(numLines // 100):
+        os.write(fd, chunk)
+    os.close(fd)
+
+def run(name, numLines, consume):
+    readFd, writeFd = os.pipe()
+    feeder = threading.Thread(target=feed, args=(writeFd, numLines))
+    port = PipePort(readFd)
+    start = time.perf_counter()
+    feeder.start()
+    count = consume(port)
+    elapsed = time.perf_counter() - start
+    feeder.join()
+    os.close(readFd)
+    print("  {0:<14} {1:>9} lines in {2:6.3f} s = {3:>10.0f} lines/s".format(name, count, elapsed, count / elapsed))
+
+def consumeReadLine(port):
+    device = ReadLine(port)
+    count = 0
+    while device.readline():
+        count += 1
+    return count
+
+def consumeRingReadLine(port):
+    device = RingReadLine(port)
+    count = 0
+    lines = device.readlines_batch()
+    while lines:
+        count += len(lines)
+        lines = device.readlines_batch()
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the barometer line readers.')
+    parser.add_argument("-l", "--lines", help="number of P4 records to read (default = 1000000)", type=int, default=1000000)
+    args = parser.parse_args()
+
+    print("\nReading " + str(args.lines) + " lines...\n")
+    run("ReadLine", args.lines, consumeReadLine)
+    run("RingReadLine", args.lines, consumeRingReadLine)
+
+if __name__ == '__main__':
+    main()
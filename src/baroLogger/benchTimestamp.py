@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+#
+# benchTimestamp.py - micro-benchmark of P4 timestamp parsing
+#                   - compares datetime.strptime against P4TimestampParser, and
+#                     datetime.utcnow().isoformat() against isoFromNs
+#
+#   usage: ./benchTimestamp.py [-h] [-s SAMPLES]
+#
+
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from p4Timestamp import P4TimestampParser, isoFromNs
+
+def run(name, func, values):
+    start = time.perf_counter()
+    for value in values:
+        func(value)
+    elapsed = time.perf_counter() - start
+    print("  {0:<34} {1:>8.3f} us/call = {2:>10.0f} calls/s".format(name, elapsed / len(values) * 1e6, len(values) / elapsed))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks P4 timestamp parsing.')
+    parser.add_argument("-s", "--samples", help="number of timestamps to parse (default = 200000)", type=int, default=200000)
+    args = parser.parse_args()
+
+    # an hour of 20 Hz samples starting at midnight, repeated as needed
+    timestamps = []
+    for i in range(args.samples):
+        ms = (i * 50) % 3600000
+        timestamps.append("05/01/23 00:{0:02d}:{1:02d}.{2:03d}".format(ms // 60000, ms // 1000 % 60, ms % 1000))
+    hostNs = [time.time_ns() + i * 50000000 for i in range(args.samples)]
+
+    p4Parser = P4TimestampParser()
+
+    print("\nParsing " + str(args.samples) + " barometer timestamps...\n")
+    run("strptime().isoformat()", lambda s: datetime.strptime(s, "%m/%d/%y %H:%M:%S.%f").isoformat(), timestamps)
+    run("P4TimestampParser.isoformat()", p4Parser.isoformat, timestamps)
+    run("P4TimestampParser.epochNs()", p4Parser.epochNs, timestamps)
+
+    print("\nFormatting " + str(args.samples) + " host timestamps...\n")
+    run("utcnow().isoformat()", lambda ns: datetime.utcnow().isoformat(), hostNs)
+    run("isoFromNs(time_ns())", lambda ns: isoFromNs(time.time_ns()), hostNs)
+    run("isoFromNs()", isoFromNs, hostNs)
+
+if __name__ == '__main__':
+    main()
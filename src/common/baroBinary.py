@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+#
+# baroBinary.py - fixed width binary hourly barometer log format
+#               - BinaryLogWriter is an HourlyLogWriter that writes
+#                 PREFIX_YYYYmmdd/PREFIX_YYYYmmdd-HH.bin files instead of CSV
+#                 (baroLogger -f binary)
+#               - loadRecords maps a file as a NumPy structured array with
+#                 np.memmap, without parsing anything
+#               - run as a script it converts .bin files back to the BAROLOG CSV
+#                 the loggers write, e.g. for dataSender, which only uploads CSV
+#
+# every file starts with a HEADER_SIZE byte header, MAGIC followed by a JSON
+# object padded with spaces and a newline:
+#
+#   {"version": 1, "record": "<Hqqd", "hostname": "box1", "sensors": ["150000", "150001"]}
+#
+# and is followed by 26 byte little endian records, one per sample:
+#
+#   uint16   sensor   index into the header's sensors (serial numbers)
+#   int64    sys_ns   host time the sample was read, epoch nanoseconds
+#   int64    ns       barometer timestamp, epoch nanoseconds, NO_TIME if the
+#                     record did not parse
+#   float64  value    pressure, NaN if the record did not parse
+#
+# against about 90 bytes for the same sample as a CSV line
+#
+# a logger restarted within the hour appends to the existing file - serial
+# numbers it has that the header does not are added to the header in place, so
+# the indices already written keep their meaning, and a record torn by a power
+# cut at the end of the file is cut off first
+#
+#   usage: ./baroBinary.py [-h] [-o OUTDIR] FILE [FILE ...]
+#
+
+import os
+import json
+import math
+import struct
+import argparse
+
+from logWriter import HourlyLogWriter, NS_PER_HOUR
+from p4Timestamp import isoFromNs
+
+MAGIC = b"PAROSBIN"
+HEADER_SIZE = 1024
+VERSION = 1
+
+RECORD = struct.Struct("<Hqqd")
+RECORD_SIZE = RECORD.size
+
+NO_TIME = -2**63
+
+# NumPy dtype of a record, see loadRecords
+RECORD_FIELDS = [("sensor", "<u2"), ("sys_ns", "<i8"), ("ns", "<i8"), ("value", "<f8")]
+
+def packHeader(hostname, sensors):
+    text = json.dumps({"version": VERSION, "record": RECORD.format, "hostname": hostname, "sensors": sensors}).encode()
+    if len(MAGIC) + len(text) + 1 > HEADER_SIZE:
+        raise ValueError("too many sensors for the binary log header")
+    return MAGIC + text.ljust(HEADER_SIZE - len(MAGIC) - 1) + b"\n"
+
+# header dict of an open binary log file
+def readHeader(binFile):
+    binFile.seek(0)
+    header = binFile.read(HEADER_SIZE)
+    if len(header) != HEADER_SIZE or not header.startswith(MAGIC):
+        raise ValueError("not a binary barometer log: " + binFile.name)
+    header = json.loads(header[len(MAGIC):])
+    if header["version"] != VERSION or header["record"] != RECORD.format:
+        raise ValueError("unsupported binary barometer log version: " + binFile.name)
+    return header
+
+class BinaryLogWriter(HourlyLogWriter):
+    suffix = ".bin"
+
+    def __init__(self, logDir, prefix, hostname, sensors, **kwargs):
+        HourlyLogWriter.__init__(self, logDir, prefix, **kwargs)
+        self.hostname = hostname
+        self.sensors = list(sensors)
+        # index map of every open file by path, sensor -> index in the file's header
+        self.indexMaps = {}
+
+    # write the header of a new file, or merge our sensors into an existing one
+    def prepareFile(self, logFilePath):
+        with open(logFilePath, "a+b") as binFile:
+            size = binFile.seek(0, os.SEEK_END)
+            if size < HEADER_SIZE:
+                # new, or a header torn by a power cut - nothing to keep
+                binFile.truncate(0)
+                binFile.write(packHeader(self.hostname, self.sensors))
+                return list(range(len(self.sensors)))
+            header = readHeader(binFile)
+            # a record torn by a power cut would shift every record appended
+            # after it, cut the file back to the last whole one
+            torn = (size - HEADER_SIZE) % RECORD_SIZE
+            if torn:
+                binFile.truncate(size - torn)
+        sensors = header["sensors"]
+        missing = [sensor for sensor in self.sensors if sensor not in sensors]
+        if missing:
+            sensors += missing
+            with open(logFilePath, "r+b") as binFile:
+                binFile.write(packHeader(header["hostname"], sensors))
+        return [sensors.index(sensor) for sensor in self.sensors]
+
+    def openHour(self, hour):
+        logDirectoryName, logFilePath = self.hourPath(hour)
+        os.makedirs(logDirectoryName, exist_ok=True)
+        indexMap = self.prepareFile(logFilePath)
+        self.indexMaps = {logFilePath: indexMap, self.logFilePath: self.indexMaps.get(self.logFilePath)}
+        return HourlyLogWriter.openHour(self, hour)
+
+    def join(self, records):
+        return b"".join(records)
+
+    # add a sample of sensor (index into sensors), ns is NO_TIME and value NaN
+    # for records that did not parse
+    def writeSample(self, sensor, sysNs, ns, value):
+        if sysNs // NS_PER_HOUR != self.currentHour:
+            self.rotate(sysNs // NS_PER_HOUR)
+        self.write(sysNs, RECORD.pack(self.indexMaps[self.logFilePath][sensor], sysNs, ns, value), self.sensors[sensor])
+
+#
+# readers
+#
+
+# (header, records) of a binary log file, records a read only NumPy memmap of a
+# structured array with the RECORD_FIELDS fields - a torn last record is left out
+def loadRecords(path):
+    import numpy as np
+
+    with open(path, "rb") as binFile:
+        header = readHeader(binFile)
+        binFile.seek(0, os.SEEK_END)
+        count = (binFile.tell() - HEADER_SIZE) // RECORD_SIZE
+    dtype = np.dtype(RECORD_FIELDS)
+    if count == 0:
+        return header, np.zeros(0, dtype=dtype)
+    return header, np.memmap(path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+# (header, iterator of (sensor, sys_ns, ns, value) tuples) without NumPy
+def iterRecords(binFile, chunkRecords=65536):
+    header = readHeader(binFile)
+
+    def records():
+        while True:
+            data = binFile.read(chunkRecords * RECORD_SIZE)
+            data = data[:len(data) - len(data) % RECORD_SIZE]
+            if not data:
+                return
+            yield from RECORD.iter_unpack(data)
+
+    return header, records()
+
+# BAROLOG CSV lines of a binary log file - pressures are written as the shortest
+# decimal that reads back as the same float, so trailing zeros the barometer sent
+# are gone
+def csvLines(binFile):
+    header, records = iterRecords(binFile)
+    prefixes = [header["hostname"] + "," + sensor + "," for sensor in header["sensors"]]
+    for sensor, sysNs, ns, value in records:
+        if ns == NO_TIME or math.isnan(value):
+            yield prefixes[sensor] + isoFromNs(sysNs) + "Z,ERROR,\n"
+        else:
+            yield prefixes[sensor] + isoFromNs(sysNs) + "Z," + isoFromNs(ns) + "Z," + repr(value) + "\n"
+
+def convert(path, outDir=None):
+    csvPath = path[:-len(".bin")] + ".txt" if path.endswith(".bin") else path + ".txt"
+    if outDir is not None:
+        csvPath = os.path.join(outDir, os.path.basename(csvPath))
+    lines = 0
+    with open(path, "rb") as binFile, open(csvPath + ".tmp", "w") as csvFile:
+        batch = []
+        for line in csvLines(binFile):
+            batch.append(line)
+            if len(batch) >= 65536:
+                csvFile.write("".join(batch))
+                lines += len(batch)
+                batch = []
+        csvFile.write("".join(batch))
+        lines += len(batch)
+    os.replace(csvPath + ".tmp", csvPath)
+    return csvPath, lines
+
+def main():
+    parser = argparse.ArgumentParser(description='Converts binary barometer log files to BAROLOG CSV.')
+    parser.add_argument("files", nargs="+", metavar="FILE", help="binary log files")
+    parser.add_argument("-o", "--outdir", help="directory for the CSV files (default = next to each binary file)")
+    args = parser.parse_args()
+
+    for path in args.files:
+        try:
+            csvPath, lines = convert(path, args.outdir)
+        except (OSError, ValueError) as e:
+            print("  unable to convert " + path + ": " + str(e))
+            continue
+        print("  " + path + " -> " + csvPath + ", " + str(lines) + " lines")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#
+# logCompression.py - compressed hour files, as left by logCompressor
+#
+# a compressed hour file is the hour file's name with the codec suffix appended,
+# PREFIX_YYYYmmdd-HH.txt.gz, next to where the plain file was - while both exist
+# (a compression that was cut short) the plain file is the one to read
+#
+# every compression is recorded in LOGDIR/.compressor.json, keyed by the plain
+# file name, with the inode and size the plain file had - readers use these as
+# the identity of the compressed file, so dataSender's byte offset checkpoints
+# carry over from the plain file to its compressed copy without a resend
+#
+# zstd needs the zstandard package, gzip and xz are in the standard library
+#
+
+import os
+import io
+import gzip
+import json
+import lzma
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODECS = {"gzip": ".gz", "xz": ".xz", "zstd": ".zst"}
+
+MANIFEST_FILE = ".compressor.json"
+
+# (plain file name, codec or None) of a possibly compressed file name
+def splitCodec(name):
+    for codec, suffix in CODECS.items():
+        if name.endswith(suffix):
+            return name[:-len(suffix)], codec
+    return name, None
+
+# path of the plain hour file or, failing that, of a compressed copy of it, None
+# if neither exists
+def findLogFile(plainPath):
+    for path in [plainPath] + [plainPath + suffix for suffix in CODECS.values()]:
+        if os.path.exists(path):
+            return path
+    return None
+
+# decompressing reader around a raw binary file of path
+def decompressedReader(rawFile, path):
+    codec = splitCodec(path)[1]
+    if codec is None:
+        return rawFile
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=rawFile, mode="rb")
+    if codec == "xz":
+        return lzma.LZMAFile(rawFile, mode="rb")
+    if zstandard is None:
+        raise OSError("zstandard is not installed, unable to read " + path)
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(rawFile))
+
+# compressing writer around a raw binary file
+def compressedWriter(rawFile, codec, level=None):
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=rawFile, mode="wb", compresslevel=6 if level is None else level, mtime=0)
+    if codec == "xz":
+        return lzma.LZMAFile(rawFile, mode="wb", preset=level)
+    if zstandard is None:
+        raise OSError("zstandard is not installed, unable to write zstd")
+    return zstandard.ZstdCompressor(level=3 if level is None else level).stream_writer(rawFile, closefd=False)
+
+# open a possibly compressed hour file for binary reading
+def openLog(path):
+    rawFile = open(path, "rb")
+    try:
+        return decompressedReader(rawFile, path)
+    except Exception:
+        rawFile.close()
+        raise
+
+# read count bytes of a possibly compressed hour file open as rawFile, starting
+# offset bytes into its contents - a compressed file is decompressed from its start,
+# what comes before offset is thrown away
+def readRange(rawFile, path, offset, count):
+    if splitCodec(path)[1] is None:
+        rawFile.seek(offset)
+        return rawFile.read(count)
+    logFile = decompressedReader(rawFile, path)
+    while offset > 0:
+        skipped = len(logFile.read(min(offset, 1 << 20)))
+        if not skipped:
+            return b""
+        offset -= skipped
+    return logFile.read(count)
+
+class LogManifest:
+    def __init__(self, logDir):
+        self.path = os.path.join(logDir, MANIFEST_FILE)
+        self.entries = {}
+        try:
+            with open(self.path, "r") as manifestFile:
+                self.entries = json.load(manifestFile)
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            print("Ignoring unreadable compression manifest " + self.path)
+
+    def entry(self, name):
+        return self.entries.get(name)
+
+    def record(self, name, entry):
+        self.entries[name] = entry
+        self.save()
+
+    # drop entries for which keep(name, entry) is false
+    def prune(self, keep):
+        stale = [name for name, entry in self.entries.items() if not keep(name, entry)]
+        for name in stale:
+            del self.entries[name]
+        if stale:
+            self.save()
+
+    # write to a temporary file + fsync + rename, as the checkpoints
+    def save(self):
+        tmpPath = self.path + ".tmp"
+        with open(tmpPath, "w") as manifestFile:
+            json.dump(self.entries, manifestFile, indent=1)
+            manifestFile.flush()
+            os.fsync(manifestFile.fileno())
+        os.replace(tmpPath, self.path)
+
+# uncompressed sizes of compressed files without a manifest entry, by
+# (path, inode, size, mtime)
+uncompressedSizes = {}
+
+#
+# (inode, size) identifying the contents of a possibly compressed hour file at
+# path with os.stat result stat - the plain file's for a compressed one, from the
+# manifest, or the compressed file's inode and its uncompressed size if the
+# manifest does not know it (found by decompressing it once)
+#
+def logIdentity(path, stat):
+    plainName, codec = splitCodec(os.path.basename(path))
+    if codec is None:
+        return stat.st_ino, stat.st_size
+    entry = LogManifest(os.path.dirname(os.path.dirname(path))).entry(plainName)
+    if entry is not None and entry["file"] == os.path.basename(path) and entry["compressedSize"] == stat.st_size:
+        return entry["inode"], entry["size"]
+    key = (path, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    if key not in uncompressedSizes:
+        size = 0
+        with openLog(path) as logFile:
+            for block in iter(lambda: logFile.read(1 << 20), b""):
+                size += len(block)
+        uncompressedSizes[key] = size
+    return stat.st_ino, uncompressedSizes[key]
@@ -0,0 +1,116 @@
+#
+# logTables.py - log records as typed Arrow tables, for logCompactor and logExtractor
+#
+# the columns are the loggers' CSV columns with types - timestamps as UTC
+# nanosecond timestamps, values as float64, adc as int64 - and hostname and
+# sensor_id dictionary encoded
+#
+# CSV is parsed by pyarrow a block at a time, every field as text first - rows
+# with the wrong number of fields or a field that does not look like its type
+# (logger ERROR lines, torn writes) are left out, as dataSender does - a block
+# whose every field converts is taken as it is, only a block with a line that
+# does not is checked field by field
+#
+# the time of a record is the column its logger files it under, TIME_COLUMNS
+#
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.compute as pc
+
+TIMESTAMP = pa.timestamp("ns", tz="UTC")
+DICTIONARY = pa.dictionary(pa.int32(), pa.string())
+
+# column names and types of the log files, as the loggers write them
+SCHEMAS = {
+    "BAROLOG": pa.schema([("hostname", DICTIONARY), ("sensor_id", DICTIONARY), ("sys_timestamp", TIMESTAMP),
+                          ("timestamp", TIMESTAMP), ("value", pa.float64())]),
+    "WINDLOG": pa.schema([("hostname", DICTIONARY), ("sensor_id", DICTIONARY), ("timestamp", TIMESTAMP),
+                          ("adc", pa.int64()), ("voltage", pa.float64()), ("value", pa.float64())]),
+}
+
+TIME_COLUMNS = {"BAROLOG": "sys_timestamp", "WINDLOG": "timestamp"}
+
+# what a CSV field has to look like to be converted to its column type
+PATTERNS = {
+    TIMESTAMP: r"^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(\.\d{1,9})?Z$",
+    pa.float64(): r"^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$",
+    pa.int64(): r"^[-+]?\d+$",
+}
+
+# typed table of a table of CSV text columns whose rows all parse, None if one
+# does not - about three times faster than matching every field first
+def castTable(table, schema):
+    columns = []
+    try:
+        for field in schema:
+            if field.type == DICTIONARY:
+                columns.append(pc.dictionary_encode(table[field.name]))
+                continue
+            column = pc.cast(table[field.name], field.type)
+            # the cast takes nan and inf, the loggers never write them
+            if field.type == pa.float64() and not pc.all(pc.is_finite(column)).as_py():
+                return None
+            columns.append(column)
+    except pa.ArrowInvalid:
+        return None
+    return pa.Table.from_arrays(columns, schema=schema)
+
+# typed table of a table of CSV text columns, leaving out rows that do not parse
+# - with keepLines it has a "line" column more, the CSV line of each row as it
+# was read, for writing CSV records back out unchanged
+def typedTable(table, schema, keepLines=False):
+    if keepLines:
+        table = table.append_column("line", pc.binary_join_element_wise(*[table[name] for name in schema.names], ","))
+    typed = castTable(table, schema)
+    if typed is None:
+        valid = None
+        for field in schema:
+            if field.type in PATTERNS:
+                match = pc.match_substring_regex(table[field.name], PATTERNS[field.type])
+                valid = match if valid is None else pc.and_(valid, match)
+        table = table.filter(pc.fill_null(valid, False))
+
+        columns = []
+        for field in schema:
+            if field.type == DICTIONARY:
+                columns.append(pc.dictionary_encode(table[field.name]))
+            else:
+                columns.append(pc.cast(table[field.name], field.type))
+        typed = pa.Table.from_arrays(columns, schema=schema)
+    if keepLines:
+        typed = typed.append_column("line", table["line"])
+    return typed
+
+# typed tables of a block of CSV lines, blockSize bytes of it at a time
+def csvTables(data, schema, blockSize=1 << 22, keepLines=False):
+    if not data:
+        return
+    reader = pacsv.open_csv(pa.BufferReader(data),
+                            read_options=pacsv.ReadOptions(column_names=schema.names, block_size=blockSize),
+                            parse_options=pacsv.ParseOptions(invalid_row_handler=lambda row: "skip"),
+                            convert_options=pacsv.ConvertOptions(column_types={name: pa.string() for name in schema.names}))
+    for batch in reader:
+        yield typedTable(pa.Table.from_batches([batch]), schema, keepLines)
+
+# typed table of a block of CSV lines
+def csvTable(data, schema):
+    tables = list(csvTables(data, schema))
+    if not tables:
+        return schema.empty_table()
+    return pa.concat_tables(tables).unify_dictionaries()
+
+# typed BAROLOG table of binary records (see baroBinary) of a file with header,
+# records that did not parse must already be left out
+def binaryTable(header, records, schema):
+    sensors = pa.DictionaryArray.from_arrays(pa.array(records["sensor"].astype("int32")), pa.array(header["sensors"]))
+    hostnames = pa.DictionaryArray.from_arrays(pa.array([0] * len(records), pa.int32()), pa.array([header["hostname"]]))
+    return pa.Table.from_arrays([hostnames, sensors,
+                                 pa.array(records["sys_ns"]).cast(TIMESTAMP),
+                                 pa.array(records["ns"]).cast(TIMESTAMP),
+                                 pa.array(records["value"])], schema=schema)
+
+# the table with dictionary columns decoded, for comparing tables whose
+# dictionaries may differ
+def decoded(table):
+    return table.cast(pa.schema([pa.field(field.name, pa.string() if field.type == DICTIONARY else field.type) for field in table.schema]))
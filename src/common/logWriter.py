@@ -0,0 +1,318 @@
+#
+# logWriter.py - batched hourly log file writer shared by the loggers
+#
+# records are accumulated in memory and written to the current hourly log file
+# with a single write once flushBytes have built up or flushInterval seconds have
+# passed since the last write, instead of one small write per sample - each log
+# file is LOGDIR/PREFIX_YYYYmmdd/PREFIX_YYYYmmdd-HH.txt, chosen by the epoch
+# nanosecond timestamp passed with each record
+#
+# how often the data is forced out to the SD card is set by the fsync policy:
+#
+# - none:     never fsync, leave it to the kernel (cheapest, most data lost on power cut)
+# - interval: fsync at most every fsyncInterval seconds, and on rotation
+# - rotate:   fsync only when an hour file is closed
+#
+# flush and fsync latencies are tracked and reported each time a file is closed
+#
+# with precreate set, every rotation starts a background thread that creates the
+# next hour's directory and opens its file ahead of time, and the finished file is
+# fsynced and closed in the background, so the rotation itself only swaps file
+# handles and never stalls a synchronous acquisition loop on mkdir/open/fsync -
+# the side effect is an empty file for the next hour if the logger is stopped
+# before that hour starts
+#
+# with indexInterval set, every hour file gets a sidecar time index (see
+# timeIndex.py) kept up to date as records are written and saved on every fsync
+# and when the file is closed - a file that already has records when it is opened
+# (a restarted logger) has its index loaded, or built if it is missing or stale
+#
+# subclasses can change the file suffix, how buffered records are joined into
+# bytes and what happens when an hour file is opened, see baroBinary.py
+#
+
+import os
+import time
+import threading
+from datetime import datetime
+
+from timeIndex import TimeIndex, buildIndex, indexPath
+
+NS_PER_HOUR = 3600 * 1000000000
+
+FSYNC_POLICIES = ["none", "interval", "rotate"]
+
+# flush and fsync counters and latencies of one hour file
+class WriteStats:
+    def __init__(self):
+        self.records = 0
+        self.flushes = 0
+        self.bytesWritten = 0
+        self.flushTime = 0.0
+        self.maxFlushTime = 0.0
+        self.fsyncs = 0
+        self.fsyncTime = 0.0
+        self.maxFsyncTime = 0.0
+
+    def addFlush(self, size, elapsed):
+        self.flushes += 1
+        self.bytesWritten += size
+        self.flushTime += elapsed
+        self.maxFlushTime = max(self.maxFlushTime, elapsed)
+
+    def addFsync(self, elapsed):
+        self.fsyncs += 1
+        self.fsyncTime += elapsed
+        self.maxFsyncTime = max(self.maxFsyncTime, elapsed)
+
+    def __str__(self):
+        meanFlush = self.flushTime / self.flushes if self.flushes else 0.0
+        meanFsync = self.fsyncTime / self.fsyncs if self.fsyncs else 0.0
+        return "{0} records, {1} bytes in {2} writes (mean {3:.2f} ms, max {4:.2f} ms), {5} fsyncs (mean {6:.2f} ms, max {7:.2f} ms)".format(
+            self.records, self.bytesWritten, self.flushes, meanFlush * 1000, self.maxFlushTime * 1000,
+            self.fsyncs, meanFsync * 1000, self.maxFsyncTime * 1000)
+
+class HourlyLogWriter:
+    suffix = ".txt"
+
+    def __init__(self, logDir, prefix, flushBytes=65536, flushInterval=1.0, fsyncPolicy="rotate", fsyncInterval=60.0, precreate=False, indexInterval=0):
+        if fsyncPolicy not in FSYNC_POLICIES:
+            raise ValueError("unknown fsync policy: " + fsyncPolicy)
+        self.logDir = logDir
+        self.prefix = prefix
+        self.flushBytes = flushBytes
+        self.flushInterval = flushInterval
+        self.fsyncPolicy = fsyncPolicy
+        self.fsyncInterval = fsyncInterval
+        self.precreate = precreate
+        self.indexInterval = indexInterval
+
+        self.buffer = []
+        self.bufferBytes = 0
+        self.logFile = None
+        self.logFilePath = None
+        self.currentHour = None
+        self.fileOffset = 0
+        self.index = None
+        self.lastFlushTime = time.monotonic()
+        self.lastFsyncTime = self.lastFlushTime
+        self.unsynced = False
+        self.preparedLock = threading.Lock()
+        self.prepared = None
+        self.prepareThread = None
+        self.resetStats()
+
+    def resetStats(self):
+        self.fileStats = WriteStats()
+
+    def hourPath(self, hour):
+        hourTime = datetime.utcfromtimestamp(hour * 3600)
+        logDirectoryName = os.path.join(self.logDir, self.prefix + "_{0:%Y%m%d}".format(hourTime))
+        logFileName = self.prefix + "_{0:%Y%m%d-%H}".format(hourTime) + self.suffix
+        return logDirectoryName, os.path.join(logDirectoryName, logFileName)
+
+    # bytes written for a list of buffered records
+    def join(self, records):
+        return "".join(records).encode()
+
+    # add a record (a complete line including the newline) stamped at ns, of
+    # sensor for the time index
+    def write(self, ns, record, sensor=None):
+        if ns // NS_PER_HOUR != self.currentHour:
+            self.rotate(ns // NS_PER_HOUR)
+        size = len(record) if isinstance(record, bytes) or record.isascii() else len(record.encode())
+        if self.index is not None:
+            self.index.add(ns, sensor, self.fileOffset + self.bufferBytes, size)
+        self.buffer.append(record)
+        self.bufferBytes += size
+        self.fileStats.records += 1
+        if self.bufferBytes >= self.flushBytes:
+            self.flush()
+
+    # time based flushing, call regularly from the acquisition loop
+    def poll(self):
+        now = time.monotonic()
+        if self.buffer and now - self.lastFlushTime >= self.flushInterval:
+            self.flush()
+        if self.fsyncPolicy == "interval" and self.unsynced and now - self.lastFsyncTime >= self.fsyncInterval:
+            self.fsync()
+
+    def flush(self):
+        self.lastFlushTime = time.monotonic()
+        if not self.buffer:
+            return
+        data = self.join(self.buffer)
+        self.buffer = []
+        self.bufferBytes = 0
+        start = time.perf_counter()
+        self.writeAll(data)
+        self.fileStats.addFlush(len(data), time.perf_counter() - start)
+        self.unsynced = True
+
+    # a raw write may write less than it was given (a nearly full card, a signal),
+    # the rest is written until all of it is in or the write fails - fileOffset
+    # always follows what actually is in the file
+    def writeAll(self, data):
+        view = memoryview(data)
+        while view:
+            written = self.logFile.write(view)
+            if not written:
+                raise OSError("unable to write to " + self.logFilePath + ", " + str(len(view)) + " bytes not written")
+            self.fileOffset += written
+            view = view[written:]
+
+    def fsync(self):
+        self.lastFsyncTime = time.monotonic()
+        if not self.unsynced:
+            return
+        start = time.perf_counter()
+        os.fsync(self.logFile.fileno())
+        self.fileStats.addFsync(time.perf_counter() - start)
+        self.saveIndex()
+        self.unsynced = False
+
+    # open (creating if needed) the log file for an hour
+    def openHour(self, hour):
+        logDirectoryName, logFilePath = self.hourPath(hour)
+        os.makedirs(logDirectoryName, exist_ok=True)
+        # unbuffered, every flush goes straight to the file, see writeAll
+        return logFilePath, open(logFilePath, "ab", buffering=0)
+
+    # runs in the background, open the next hour's file ahead of time
+    def prepareHour(self, hour):
+        try:
+            prepared = (hour,) + self.openHour(hour)
+        except OSError as e:
+            print("  unable to pre-create log file for next hour: " + str(e) + "\n")
+            return
+        with self.preparedLock:
+            stale = self.prepared
+            self.prepared = prepared
+        if stale is not None:
+            stale[2].close()
+
+    def takePrepared(self, hour):
+        with self.preparedLock:
+            prepared = self.prepared
+            self.prepared = None
+        if prepared is None:
+            return None
+        if prepared[0] != hour:
+            prepared[2].close()
+            return None
+        return prepared[1], prepared[2]
+
+    def rotate(self, hour):
+        self.closeFile(background=self.precreate)
+        self.currentHour = hour
+        opened = self.takePrepared(hour)
+        if opened is None:
+            opened = self.openHour(hour)
+        self.logFilePath, self.logFile = opened
+        self.fileOffset = os.fstat(self.logFile.fileno()).st_size
+        self.index = self.openIndex(hour)
+        print("  opening log file: " + self.logFilePath + "\n")
+        if self.precreate:
+            self.prepareThread = threading.Thread(target=self.prepareHour, args=(hour + 1,), daemon=True)
+            self.prepareThread.start()
+
+    # time index of the file just opened, None without indexing
+    def openIndex(self, hour):
+        if not self.indexInterval:
+            return None
+        if self.fileOffset > 0:
+            try:
+                index = TimeIndex.load(indexPath(self.logFilePath))
+                if index.bytes == self.fileOffset and index.interval == self.indexInterval:
+                    return index
+            except (OSError, ValueError, KeyError):
+                pass
+            try:
+                return buildIndex(self.logFilePath, self.indexInterval)
+            except (OSError, ValueError) as e:
+                print("  unable to index existing log file, starting a new index: " + str(e) + "\n")
+        return TimeIndex(hour, self.indexInterval)
+
+    def saveIndex(self):
+        if self.index is None:
+            return
+        try:
+            self.index.save(indexPath(self.logFilePath))
+        except OSError as e:
+            print("  unable to save time index: " + str(e) + "\n")
+
+    # runs in the background, fsync (depending on policy) and close a finished
+    # file, then report it with its last fsync counted in fileStats
+    def finishFile(self, logFile, logFilePath, fileStats):
+        if self.fsyncPolicy != "none":
+            start = time.perf_counter()
+            os.fsync(logFile.fileno())
+            fileStats.addFsync(time.perf_counter() - start)
+        logFile.close()
+        print("  closed log file: " + logFilePath + ", " + str(fileStats) + "\n")
+
+    def closeFile(self, background=False):
+        if self.logFile is None:
+            return
+        self.flush()
+        self.saveIndex()
+        self.index = None
+        if background:
+            # the last fsync of the hour is left to the background too, the next
+            # file's stats start from zero right away
+            threading.Thread(target=self.finishFile, args=(self.logFile, self.logFilePath, self.fileStats)).start()
+        else:
+            if self.fsyncPolicy != "none":
+                self.fsync()
+            self.logFile.close()
+            print("  closed log file: " + self.logFilePath + ", " + self.stats() + "\n")
+        self.logFile = None
+        self.resetStats()
+
+    def close(self):
+        self.closeFile()
+        # a pre-created file still being opened lands before it is dropped
+        if self.prepareThread is not None:
+            self.prepareThread.join()
+        # drops a pre-created file that was never used
+        self.takePrepared(None)
+
+    def stats(self):
+        return str(self.fileStats)
+
+#
+# command line options shared by the loggers
+#
+
+def addWriterArguments(parser):
+    parser.add_argument("--flushbytes",
+                        type=int,
+                        default=65536,
+                        help="write buffered records to the log file once this many bytes have built up (default = 65536)")
+    parser.add_argument("--flushinterval",
+                        type=float,
+                        default=1.0,
+                        help="maximum seconds records are buffered before being written to the log file (default = 1)")
+    parser.add_argument("--fsync",
+                        choices=FSYNC_POLICIES,
+                        default="rotate",
+                        help="when to fsync log files: never, every --fsyncinterval seconds or when an hour file is closed (default = rotate)")
+    parser.add_argument("--fsyncinterval",
+                        type=float,
+                        default=60.0,
+                        help="seconds between fsyncs with --fsync interval (default = 60)")
+    parser.add_argument("--indexinterval",
+                        type=int,
+                        default=10,
+                        help="seconds per entry of the sidecar time index of each log file, 0 for no index (default = 10)")
+
+# writerClass and any extra keyword arguments select and set up a subclass
+def writerFromArgs(args, logDir, prefix, precreate=False, writerClass=HourlyLogWriter, **kwargs):
+    return writerClass(logDir, prefix,
+                       flushBytes=args.flushbytes,
+                       flushInterval=args.flushinterval,
+                       fsyncPolicy=args.fsync,
+                       fsyncInterval=args.fsyncinterval,
+                       precreate=precreate,
+                       indexInterval=args.indexinterval,
+                       **kwargs)
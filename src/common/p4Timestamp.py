@@ -0,0 +1,102 @@
+#
+# p4Timestamp.py - fast timestamp handling for barometer P4 records
+#
+# the barometers are configured (TJ=0, GT=1, GD=0) to stamp every P4 record with a
+# fixed layout MM/dd/yy HH:MM:SS.fff timestamp - datetime.strptime is by far the
+# most expensive call made per sample, so instead the fields are sliced out of the
+# fixed layout directly and the date portion, which only changes once a day, is
+# parsed once and cached
+#
+# isoformat() returns the same string as datetime.strptime(...).isoformat() and
+# epochNs() returns integer nanoseconds since the unix epoch (UTC) - both raise
+# ValueError on anything that does not match the layout, like strptime does
+#
+# isoFromNs() does the same per-second caching for the host timestamps (and the
+# records of binary logs, see baroBinary.py) and matches
+# datetime.utcfromtimestamp(...).isoformat() at microsecond resolution
+#
+
+import time
+from datetime import date
+
+NS_PER_SECOND = 1000000000
+NS_PER_DAY = 86400 * NS_PER_SECOND
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# int of a field of ASCII digits only - int() alone also takes whitespace, signs
+# and underscores, which strptime does not
+def fieldValue(field, text):
+    if not (field.isascii() and field.isdigit()):
+        raise ValueError("bad P4 timestamp: " + text)
+    return int(field)
+
+class P4TimestampParser:
+    def __init__(self):
+        self.datePart = None
+        self.isoDate = None
+        self.dayNs = 0
+
+    # parse and cache the MM/dd/yy portion
+    def parseDate(self, datePart):
+        if datePart[2] != "/" or datePart[5] != "/":
+            raise ValueError("bad P4 date: " + datePart)
+        # same two digit year pivot as strptime %y
+        year = fieldValue(datePart[6:8], datePart)
+        year += 2000 if year < 69 else 1900
+        dateValue = date(year, fieldValue(datePart[0:2], datePart), fieldValue(datePart[3:5], datePart))
+        self.datePart = datePart
+        self.isoDate = dateValue.isoformat()
+        self.dayNs = (dateValue.toordinal() - EPOCH_ORDINAL) * NS_PER_DAY
+
+    # split a timestamp into its time of day fields, fraction as 6 digit string
+    def split(self, timestamp):
+        if len(timestamp) < 19:
+            raise ValueError("bad P4 timestamp: " + timestamp)
+        if timestamp[0:8] != self.datePart:
+            self.parseDate(timestamp[0:8])
+        if timestamp[8] != " " or timestamp[11] != ":" or timestamp[14] != ":" or timestamp[17] != ".":
+            raise ValueError("bad P4 timestamp: " + timestamp)
+        fraction = timestamp[18:]
+        if not 0 < len(fraction) <= 6:
+            raise ValueError("bad P4 timestamp: " + timestamp)
+        fieldValue(fraction, timestamp)
+        hour = fieldValue(timestamp[9:11], timestamp)
+        minute = fieldValue(timestamp[12:14], timestamp)
+        second = fieldValue(timestamp[15:17], timestamp)
+        if hour > 23 or minute > 59 or second > 59:
+            raise ValueError("bad P4 timestamp: " + timestamp)
+        return hour, minute, second, fraction.ljust(6, "0")
+
+    def isoformat(self, timestamp):
+        hour, minute, second, fraction = self.split(timestamp)
+        isoTime = self.isoDate + "T" + timestamp[9:17]
+        if fraction != "000000":
+            isoTime += "." + fraction
+        return isoTime
+
+    def epochNs(self, timestamp):
+        hour, minute, second, fraction = self.split(timestamp)
+        seconds = hour * 3600 + minute * 60 + second
+        return self.dayNs + seconds * NS_PER_SECOND + int(fraction) * 1000
+
+#
+# ISO formatting of epoch nanoseconds, the seconds portion is cached - by second,
+# so host and barometer times that straddle a second boundary (baroBinary
+# converting records) do not evict each other
+#
+
+_isoCache = {}
+
+def isoFromNs(ns):
+    second = ns // NS_PER_SECOND
+    isoPrefix = _isoCache.get(second)
+    if isoPrefix is None:
+        if len(_isoCache) > 4096:
+            _isoCache.clear()
+        isoPrefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+        _isoCache[second] = isoPrefix
+    micro = (ns // 1000) % 1000000
+    if micro:
+        return isoPrefix + "." + str(micro).zfill(6)
+    return isoPrefix
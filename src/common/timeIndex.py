@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+#
+# timeIndex.py - sidecar time index of an hour file
+#              - PREFIX_YYYYmmdd-HH.txt.idx (.bin.idx) next to the hour file maps
+#                every INTERVAL seconds of the hour, overall and per sensor, to
+#                the byte offset of the first record at or after the start of
+#                that interval, with first/last timestamps and record counts
+#              - kept up to date by HourlyLogWriter as it writes (saved on every
+#                fsync and when the file is closed), or built afterwards by
+#                running this as a script on hour files or whole log directories
+#              - the time of a record is the one the writer files it under, the
+#                third CSV column (sys_timestamp for BAROLOG, timestamp for
+#                WINDLOG) or sys_ns of a binary record, the sensor the second
+#                CSV column or the serial number of the binary record's sensor
+#              - offsets are into the contents of the hour file, so the index of
+#                a plain file is still right once logCompressor has compressed it
+#                (but reading up to an offset in a compressed file means
+#                decompressing up to it)
+#
+# records are filed in the order they were written, which is time order up to
+# the small reordering of several barometers sharing a queue - byteRange adds one
+# interval of slack at the end of a range for that, a host clock stepped back by
+# more than an interval can still put records where the index does not expect
+#
+#   usage: ./timeIndex.py [-h] [-i INTERVAL] [-f] PATH [PATH ...]
+#
+
+import os
+import json
+import argparse
+import calendar
+
+from logCompression import openLog, splitCodec
+
+NS_PER_SECOND = 1000000000
+NS_PER_HOUR = 3600 * NS_PER_SECOND
+
+INDEX_SUFFIX = ".idx"
+VERSION = 1
+
+# index file of a plain or compressed hour file
+def indexPath(hourPath):
+    return splitCodec(hourPath)[0] + INDEX_SUFFIX
+
+#
+# first record offset per interval, count and first/last time of a set of records
+#
+class IndexBlocks:
+    def __init__(self, blockCount):
+        self.blocks = [None] * blockCount
+        self.count = 0
+        self.first = None
+        self.last = None
+
+    def add(self, block, ns, offset):
+        if 0 <= block < len(self.blocks) and self.blocks[block] is None:
+            self.blocks[block] = offset
+        self.count += 1
+        if self.first is None or ns < self.first:
+            self.first = ns
+        if self.last is None or ns > self.last:
+            self.last = ns
+
+    def toDict(self):
+        return {"count": self.count, "first": self.first, "last": self.last, "blocks": self.blocks}
+
+    @classmethod
+    def fromDict(cls, data):
+        blocks = cls(len(data["blocks"]))
+        blocks.blocks = data["blocks"]
+        blocks.count = data["count"]
+        blocks.first = data["first"]
+        blocks.last = data["last"]
+        return blocks
+
+    # offset of the first record of the first interval from block on that has
+    # one, None if none has
+    def offsetFrom(self, block):
+        for offset in self.blocks[max(block, 0):]:
+            if offset is not None:
+                return offset
+        return None
+
+class TimeIndex:
+    def __init__(self, hour, interval=10):
+        if 3600 % interval:
+            raise ValueError("index interval must divide an hour: " + str(interval))
+        self.hour = hour
+        self.interval = interval
+        self.intervalNs = interval * NS_PER_SECOND
+        self.startNs = hour * NS_PER_HOUR
+        self.bytes = 0
+        self.all = IndexBlocks(3600 // interval)
+        self.sensors = {}
+
+    # a record of sensor at time ns, offset bytes into the file and size bytes long
+    def add(self, ns, sensor, offset, size):
+        block = (ns - self.startNs) // self.intervalNs
+        self.all.add(block, ns, offset)
+        blocks = self.sensors.get(sensor)
+        if blocks is None:
+            blocks = self.sensors[sensor] = IndexBlocks(len(self.all.blocks))
+        blocks.add(block, ns, offset)
+        self.bytes = max(self.bytes, offset + size)
+
+    #
+    # (begin, stop) byte offsets that hold every record of sensor (of any sensor
+    # if None) from startNs up to endNs, stop None for the end of the file -
+    # records past the indexed bytes (still being written when the index was
+    # saved) are always in range, so a reader filters by time as it goes
+    #
+    def byteRange(self, startNs, endNs, sensor=None):
+        blocks = self.all if sensor is None else self.sensors.get(sensor)
+        if blocks is None or blocks.count == 0 or blocks.last < startNs or blocks.first >= endNs:
+            return self.bytes, None
+        begin = blocks.offsetFrom((startNs - self.startNs) // self.intervalNs)
+        if begin is None:
+            return self.bytes, None
+        # one interval of slack for records filed out of order
+        stop = self.all.offsetFrom((endNs - self.startNs) // self.intervalNs + 2)
+        return begin, stop
+
+    def toDict(self):
+        return {"version": VERSION, "hour": self.hour, "interval": self.interval, "bytes": self.bytes,
+                "all": self.all.toDict(), "sensors": {sensor: blocks.toDict() for sensor, blocks in self.sensors.items()}}
+
+    @classmethod
+    def fromDict(cls, data):
+        if data.get("version") != VERSION:
+            raise ValueError("unsupported time index version")
+        index = cls(data["hour"], data["interval"])
+        index.bytes = data["bytes"]
+        index.all = IndexBlocks.fromDict(data["all"])
+        index.sensors = {sensor: IndexBlocks.fromDict(blocks) for sensor, blocks in data["sensors"].items()}
+        return index
+
+    # write to a temporary file + rename, a lost index can always be rebuilt
+    def save(self, path):
+        tmpPath = path + ".tmp"
+        with open(tmpPath, "w") as indexFile:
+            json.dump(self.toDict(), indexFile, separators=(",", ":"))
+        os.replace(tmpPath, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as indexFile:
+            return cls.fromDict(json.load(indexFile))
+
+#
+# building an index from an existing hour file
+#
+
+# epoch nanoseconds of the loggers' ISO UTC timestamps, whole seconds cached
+class IsoParser:
+    def __init__(self):
+        self.secondCache = {}
+
+    def epochNs(self, timestamp):
+        ns = self.secondCache.get(timestamp[:19])
+        if ns is None:
+            if len(timestamp) < 19 or timestamp[4] != "-" or timestamp[10] != "T":
+                raise ValueError("bad timestamp: " + timestamp)
+            ns = calendar.timegm((int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]),
+                                  int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19]))) * NS_PER_SECOND
+            if len(self.secondCache) > 65536:
+                self.secondCache.clear()
+            self.secondCache[timestamp[:19]] = ns
+        fraction = timestamp[20:].rstrip("Z")
+        if fraction:
+            ns += int(fraction.ljust(9, "0")[:9])
+        return ns
+
+def hourOfPath(path):
+    name = os.path.basename(splitCodec(path)[0])
+    stem = name[:name.rindex(".")]
+    return calendar.timegm((int(stem[-11:-7]), int(stem[-7:-5]), int(stem[-5:-3]), int(stem[-2:]), 0, 0)) // 3600
+
+def buildIndex(path, interval=10):
+    index = TimeIndex(hourOfPath(path), interval)
+    if splitCodec(path)[0].endswith(".bin"):
+        # imported here, baroBinary builds on logWriter which builds on this
+        from baroBinary import iterRecords, HEADER_SIZE, RECORD_SIZE
+        with open(path, "rb") as binFile:
+            header, records = iterRecords(binFile)
+            sensors = header["sensors"]
+            offset = HEADER_SIZE
+            for sensor, sysNs, ns, value in records:
+                index.add(sysNs, sensors[sensor], offset, RECORD_SIZE)
+                offset += RECORD_SIZE
+        return index
+
+    parser = IsoParser()
+    offset = 0
+    with openLog(path) as logFile:
+        for line in logFile:
+            if line.endswith(b"\n"):
+                fields = line.split(b",", 3)
+                try:
+                    index.add(parser.epochNs(fields[2].decode("ascii")), fields[1].decode("ascii", "replace"), offset, len(line))
+                except (IndexError, ValueError):
+                    # logger ERROR lines and garbage are not indexed
+                    pass
+            offset += len(line)
+    return index
+
+# hour files under path (an hour file or a log directory), plain, compressed or binary
+def findHourFiles(path):
+    if not os.path.isdir(path):
+        return [path]
+    hourFiles = []
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            plainName = splitCodec(name)[0]
+            if plainName.endswith(".txt") or (plainName.endswith(".bin") and plainName == name):
+                if plainName[:plainName.rindex(".")][-3:-2] == "-":
+                    hourFiles.append(os.path.join(root, name))
+    hourFiles.sort()
+    return hourFiles
+
+# true if the index of an hour file exists and covers all of it - a compressed
+# file is not decompressed to find out, any index of it counts
+def isCurrent(hourPath):
+    try:
+        index = TimeIndex.load(indexPath(hourPath))
+    except (OSError, ValueError, KeyError):
+        return False
+    return splitCodec(hourPath)[1] is not None or index.bytes >= os.path.getsize(hourPath)
+
+def main():
+    parser = argparse.ArgumentParser(description='Builds the sidecar time indexes of hourly log files.')
+    parser.add_argument("paths", nargs="+", metavar="PATH", help="hour files or log directories")
+    parser.add_argument("-i", "--interval", help="seconds per index interval, must divide an hour (default = 10)", type=int, default=10)
+    parser.add_argument("-f", "--force", help="rebuild indexes that already exist", action="store_true")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        for hourPath in findHourFiles(path):
+            if not args.force and isCurrent(hourPath):
+                continue
+            try:
+                index = buildIndex(hourPath, args.interval)
+                index.save(indexPath(hourPath))
+            except (OSError, ValueError) as e:
+                print("  unable to index " + hourPath + ": " + str(e))
+                continue
+            print("  " + indexPath(hourPath) + ": " + str(index.all.count) + " records of " + str(len(index.sensors)) + " sensor(s)")
+
+if __name__ == '__main__':
+    main()
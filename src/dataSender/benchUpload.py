@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+#
+# benchUpload.py - end to end benchmark of dataSender against influxStub
+#                - writes synthetic BAROLOG/WINDLOG hours in the loggers' format
+#                  to a temporary log tree, runs dataSender.py --backfill on it
+#                  as a child process against a local InfluxDB stand-in and
+#                  reports points/second, the child's peak RSS, the retries
+#                  caused by injected errors and the bytes that went over HTTP
+#                - arguments after -- are passed on to dataSender, e.g.
+#                  -- --gzip --batchsize 10000 --workers 4
+#
+#   usage: ./benchUpload.py [-h] [-H HOURS] [-b BAROS] [-r RATE] [-a ANEMS]
+#                           [-l LATENCY] [-e ERRORRATE] [-k] [-- SENDER ARGS]
+#
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import resource
+import subprocess
+from datetime import datetime, timedelta
+
+from influxStub import InfluxStub
+
+WIND_RATE = 20  # windLogger samples per second
+
+#
+# write hours hours of logs starting at start into logDir, returns the number of
+# lines written
+#
+def writeHours(logDir, start, hours, baros, rate, anems):
+    lines = 0
+    for hour in range(hours):
+        hourTime = start + timedelta(hours=hour)
+        for prefix in ["BAROLOG", "WINDLOG"]:
+            dayDir = os.path.join(logDir, prefix, prefix + "_" + hourTime.strftime("%Y%m%d"))
+            os.makedirs(dayDir, exist_ok=True)
+            with open(os.path.join(dayDir, prefix + "_" + hourTime.strftime("%Y%m%d-%H") + ".txt"), "w") as logFile:
+                if prefix == "BAROLOG":
+                    lines += writeBaroHour(logFile, hourTime, baros, rate)
+                else:
+                    lines += writeWindHour(logFile, hourTime, anems)
+    return lines
+
+def writeBaroHour(logFile, hourTime, baros, rate):
+    rows = []
+    for sample in range(3600 * rate):
+        isoTime = (hourTime + timedelta(microseconds=sample * 1000000 // rate)).strftime("%Y-%m-%dT%H:%M:%S.%f")
+        for baro in range(baros):
+            rows.append("benchhost," + str(150000 + baro) + "," + isoTime + "Z," + isoTime + "Z," + "{0:.4f}".format(1013.25 + (sample % 1000) * 0.0001) + "\n")
+        if len(rows) >= 100000:
+            logFile.write("".join(rows))
+            rows = []
+    logFile.write("".join(rows))
+    return 3600 * rate * baros
+
+def writeWindHour(logFile, hourTime, anems):
+    rows = []
+    for sample in range(3600 * WIND_RATE):
+        isoTime = (hourTime + timedelta(microseconds=sample * 1000000 // WIND_RATE)).strftime("%Y-%m-%dT%H:%M:%S.%f")
+        for anem in range(anems):
+            sensor_id = "anemometer" if anems == 1 else "anemometer" + str(anem)
+            rows.append("benchhost," + sensor_id + "," + isoTime + "Z," + str(300000000 + sample) + ",0.7095," + "6.075\n")
+    logFile.write("".join(rows))
+    return 3600 * WIND_RATE * anems
+
+def main():
+    argv = sys.argv[1:]
+    senderArgs = []
+    if "--" in argv:
+        senderArgs = argv[argv.index("--") + 1:]
+        argv = argv[:argv.index("--")]
+
+    parser = argparse.ArgumentParser(description='Benchmarks dataSender uploads against a local InfluxDB stand-in.')
+    parser.add_argument("-H", "--hours", help="hours of logs to upload (default = 2)", type=int, default=2)
+    parser.add_argument("-b", "--baros", help="barometers per hour file (default = 2)", type=int, default=2)
+    parser.add_argument("-r", "--rate", help="barometer samples per second (default = 20)", type=int, default=20)
+    parser.add_argument("-a", "--anems", help="anemometers per hour file (default = 1)", type=int, default=1)
+    parser.add_argument("-l", "--latency", help="seconds the stand-in adds to every write request (default = 0.01)", type=float, default=0.01)
+    parser.add_argument("-e", "--errorrate", help="fraction of write requests the stand-in fails (default = 0)", type=float, default=0.0)
+    parser.add_argument("-k", "--keep", help="keep the generated log tree", action="store_true")
+    args = parser.parse_args(argv)
+
+    logDir = tempfile.mkdtemp(prefix="benchUpload")
+    start = (datetime.utcnow() - timedelta(days=1)).replace(minute=0, second=0, microsecond=0)
+    print("\nWriting " + str(args.hours) + " hour(s) of logs to " + logDir + "...")
+    lines = writeHours(logDir, start, args.hours, args.baros, args.rate, args.anems)
+    print("  " + str(lines) + " lines\n")
+
+    stub = InfluxStub(0, args.latency, args.errorrate)
+    stub.start()
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "dataSender.py"),
+               stub.url, "bench", "token", "bench",
+               "-l", os.path.join(logDir, "BAROLOG"), "-l", os.path.join(logDir, "WINDLOG"),
+               "--backfill", "--retryinterval", "0.1"] + senderArgs
+    print("Running " + " ".join(command[1:]) + "\n")
+    try:
+        startTime = time.monotonic()
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        elapsed = time.monotonic() - startTime
+    finally:
+        stub.stop()
+        if not args.keep:
+            shutil.rmtree(logDir)
+
+    for line in result.stdout.splitlines():
+        if line.startswith("Upload:") or "failed" in line:
+            print("  sender: " + line)
+    print("  stand-in: " + stub.stats())
+    print("  {0} of {1} points in {2:.2f} s, {3:.0f} points/s, peak RSS {4:.1f} MB, {5} retries, exit code {6}".format(
+        stub.points, lines, elapsed, stub.points / elapsed, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        stub.errors, result.returncode))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#
+# checkpoint.py - per log directory upload checkpoints for dataSender
+#
+# for every hour file in a log directory the checkpoint records how many bytes
+# from the start of the file InfluxDB has acknowledged and the inode the file had
+# at the time, so each run only reads and sends the lines appended since - a file
+# whose inode changed (rewritten, restored) or that is now shorter than its offset
+# is sent again from the start - a compressed hour file keeps the inode and size
+# of the plain file it was made from (see logCompression), so its checkpoint
+# still holds
+#
+# checkpoints live in LOGDIR/.datasender.json, keyed by hour file name, and are
+# saved with write to a temporary file + fsync + rename, so a power cut leaves
+# either the old or the new state and never a torn one - the worst case is that
+# the last acknowledged chunk is sent twice, which InfluxDB absorbs as an
+# overwrite of the same points
+#
+# a store may be shared by several upload threads, commits are serialized
+#
+
+import os
+import json
+import threading
+
+STATE_FILE = ".datasender.json"
+
+class CheckpointStore:
+    def __init__(self, logDir):
+        self.path = os.path.join(logDir, STATE_FILE)
+        self.checkpoints = {}
+        self.lock = threading.Lock()
+        try:
+            with open(self.path, "r") as stateFile:
+                self.checkpoints = json.load(stateFile)
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            print("Ignoring unreadable checkpoint file " + self.path)
+
+    # byte offset to resume the file from, 0 if it is unknown or was replaced
+    def offset(self, name, inode, size):
+        checkpoint = self.checkpoints.get(name)
+        if checkpoint is None or checkpoint["inode"] != inode or checkpoint["offset"] > size:
+            return 0
+        return checkpoint["offset"]
+
+    # true if the file has bytes InfluxDB has not acknowledged
+    def pending(self, name, inode, size):
+        return self.offset(name, inode, size) < size
+
+    # record an acknowledged offset and save the state straight away
+    def commit(self, name, inode, offset):
+        with self.lock:
+            self.checkpoints[name] = {"inode": inode, "offset": offset}
+            self.save()
+
+    # drop checkpoints of files for which keep(name) is false
+    def prune(self, keep):
+        with self.lock:
+            stale = [name for name in self.checkpoints if not keep(name)]
+            for name in stale:
+                del self.checkpoints[name]
+            if stale:
+                self.save()
+
+    # callers hold the lock
+    def save(self):
+        tmpPath = self.path + ".tmp"
+        with open(tmpPath, "w") as stateFile:
+            json.dump(self.checkpoints, stateFile)
+            stateFile.flush()
+            os.fsync(stateFile.fileno())
+        os.replace(tmpPath, self.path)
@@ -6,70 +6,256 @@ from datetime import timedelta
 import os
 import csv
 import argparse
-import pandas as pd
+import signal
+import threading
 import socket
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from checkpoint import CheckpointStore
+from lineProtocol import LineEncoder
+from rateLimiter import RateLimiter
+from writePipeline import WritePipeline
+
+# modules shared with the other scripts live in src/common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from logCompression import findLogFile, logIdentity, readRange, splitCodec
+
+#
+# path of the hour file of log directory logdir for the hour containing timestamp
+#
+def hourFilePath(logdir, log_prefix, timestamp):
+    return os.path.join(
+        logdir,
+        log_prefix + "_" + datetime.strftime(timestamp, "%Y%m%d"),
+        log_prefix + "_" + datetime.strftime(timestamp, "%Y%m%d-%H") + ".txt"
+    )
+
+#
+# path of the hour file with the given file name, PREFIX_YYYYmmdd-HH.txt
+#
+def hourFilePathFromName(logdir, name):
+    return os.path.join(logdir, name[:name.rindex("-")], name)
+
+#
+# every hour file in the PREFIX_YYYYmmdd day directories of logdir, as a list of
+# (file name, path) sorted oldest first - compressed hour files (see
+# logCompression) are listed under the name of the plain file, with the path of
+# the plain file while it still exists
+#
+def findHourFiles(logdir, log_prefix):
+    hourFiles = {}
+    for dayDir in os.scandir(logdir):
+        if not dayDir.is_dir() or not dayDir.name.startswith(log_prefix + "_"):
+            continue
+        for hourFile in os.scandir(dayDir.path):
+            name, codec = splitCodec(hourFile.name)
+            if name.startswith(dayDir.name + "-") and name.endswith(".txt"):
+                if codec is None or name not in hourFiles:
+                    hourFiles[name] = hourFile.path
+    return sorted(hourFiles.items())
+
+#
+# hour files of logdir that are not fully acknowledged and not older than since,
+# as a list of (hour, path, checkpoint store)
+#
+def findPendingFiles(logdir, log_prefix, checkpoints, since):
+    pending = []
+    for name, path in findHourFiles(logdir, log_prefix):
+        try:
+            hour = datetime.strptime(name[len(log_prefix) + 1:-len(".txt")], "%Y%m%d-%H")
+        except ValueError:
+            continue
+        if since is not None and hour < since.replace(minute=0, second=0, microsecond=0):
+            continue
+        try:
+            inode, size = logIdentity(path, os.stat(path))
+        except FileNotFoundError:
+            continue
+        if checkpoints.pending(name, inode, size):
+            pending.append((hour, path, checkpoints))
+    return pending
+
+#
+# queue the lines appended to an hour file since its checkpoint on the write
+# pipeline, chunk lines at a time, the checkpoint is committed as each chunk is
+# acknowledged - a trailing line without its newline is still being written and
+# is left for the next run, returns False if the pipeline has failed - csv_path
+# may be the plain or a compressed hour file, whichever exists is read
+#
+def sendNewLines(pipeline, args, csv_path, checkpoints, dev_hostname, limiter=None):
+    name = splitCodec(os.path.basename(csv_path))[0]
+    encoder = LineEncoder(dev_hostname, name[:name.index("_")])
+
+    csv_path = findLogFile(os.path.join(os.path.dirname(csv_path), name))
+    if csv_path is None:
+        return True
+    try:
+        csvFile = open(csv_path, "rb")
+    except FileNotFoundError:
+        return True
+
+    with csvFile:
+        inode, size = logIdentity(csv_path, os.fstat(csvFile.fileno()))
+        offset = checkpoints.offset(name, inode, size)
+        if offset >= size:
+            return True
+        data = readRange(csvFile, csv_path, offset, size - offset)
+    data = data[:data.rfind(b"\n") + 1]
+    if not data:
+        return True
+
+    lines = data.splitlines(keepends=True)
+    print("Sending " + str(len(lines)) + " new data points from " + name + " at byte " + str(offset))
+    for i in range(0, len(lines), args.chunk):
+        chunk = b"".join(lines[i:i + args.chunk])
+        if limiter is not None:
+            limiter.acquire(min(args.chunk, len(lines) - i))
+        points = encoder.encode(chunk)
+
+        offset += len(chunk)
+        if not pipeline.write(points, lambda offset=offset: checkpoints.commit(name, inode, offset)):
+            print("Stopped " + name + ", the rest is sent next run")
+            return False
+    if encoder.skipped:
+        print("Skipped " + str(encoder.skipped) + " unparsable line(s) in " + name)
+    return True
+
+#
+# send what was appended to the hour files of the given times in every log
+# directory since their checkpoints, stores maps each log directory to its
+# checkpoint store
+#
+def sendLatest(pipeline, args, stores, csv_timestamps, dev_hostname):
+    for logdir, checkpoints in stores.items():
+        log_prefix = os.path.basename(logdir)
+        for csv_timestamp in csv_timestamps:
+            csv_path = hourFilePath(logdir, log_prefix, csv_timestamp)
+            if not sendNewLines(pipeline, args, csv_path, checkpoints, dev_hostname):
+                return
+    pipeline.flush()
+
+#
+# forget checkpoints of hour files that have been deleted, plain and compressed
+#
+def pruneCheckpoints(stores):
+    for logdir, checkpoints in stores.items():
+        checkpoints.prune(lambda name: findLogFile(hourFilePathFromName(logdir, name)) is not None)
+
+#
+# keep sending whatever is appended to the current and previous hour files every
+# args.interval seconds, with the same client and checkpoint stores throughout,
+# until SIGTERM/SIGINT - a failed write only ends its cycle, the next one starts
+# again from the checkpoints (a batch rejected for its data is skipped, not sent
+# again), checkpoints are pruned and stats reported once an hour
+#
+def daemon(pipeline, args, stores, dev_hostname):
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+
+    print("Sending new data every " + str(args.interval) + " s\nQuit with CTRL+C")
+    lastHour = None
+    while not stop.is_set():
+        cur_time = datetime.utcnow()
+        pipeline.reset()
+        sendLatest(pipeline, args, stores, [cur_time - timedelta(hours=1), cur_time], dev_hostname)
+        if cur_time.hour != lastHour:
+            if lastHour is not None:
+                print("  upload: " + pipeline.stats())
+                pipeline.resetStats()
+            lastHour = cur_time.hour
+            pruneCheckpoints(stores)
+        stop.wait(args.interval)
+    print("Quitting...")
+
+#
+# send every pending hour file of all log directories, oldest or newest hour
+# first, args.workers files at a time into the shared pipeline - once a write
+# fails (network down) no further files are started, what is left is picked up
+# by the next backfill
+#
+def backfill(pipeline, args, dev_hostname):
+    since = None if args.since is None else datetime.fromisoformat(args.since)
+    limiter = RateLimiter(args.rate, max(args.rate, args.chunk)) if args.rate > 0 else None
+
+    pending = []
+    for logdir in args.logdir:
+        pending += findPendingFiles(logdir, os.path.basename(logdir), CheckpointStore(logdir), since)
+    pending.sort(key=lambda hourFile: hourFile[0], reverse=args.order == "newest")
+    print("Backfilling " + str(len(pending)) + " hour file(s), " + args.order + " first")
+
+    def sendFile(hour, csv_path, checkpoints):
+        if pipeline.failed:
+            return
+        sendNewLines(pipeline, args, csv_path, checkpoints, dev_hostname, limiter)
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        # submitted in order, so the workers take the files in that order
+        for future in [executor.submit(sendFile, *hourFile) for hourFile in pending]:
+            future.result()
+
+    if not pipeline.flush():
+        print("Backfill stopped after a failed upload")
 
 def main():
 
-    parser = argparse.ArgumentParser(description='Sends the past hour of data to influxdb')
+    parser = argparse.ArgumentParser(description='Sends the data logged since the last run to influxdb')
     parser.add_argument("url", help="URL of influxdb remote server", type=str)
     parser.add_argument("org", help="InfluxDB Org", type=str)
     parser.add_argument("token", help="InfluxDB API token", type=str)
     parser.add_argument("bucket", help="InfluxDB Bucket name", type=str)
     parser.add_argument("-l", "--logdir", help="Log directory", action='append', required=True)
     parser.add_argument("-t", "--time", help="Send specific csv")
-    parser.add_argument("-c", "--chunk", help="CSV chunk size in # of lines", default=1000)
+    parser.add_argument("-c", "--chunk", help="CSV chunk size in # of lines", type=int, default=1000)
+    parser.add_argument("-b", "--backfill", help="send every hour file in the log directories that is not fully acknowledged instead of just the latest hours", action="store_true")
+    parser.add_argument("--since", help="with --backfill, skip hours before this time (ISO format)")
+    parser.add_argument("--order", help="with --backfill, send the oldest or the newest hours first (default = oldest)", choices=["oldest", "newest"], default="oldest")
+    parser.add_argument("-r", "--rate", help="with --backfill, maximum data points per second, 0 for no limit (default = 0)", type=float, default=0)
+    parser.add_argument("-w", "--workers", help="with --backfill, number of hour files sent concurrently (default = 2)", type=int, default=2)
+    parser.add_argument("-d", "--daemon", help="keep running and send new data every --interval seconds instead of once", action="store_true")
+    parser.add_argument("-i", "--interval", help="with --daemon, seconds between sends (default = 10)", type=float, default=10)
+    parser.add_argument("--batchsize", help="data points per write request (default = 5000)", type=int, default=5000)
+    parser.add_argument("--flushinterval", help="seconds a partial batch may wait for more points (default = 1)", type=float, default=1.0)
+    parser.add_argument("--retries", help="retries of a failed write request (default = 5)", type=int, default=5)
+    parser.add_argument("--retryinterval", help="seconds before the first retry, doubled on every retry (default = 1)", type=float, default=1.0)
+    parser.add_argument("-q", "--quarantine", help="append batches the server rejects for their data (400, 413, 422) to this file, they are skipped either way")
+    parser.add_argument("-z", "--gzip", help="gzip compress write requests", action="store_true")
     args = parser.parse_args()
 
-    # create influxdb objects
-    client = influxdb_client.InfluxDBClient(url=args.url, token=args.token, org=args.org)
+    # create influxdb objects, one pipeline batches the writes of every log
+    # directory - its requests are synchronous so a returned write is an
+    # acknowledged one and its checkpoints can be committed
+    client = influxdb_client.InfluxDBClient(url=args.url, token=args.token, org=args.org, enable_gzip=args.gzip)
+    write_api = client.write_api(write_options=SYNCHRONOUS)
+    pipeline = WritePipeline(write_api, args.bucket, args.batchsize, args.flushinterval, args.retries, args.retryinterval, quarantinePath=args.quarantine)
 
     dev_hostname = socket.gethostname()
 
-    # find csv file to send
+    # find csv files to send
     if args.time is None:
-        # custom time requested to be sent
+        # the current hour, and the previous one for whatever was appended to it
+        # after the last run
         cur_time = datetime.utcnow()
-        # lag csv timestamp by 1 min to catch last data points
-        cur_time -= timedelta(minutes=1)
+        csv_timestamps = [cur_time - timedelta(hours=1), cur_time]
     else:
-        cur_time = datetime.fromisoformat(args.time)
-        
-    csv_timestamp = cur_time.replace(minute=0,second=0,microsecond=0)
-
-    for logdir in args.logdir:
-        log_prefix = os.path.basename(logdir)
+        # custom time requested to be sent
+        csv_timestamps = [datetime.fromisoformat(args.time)]
 
-        csv_path = os.path.join(
-            logdir,
-            log_prefix + "_" + datetime.strftime(csv_timestamp, "%Y%m%d"),
-            log_prefix + "_" + datetime.strftime(csv_timestamp, "%Y%m%d-%H") + ".txt"
-        )
-
-        # read csv in chunks with pandas
-        if log_prefix == "BAROLOG":
-            csvHeader = ["hostname", "sensor_id", "sys_timestamp", "timestamp", "value"]
-        elif log_prefix == "WINDLOG":
-            csvHeader = ["hostname", "sensor_id", "timestamp", "adc", "voltage", "value"]
-        
-        i = 0
-        for df in pd.read_csv(csv_path, chunksize=args.chunk, names=csvHeader):
-            # convert values
-            df["value"] = df["value"].astype(float)
-
-            print("Sending " + log_prefix + " data points [" + str(i * args.chunk) + "-" + str((i + 1) * args.chunk - 1) + "]")
-            i += 1
-            with client.write_api() as write_api:
-                try:
-                    write_api.write(
-                        record=df,
-                        bucket=args.bucket,
-                        data_frame_measurement_name=dev_hostname,
-                        data_frame_tag_columns=["sensor_id"],
-                        data_frame_timestamp_column="timestamp",
-                    )
-                except InfluxDBError as e:
-                    print(e)
+    try:
+        if args.backfill:
+            backfill(pipeline, args, dev_hostname)
+        else:
+            stores = {logdir: CheckpointStore(logdir) for logdir in args.logdir}
+            if args.daemon:
+                daemon(pipeline, args, stores, dev_hostname)
+            else:
+                sendLatest(pipeline, args, stores, csv_timestamps, dev_hostname)
+                pruneCheckpoints(stores)
+        print("Upload: " + pipeline.stats())
+    finally:
+        write_api.close()
+        client.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
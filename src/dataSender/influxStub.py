@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+#
+# influxStub.py - local stand-in for the InfluxDB v2 write endpoint
+#               - accepts POST /api/v2/write with plain or gzip line protocol,
+#                 checks every line has a measurement, fields and an integer
+#                 timestamp, counts points and bytes and answers 204 - anything
+#                 malformed gets a 400 like the real server
+#               - injects a fixed latency per request and a random fraction of
+#                 failed requests (503 by default) to exercise retries
+#               - GET /ping and /health answer so clients see a live server
+#               - nothing is stored
+#
+#   usage: ./influxStub.py [-h] [-p PORT] [-l LATENCY] [-e ERRORRATE] [-s ERRORSTATUS]
+#
+
+import gzip
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class InfluxStub:
+    def __init__(self, port=8086, latency=0.0, errorRate=0.0, errorStatus=503):
+        self.latency = latency
+        self.errorRate = errorRate
+        self.errorStatus = errorStatus
+        self.lock = threading.Lock()
+        self.resetStats()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/ping"):
+                    self.reply(204)
+                elif self.path.startswith("/health"):
+                    self.reply(200, {"name": "influxdb", "message": "ready for queries and writes", "status": "pass"})
+                else:
+                    self.reply(404, {"code": "not found", "message": "path not found"})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if not self.path.startswith("/api/v2/write"):
+                    self.reply(404, {"code": "not found", "message": "path not found"})
+                    return
+                self.reply(*stub.write(body, self.headers.get("Content-Encoding") == "gzip"))
+
+            def reply(self, status, message=None):
+                body = b"" if message is None else json.dumps(message).encode()
+                self.send_response(status)
+                if body:
+                    self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.port = self.server.server_address[1]
+        self.url = "http://127.0.0.1:" + str(self.port)
+
+    def resetStats(self):
+        with self.lock:
+            self.requests = 0
+            self.errors = 0
+            self.rejected = 0
+            self.points = 0
+            self.bytes = 0
+            self.lineBytes = 0
+
+    # handle one write request body, returns (status, message)
+    def write(self, body, gzipped):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        with self.lock:
+            self.requests += 1
+            self.bytes += len(body)
+            if random.random() < self.errorRate:
+                self.errors += 1
+                return self.errorStatus, {"code": "unavailable", "message": "injected error"}
+
+        try:
+            if gzipped:
+                body = gzip.decompress(body)
+            lines = body.decode().splitlines()
+        except (OSError, UnicodeDecodeError) as e:
+            with self.lock:
+                self.rejected += 1
+            return 400, {"code": "invalid", "message": str(e)}
+
+        points = 0
+        for number, line in enumerate(lines):
+            if not line or line.startswith("#"):
+                continue
+            parts = line.rsplit(" ", 2)
+            if len(parts) != 3 or not parts[0] or "=" not in parts[1] or not parts[2].lstrip("-").isdigit():
+                with self.lock:
+                    self.rejected += 1
+                return 400, {"code": "invalid", "message": "unable to parse line " + str(number + 1) + ": " + line[:100]}
+            points += 1
+
+        with self.lock:
+            self.points += points
+            self.lineBytes += len(body)
+        return 204, None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        with self.lock:
+            return "{0} requests, {1} injected errors, {2} rejected, {3} points, {4:.1f} kB received ({5:.1f} kB of line protocol)".format(
+                self.requests, self.errors, self.rejected, self.points, self.bytes / 1e3, self.lineBytes / 1e3)
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs a local stand-in for the InfluxDB write endpoint.')
+    parser.add_argument("-p", "--port", help="port to listen on (default = 8086)", type=int, default=8086)
+    parser.add_argument("-l", "--latency", help="seconds added to every write request (default = 0)", type=float, default=0.0)
+    parser.add_argument("-e", "--errorrate", help="fraction of write requests that fail (default = 0)", type=float, default=0.0)
+    parser.add_argument("-s", "--errorstatus", help="HTTP status of the failed requests (default = 503)", type=int, default=503)
+    args = parser.parse_args()
+
+    stub = InfluxStub(args.port, args.latency, args.errorrate, args.errorstatus)
+    print("InfluxDB stand-in listening on " + stub.url + "\nQuit with CTRL+C")
+    stub.start()
+    try:
+        while True:
+            time.sleep(10)
+            print("  " + stub.stats())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.stop()
+
+if __name__ == '__main__':
+    main()
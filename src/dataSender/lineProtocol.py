@@ -0,0 +1,111 @@
+#
+# lineProtocol.py - direct BAROLOG/WINDLOG line to InfluxDB line protocol encoder
+#
+# each log line is split on commas and written out as one line of line protocol
+# with the hostname of the sending box as measurement, sensor_id as the only tag
+# and the remaining columns as fields in key order, exactly as the DataFrame
+# serializer of influxdb_client wrote them before:
+#
+#   BAROLOG  host,sensor_id=SN hostname="..",sys_timestamp="..",value=1013.2 ns
+#   WINDLOG  host,sensor_id=anemometer adc=123i,hostname="..",value=1.5,voltage=0.4 ns
+#
+# except that sensor_id is sent as written instead of going through a numeric
+# parse, so serial numbers with leading zeros keep them
+#
+# timestamps are the loggers' ISO UTC format, YYYY-mm-ddTHH:MM:SS[.fraction][Z],
+# converted to integer epoch nanoseconds by slicing - the epoch of each whole
+# second YYYY-mm-ddTHH:MM:SS prefix is computed once and cached (from a cached
+# epoch of its hour), so most lines cost one dict lookup and one int() of the
+# fraction instead of a datetime parse
+#
+# lines that do not parse (logger ERROR lines, torn writes) are counted in
+# skipped and left out
+#
+
+import math
+import calendar
+
+NS_PER_SECOND = 1000000000
+
+MEASUREMENT_ESCAPE = str.maketrans({",": "\\,", " ": "\\ ", "\n": "\\n"})
+TAG_ESCAPE = str.maketrans({",": "\\,", "=": "\\=", " ": "\\ ", "\n": "\\n"})
+STRING_ESCAPE = str.maketrans({"\"": "\\\"", "\\": "\\\\"})
+
+class LineEncoder:
+    def __init__(self, measurement, log_prefix):
+        if log_prefix == "BAROLOG":
+            self.encodeLine = self.encodeBaro
+        elif log_prefix == "WINDLOG":
+            self.encodeLine = self.encodeWind
+        else:
+            raise ValueError("unknown log prefix: " + log_prefix)
+        self.measurement = measurement.translate(MEASUREMENT_ESCAPE)
+        self.hourCache = {}
+        self.secondCache = {}
+        self.skipped = 0
+
+    # epoch nanoseconds of an ISO UTC timestamp
+    def epochNs(self, timestamp):
+        ns = self.secondCache.get(timestamp[:19])
+        if ns is None:
+            ns = self.secondNs(timestamp)
+        fraction = timestamp[20:].rstrip("Z")
+        if fraction:
+            if timestamp[19] != "." or len(fraction) > 9:
+                raise ValueError("bad timestamp: " + timestamp)
+            ns += int(fraction.ljust(9, "0"))
+        elif len(timestamp.rstrip("Z")) != 19:
+            raise ValueError("bad timestamp: " + timestamp)
+        return ns
+
+    # epoch nanoseconds of the whole second of a timestamp, cached
+    def secondNs(self, timestamp):
+        if len(timestamp) < 19:
+            raise ValueError("bad timestamp: " + timestamp)
+        hourNs = self.hourCache.get(timestamp[:13])
+        if hourNs is None:
+            if timestamp[4] != "-" or timestamp[7] != "-" or timestamp[10] != "T":
+                raise ValueError("bad timestamp: " + timestamp)
+            hourNs = calendar.timegm((int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]), int(timestamp[11:13]), 0, 0)) * NS_PER_SECOND
+            self.hourCache[timestamp[:13]] = hourNs
+        if timestamp[13] != ":" or timestamp[16] != ":":
+            raise ValueError("bad timestamp: " + timestamp)
+        ns = hourNs + (int(timestamp[14:16]) * 60 + int(timestamp[17:19])) * NS_PER_SECOND
+        self.secondCache[timestamp[:19]] = ns
+        return ns
+
+    # hostname,sensor_id,sys_timestamp,timestamp,value
+    def encodeBaro(self, line):
+        hostname, sensor_id, sys_timestamp, timestamp, value = line.split(",")
+        value = float(value)
+        if not math.isfinite(value):
+            raise ValueError("bad value")
+        return (self.measurement + ",sensor_id=" + sensor_id.translate(TAG_ESCAPE)
+                + " hostname=\"" + hostname.translate(STRING_ESCAPE)
+                + "\",sys_timestamp=\"" + sys_timestamp.translate(STRING_ESCAPE)
+                + "\",value=" + str(value)
+                + " " + str(self.epochNs(timestamp)))
+
+    # hostname,sensor_id,timestamp,adc,voltage,value
+    def encodeWind(self, line):
+        hostname, sensor_id, timestamp, adc, voltage, value = line.split(",")
+        voltage = float(voltage)
+        value = float(value)
+        if not math.isfinite(voltage) or not math.isfinite(value):
+            raise ValueError("bad value")
+        return (self.measurement + ",sensor_id=" + sensor_id.translate(TAG_ESCAPE)
+                + " adc=" + str(int(adc))
+                + "i,hostname=\"" + hostname.translate(STRING_ESCAPE)
+                + "\",value=" + str(value)
+                + ",voltage=" + str(voltage)
+                + " " + str(self.epochNs(timestamp)))
+
+    # line protocol of every parsable line of a block of complete log lines
+    def encode(self, data):
+        points = []
+        for line in data.decode("ascii", "replace").splitlines():
+            try:
+                points.append(self.encodeLine(line))
+            except ValueError:
+                self.skipped += 1
+        return points
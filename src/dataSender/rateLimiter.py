@@ -0,0 +1,31 @@
+#
+# rateLimiter.py - token bucket limiting the data points per second dataSender
+# uploads, shared by all of its worker threads
+#
+# the bucket refills at rate points per second up to burst points, and taking
+# more points than are in the bucket leaves it in debt and sleeps the caller
+# until the debt is paid off - so a chunk larger than the burst still goes out
+# whole and the long run average stays at rate
+#
+
+import time
+import threading
+
+class RateLimiter:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = rate if burst is None else burst
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    # take count points from the bucket, sleeping if that overdraws it
+    def acquire(self, count):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= count
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
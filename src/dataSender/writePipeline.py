@@ -0,0 +1,219 @@
+#
+# writePipeline.py - the one batching write path of a dataSender run
+#
+# every log directory and every worker hands its line protocol to the same
+# pipeline, which collects it into batches of batchSize points (or whatever has
+# built up after flushInterval seconds) and sends each batch in a single
+# synchronous request - so chunks from different files share requests instead of
+# each chunk setting up its own write
+#
+# each write carries an onAck callback (dataSender commits its checkpoint there)
+# that is called once the batch holding it is acknowledged, in write order
+#
+# a batch that fails with a network error, 429 or 5xx is retried up to maxRetries
+# times, waiting retryInterval doubled on every attempt up to maxRetryDelay (or
+# the server's Retry-After) with random jitter - a batch that still fails, or is
+# refused for the whole connection (401, 403, 404: token, org or bucket), is
+# dropped with its callbacks and puts the pipeline in the failed state, where
+# every write is refused until reset(), so nothing written after the lost batch
+# can be acknowledged and move a checkpoint past it
+#
+# a batch the server rejects for its data (400, 413, 422) would be rejected again
+# on every retry, so it is logged, appended to quarantinePath if set, and then
+# acknowledged like a written one - its checkpoints move past it instead of the
+# next run sending it again forever
+#
+# batches are taken off the queue under the lock but sent outside it, so each
+# worker whose write fills a batch has its own request in flight while the others
+# keep queueing - acknowledgements still go out in batch order, a batch sent
+# after a lost one never has its callbacks called
+#
+
+import time
+import random
+import threading
+
+from influxdb_client.client.exceptions import InfluxDBError
+from urllib3.exceptions import HTTPError
+
+# statuses that reject the data of a batch rather than the connection
+REJECTED_STATUSES = (400, 413, 422)
+
+class WritePipeline:
+    def __init__(self, write_api, bucket, batchSize=5000, flushInterval=1.0, maxRetries=5, retryInterval=1.0, maxRetryDelay=60.0, quarantinePath=None):
+        self.write_api = write_api
+        self.bucket = bucket
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+        self.maxRetries = maxRetries
+        self.retryInterval = retryInterval
+        self.maxRetryDelay = maxRetryDelay
+        self.quarantinePath = quarantinePath
+
+        # lock guards the queue, the batch numbers handed out and the stats
+        self.lock = threading.Lock()
+        self.lines = []
+        self.callbacks = []
+        self.oldest = None
+        self.failed = False
+        self.nextBatch = 0
+        self.firstLost = None
+
+        # acked guards the completed batches waiting for an earlier one and the
+        # number of the next batch to acknowledge
+        self.acked = threading.Condition()
+        self.completed = {}
+        self.nextAck = 0
+        self.resetStats()
+
+    def resetStats(self):
+        self.startTime = time.monotonic()
+        self.points = 0
+        self.bytes = 0
+        self.batches = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejections = 0
+
+    # queue lines of line protocol, onAck() is called once they are acknowledged -
+    # returns False if the pipeline has failed, without queueing anything if it
+    # had already
+    def write(self, lines, onAck=None):
+        with self.lock:
+            if self.failed:
+                return False
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+            self.lines += lines
+            if onAck is not None:
+                self.callbacks.append(onAck)
+            if len(self.lines) < self.batchSize and time.monotonic() - self.oldest < self.flushInterval:
+                return True
+            batch = self.takeBatch()
+        return self.send(*batch)
+
+    # send everything queued and wait until every batch in flight is done,
+    # returns False if the pipeline has failed
+    def flush(self):
+        with self.lock:
+            if self.failed:
+                return False
+            batch = self.takeBatch()
+        self.send(*batch)
+        self.waitForBatches()
+        return not self.failed
+
+    # clear the failed state, e.g. at the start of a new send cycle
+    def reset(self):
+        self.waitForBatches()
+        with self.lock:
+            self.failed = False
+            self.firstLost = None
+
+    # callers hold the lock - the queued lines and callbacks with the number of
+    # their batch
+    def takeBatch(self):
+        batch = (self.nextBatch, self.lines, self.callbacks)
+        self.lines, self.callbacks, self.oldest = [], [], None
+        self.nextBatch += 1
+        return batch
+
+    def waitForBatches(self):
+        with self.lock:
+            last = self.nextBatch
+        with self.acked:
+            self.acked.wait_for(lambda: self.nextAck >= last)
+
+    # send a batch taken off the queue, without holding the lock
+    def send(self, number, lines, callbacks):
+        body = "\n".join(lines)
+        try:
+            status = self.request(lines, body) if lines else "written"
+        except BaseException:
+            # anything unexpected still completes the batch, as lost, so flush()
+            # and the batches after it do not wait for it forever
+            self.complete(number, lines, body, "lost", callbacks)
+            raise
+        return self.complete(number, lines, body, status, callbacks)
+
+    # count a sent batch by its status and acknowledge it, returns False if it
+    # was lost
+    def complete(self, number, lines, body, status, callbacks):
+        with self.lock:
+            if status == "written":
+                if lines:
+                    self.points += len(lines)
+                    self.bytes += len(body)
+                    self.batches += 1
+            elif status == "rejected":
+                self.rejections += 1
+            else:
+                self.failures += 1
+                self.failed = True
+                if self.firstLost is None or number < self.firstLost:
+                    self.firstLost = number
+        if status == "rejected":
+            self.quarantine(lines)
+        self.acknowledge(number, callbacks if status != "lost" else None)
+        return status != "lost"
+
+    # one write request with its retries, "written", "rejected" or "lost"
+    def request(self, lines, body):
+        for attempt in range(self.maxRetries + 1):
+            try:
+                self.write_api.write(bucket=self.bucket, record=body)
+                return "written"
+            except (InfluxDBError, HTTPError) as e:
+                status = getattr(getattr(e, "response", None), "status", None)
+                if status in REJECTED_STATUSES:
+                    print("Write of " + str(len(lines)) + " points rejected (" + str(status) + "), skipped: " + str(e).strip())
+                    return "rejected"
+                retryable = status is None or status == 429 or status >= 500
+                if not retryable or attempt == self.maxRetries:
+                    print("Write of " + str(len(lines)) + " points failed: " + str(e).strip())
+                    return "lost"
+                delay = min(self.retryInterval * 2 ** attempt, self.maxRetryDelay)
+                retryAfter = getattr(e, "retry_after", None)
+                if retryAfter is not None:
+                    try:
+                        delay = max(delay, float(retryAfter))
+                    except ValueError:
+                        pass
+                delay *= random.uniform(1.0, 1.25)
+                print("Write of " + str(len(lines)) + " points failed (" + str(status) + "), retrying in " + "{0:.1f}".format(delay) + " s")
+                with self.lock:
+                    self.retries += 1
+                time.sleep(delay)
+
+    # keep the lines of a rejected batch for a look later, one comment line with
+    # the time ahead of them
+    def quarantine(self, lines):
+        print("  first rejected point: " + lines[0])
+        if self.quarantinePath is None:
+            return
+        try:
+            with self.acked, open(self.quarantinePath, "a") as quarantineFile:
+                quarantineFile.write("# rejected " + time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()) + "\n" + "\n".join(lines) + "\n")
+        except OSError as e:
+            print("Unable to quarantine rejected points: " + str(e))
+
+    # call the callbacks of every batch done up to the first one still in flight,
+    # in batch order - callbacks is None for a lost batch, and nothing after a
+    # lost batch is acknowledged
+    def acknowledge(self, number, callbacks):
+        with self.acked:
+            self.completed[number] = callbacks
+            while self.nextAck in self.completed:
+                callbacks = self.completed.pop(self.nextAck)
+                firstLost = self.firstLost
+                if callbacks is not None and (firstLost is None or self.nextAck < firstLost):
+                    for onAck in callbacks:
+                        onAck()
+                self.nextAck += 1
+            self.acked.notify_all()
+
+    def stats(self):
+        elapsed = time.monotonic() - self.startTime
+        rate = self.points / elapsed if elapsed > 0 else 0.0
+        return "{0} points in {1} batches, {2:.0f} points/s, {3:.1f} kB of line protocol ({4:.1f} kB/s), {5} retries, {6} failed batches, {7} rejected batches".format(
+            self.points, self.batches, rate, self.bytes / 1e3, self.bytes / 1e3 / elapsed if elapsed > 0 else 0.0, self.retries, self.failures, self.rejections)
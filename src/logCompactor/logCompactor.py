@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+#
+# logCompactor.py - compacts finished hour files into compressed Parquet
+#                 - every hour file of a log directory (LOGDIR/PREFIX_YYYYmmdd/
+#                   PREFIX_YYYYmmdd-HH.txt, compressed by logCompressor or not,
+#                   or .bin from baroLogger -f binary)
+#                   whose hour ended more than SETTLE seconds ago and that has
+#                   not been written to since is converted to
+#                   PREFIX_YYYYmmdd-HH.parquet next to it
+#                 - with --daily, a finished day is instead merged into
+#                   PREFIX_YYYYmmdd/PREFIX_YYYYmmdd.parquet, together with the
+#                   hour Parquet files earlier runs left for it
+#                 - columns are typed - timestamps as UTC nanosecond timestamps,
+#                   values as float64, adc as int64 - and hostname and sensor_id
+#                   are dictionary encoded, lines that do not parse (logger ERROR
+#                   lines, torn writes) are left out and counted, as dataSender
+#                   does
+#                 - the Parquet file is written to a temporary file, fsynced,
+#                   read back and compared with what was written before it is
+#                   renamed into place, and only then are the source files
+#                   removed (kept with --keep)
+#                 - with --uploaded, CSV hours are only compacted once dataSender
+#                   has every byte of them acknowledged by InfluxDB, because it
+#                   only uploads CSV
+#                 - the log prefix is the name of the log directory, as for
+#                   dataSender, e.g. /opt/BAROLOG
+#
+#   usage: ./logCompactor.py [-h] -l LOGDIR [-l LOGDIR ...] [-D] [-s SETTLE]
+#                            [-z {zstd,snappy,gzip,none}] [-u] [-k] [-n]
+#
+
+import os
+import re
+import sys
+import time
+import argparse
+import calendar
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# modules shared with the other scripts live in src/common, dataSender's
+# checkpoints in src/dataSender
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "dataSender"))
+from baroBinary import loadRecords, NO_TIME
+from checkpoint import CheckpointStore
+from logCompression import openLog, logIdentity, splitCodec
+from logTables import SCHEMAS, binaryTable, csvTable, decoded
+from timeIndex import indexPath
+
+SOURCE_SUFFIXES = [".txt", ".bin"]
+
+HOUR_NAME = re.compile(r"^(.+)_(\d{8})-(\d{2})$")
+
+#
+# readers, each returns (table, number of records in the source)
+#
+
+def readCsv(path, schema):
+    with openLog(path) as csvFile:
+        data = csvFile.read()
+    records = data.count(b"\n") + (1 if data and not data.endswith(b"\n") else 0)
+    return csvTable(data, schema), records
+
+def readBinary(path, schema):
+    header, records = loadRecords(path)
+    return binaryTable(header, records[records["ns"] != NO_TIME], schema), len(records)
+
+def readParquet(path, schema):
+    table = pq.read_table(path, schema=schema)
+    return table, table.num_rows
+
+def readSource(path, schema):
+    if splitCodec(path)[0].endswith(".txt"):
+        return readCsv(path, schema)
+    if path.endswith(".bin"):
+        return readBinary(path, schema)
+    return readParquet(path, schema)
+
+def fsyncDirectory(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+#
+# write every source into target, verify it and remove the sources - target may
+# be one of the sources (a day file that gets more hours merged into it)
+#
+def compact(sources, target, schema, args):
+    tables = []
+    records = 0
+    for source in sources:
+        table, sourceRecords = readSource(source, schema)
+        tables.append(table)
+        records += sourceRecords
+    table = pa.concat_tables(tables).unify_dictionaries().combine_chunks()
+
+    tmpPath = target + ".tmp"
+    pq.write_table(table, tmpPath, compression=args.compression)
+    with open(tmpPath, "rb") as tmpFile:
+        os.fsync(tmpFile.fileno())
+    if not decoded(pq.read_table(tmpPath, schema=schema)).equals(decoded(table)):
+        os.remove(tmpPath)
+        raise ValueError("read back of " + tmpPath + " does not match the source data")
+    os.replace(tmpPath, target)
+    fsyncDirectory(os.path.dirname(target))
+
+    sourceBytes = sum(os.path.getsize(source) for source in sources if source != target)
+    if not args.keep:
+        for source in sources:
+            if source != target:
+                os.remove(source)
+                # the time index goes with its hour file
+                if os.path.exists(indexPath(source)):
+                    os.remove(indexPath(source))
+    print("  " + target + ": " + str(table.num_rows) + " rows from " + str(len(sources)) + " file(s), "
+          + str(records - table.num_rows) + " unparsable line(s) left out, "
+          + "{0:.1f} MB -> {1:.1f} MB".format(sourceBytes / 1e6, os.path.getsize(target) / 1e6))
+
+#
+# files of a day directory grouped by stem, {stem: [paths]} - a compressed CSV
+# whose plain file is still there is a copy of it and left out
+#
+def dayFiles(dayPath):
+    groups = {}
+    for entry in os.scandir(dayPath):
+        plainName, codec = splitCodec(entry.name)
+        stem, suffix = os.path.splitext(plainName)
+        if suffix in SOURCE_SUFFIXES + [".parquet"] and (codec is None or suffix == ".txt"):
+            groups.setdefault(stem, []).append(entry.path)
+    for stem, paths in groups.items():
+        if any(path.endswith(".txt") for path in paths):
+            paths[:] = [path for path in paths if splitCodec(path)[1] is None]
+        paths.sort()
+    return groups
+
+# true if a source file may be compacted: not written to for settle seconds, and
+# with --uploaded a CSV must be fully acknowledged by dataSender
+def isReady(path, checkpoints, args, now):
+    stat = os.stat(path)
+    if now - stat.st_mtime < args.settle:
+        return False
+    name = splitCodec(os.path.basename(path))[0]
+    if checkpoints is not None and name.endswith(".txt"):
+        return not checkpoints.pending(name, *logIdentity(path, stat))
+    return True
+
+def compactLogDir(logDir, args):
+    prefix = os.path.basename(os.path.normpath(logDir))
+    if prefix not in SCHEMAS:
+        print("  unknown log prefix " + prefix + " of " + logDir + ", skipping")
+        return
+    schema = SCHEMAS[prefix]
+    checkpoints = CheckpointStore(logDir) if args.uploaded else None
+    now = time.time()
+
+    for dayDir in sorted(os.scandir(logDir), key=lambda entry: entry.name):
+        if not dayDir.is_dir() or not re.match("^" + prefix + r"_\d{8}$", dayDir.name):
+            continue
+        dayStart = calendar.timegm(time.strptime(dayDir.name[len(prefix) + 1:], "%Y%m%d"))
+        groups = dayFiles(dayDir.path)
+        dayTarget = os.path.join(dayDir.path, dayDir.name + ".parquet")
+
+        # the work as a list of (sources, target) - an hour that already has its
+        # Parquet file is done, its source files are only still there with --keep
+        work = []
+        hourGroups = [(stem, paths) for stem, paths in sorted(groups.items()) if HOUR_NAME.match(stem)]
+        if args.daily and now >= dayStart + 86400 + args.settle:
+            sources = []
+            for stem, paths in hourGroups:
+                compacted = [path for path in paths if path.endswith(".parquet")]
+                sources += compacted if compacted else paths
+            raw = [path for path in sources if not path.endswith(".parquet")]
+            if sources and not (args.keep and os.path.exists(dayTarget)) and all(isReady(path, checkpoints, args, now) for path in raw):
+                if os.path.exists(dayTarget):
+                    sources.insert(0, dayTarget)
+                work.append((sources, dayTarget))
+        else:
+            for stem, paths in hourGroups:
+                hour = int(HOUR_NAME.match(stem).group(3))
+                if any(path.endswith(".parquet") for path in paths) or now < dayStart + (hour + 1) * 3600 + args.settle:
+                    continue
+                if all(isReady(path, checkpoints, args, now) for path in paths):
+                    work.append((paths, os.path.join(dayDir.path, stem + ".parquet")))
+
+        for sources, target in work:
+            if args.dryrun:
+                print("  would compact " + ", ".join(sources) + " -> " + target)
+                continue
+            try:
+                compact(sources, target, schema, args)
+            except (OSError, ValueError, pa.ArrowException) as e:
+                print("  unable to compact " + target + ", sources kept: " + str(e))
+
+def main():
+    parser = argparse.ArgumentParser(description='Compacts finished hourly log files into compressed Parquet files.')
+    parser.add_argument("-l", "--logdir", help="log directory, e.g. /opt/BAROLOG", action="append", required=True)
+    parser.add_argument("-D", "--daily", help="merge every finished day into one Parquet file instead of one per hour", action="store_true")
+    parser.add_argument("-s", "--settle", help="seconds an hour must have been over and its file left unchanged before it is compacted (default = 300)", type=float, default=300)
+    parser.add_argument("-z", "--compression", help="Parquet compression codec (default = zstd)", choices=["zstd", "snappy", "gzip", "none"], default="zstd")
+    parser.add_argument("-u", "--uploaded", help="only compact CSV hours dataSender has fully uploaded", action="store_true")
+    parser.add_argument("-k", "--keep", help="keep the source files after compacting them", action="store_true")
+    parser.add_argument("-n", "--dryrun", help="only show what would be compacted", action="store_true")
+    args = parser.parse_args()
+
+    for logDir in args.logdir:
+        print("Compacting " + logDir)
+        compactLogDir(logDir, args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+#
+# logCompressor.py - compresses hour files once the loggers have rotated them
+#                  - every PREFIX_YYYYmmdd-HH.txt of the log directories whose
+#                    hour ended more than SETTLE seconds ago and that has not been
+#                    written to since is compressed to PREFIX_YYYYmmdd-HH.txt.gz
+#                    (or .xz, .zst) with a streaming codec, a block at a time
+#                  - the compressed copy is written to a temporary file, fsynced,
+#                    decompressed again and checked against the SHA-256 of the
+#                    plain file, renamed into place and recorded in the manifest,
+#                    LOGDIR/.compressor.json, and only then is the plain file
+#                    removed - see src/common/logCompression.py for how readers
+#                    such as dataSender use the manifest
+#                  - runs at low priority, nice NICE and the idle IO class (via
+#                    ionice, when it is installed), so it never competes with the
+#                    loggers for CPU or the SD card
+#                  - with --daemon it keeps running and looks for rotated hours
+#                    every INTERVAL seconds, otherwise it runs once
+#
+#   usage: ./logCompressor.py [-h] -l LOGDIR [-l LOGDIR ...] [-c {gzip,xz,zstd}]
+#                             [--level LEVEL] [-s SETTLE] [-d] [-i INTERVAL]
+#                             [--nice NICE]
+#
+
+import os
+import re
+import sys
+import time
+import shutil
+import signal
+import hashlib
+import argparse
+import calendar
+import threading
+import subprocess
+from datetime import datetime
+
+# modules shared with the other scripts live in src/common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from logCompression import CODECS, LogManifest, compressedWriter, decompressedReader
+
+BLOCK_SIZE = 1 << 20
+
+HOUR_FILE = re.compile(r"^[A-Z]+_(\d{8})-(\d{2})\.txt$")
+
+# lower the priority of this process, CPU and IO
+def lowerPriority(niceness):
+    os.nice(niceness)
+    if shutil.which("ionice") is not None:
+        subprocess.run(["ionice", "-c", "3", "-p", str(os.getpid())])
+
+def fsyncDirectory(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+#
+# compress one hour file, returns its manifest entry - the plain file is left in
+# place, raises ValueError if it changed while being compressed or the compressed
+# copy does not match it
+#
+def compressFile(path, codec, level):
+    target = path + CODECS[codec]
+    tmpPath = target + ".tmp"
+    digest = hashlib.sha256()
+    with open(path, "rb") as plainFile:
+        stat = os.fstat(plainFile.fileno())
+        with open(tmpPath, "wb") as rawFile:
+            with compressedWriter(rawFile, codec, level) as compressedFile:
+                for block in iter(lambda: plainFile.read(BLOCK_SIZE), b""):
+                    digest.update(block)
+                    compressedFile.write(block)
+            rawFile.flush()
+            os.fsync(rawFile.fileno())
+        if os.stat(path).st_size != stat.st_size or plainFile.tell() != stat.st_size:
+            os.remove(tmpPath)
+            raise ValueError(path + " changed while being compressed")
+
+    check = hashlib.sha256()
+    with open(tmpPath, "rb") as rawFile:
+        compressedFile = decompressedReader(rawFile, target)
+        for block in iter(lambda: compressedFile.read(BLOCK_SIZE), b""):
+            check.update(block)
+    if check.digest() != digest.digest():
+        os.remove(tmpPath)
+        raise ValueError("decompressed " + tmpPath + " does not match " + path)
+
+    os.replace(tmpPath, target)
+    return {
+        "file": os.path.basename(target),
+        "codec": codec,
+        "inode": stat.st_ino,
+        "size": stat.st_size,
+        "compressedSize": os.path.getsize(target),
+        "sha256": digest.hexdigest(),
+        "compressed": datetime.utcnow().isoformat() + "Z",
+    }
+
+# hour files of logDir that have rotated, as a sorted list of paths
+def rotatedFiles(logDir, settle):
+    now = time.time()
+    rotated = []
+    for dayDir in os.scandir(logDir):
+        if not dayDir.is_dir():
+            continue
+        for hourFile in os.scandir(dayDir.path):
+            match = HOUR_FILE.match(hourFile.name)
+            if match is None or not hourFile.name.startswith(dayDir.name + "-"):
+                continue
+            hourEnd = calendar.timegm(time.strptime(match.group(1) + match.group(2), "%Y%m%d%H")) + 3600
+            if now >= hourEnd + settle and now - hourFile.stat().st_mtime >= settle:
+                rotated.append(hourFile.path)
+    rotated.sort()
+    return rotated
+
+def compressLogDir(logDir, args, stop):
+    manifest = LogManifest(logDir)
+    for path in rotatedFiles(logDir, args.settle):
+        if stop.is_set():
+            return
+        try:
+            start = time.monotonic()
+            entry = compressFile(path, args.codec, args.level)
+            # the manifest entry goes in before the plain file goes away, so
+            # readers never see a compressed file they can not identify
+            manifest.record(os.path.basename(path), entry)
+            os.remove(path)
+            fsyncDirectory(os.path.dirname(path))
+        except (OSError, ValueError) as e:
+            print("  unable to compress " + path + ": " + str(e))
+            continue
+        print("  " + path + " -> " + entry["file"] + ", {0:.1f} MB -> {1:.1f} MB in {2:.1f} s".format(
+            entry["size"] / 1e6, entry["compressedSize"] / 1e6, time.monotonic() - start))
+
+    # forget compressed files that have since been removed
+    manifest.prune(lambda name, entry: os.path.exists(os.path.join(logDir, name[:name.rindex("-")], entry["file"])))
+
+def main():
+    parser = argparse.ArgumentParser(description='Compresses hourly log files once they have been rotated.')
+    parser.add_argument("-l", "--logdir", help="log directory, e.g. /opt/BAROLOG", action="append", required=True)
+    parser.add_argument("-c", "--codec", help="compression codec, zstd needs the zstandard package (default = gzip)", choices=list(CODECS), default="gzip")
+    parser.add_argument("--level", help="compression level (default = the codec's default)", type=int)
+    parser.add_argument("-s", "--settle", help="seconds an hour must have been over and its file left unchanged before it is compressed (default = 60)", type=float, default=60)
+    parser.add_argument("-d", "--daemon", help="keep running and compress every rotated hour within --interval seconds", action="store_true")
+    parser.add_argument("-i", "--interval", help="with --daemon, seconds between looks for rotated hours (default = 30)", type=float, default=30)
+    parser.add_argument("--nice", help="niceness added to this process (default = 10)", type=int, default=10)
+    args = parser.parse_args()
+
+    lowerPriority(args.nice)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+
+    while not stop.is_set():
+        for logDir in args.logdir:
+            compressLogDir(logDir, args, stop)
+        if not args.daemon:
+            break
+        stop.wait(args.interval)
+
+if __name__ == '__main__':
+    main()
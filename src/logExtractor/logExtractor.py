@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+#
+# logExtractor.py - extracts the records of a time range from the log tree
+#                 - finds the hour files of the range by their names, in one or
+#                   more log directories, e.g. /opt/BAROLOG, or directories that
+#                   hold them, e.g. /opt or a copy of several boxes' logs
+#                 - reads whatever the other tools left of an hour: the plain or
+#                   compressed CSV, the .bin file of baroLogger -f binary, or the
+#                   hour or day Parquet file of logCompactor
+#                 - with a time index next to an hour file (see
+#                   src/common/timeIndex.py) only the bytes of the range are read,
+#                   otherwise the whole hour is
+#                 - rows go through a pipeline of generators - source files,
+#                   Arrow record batches, the rows of the range and sensors - into
+#                   a writer, so memory use is bounded by one batch and not by the
+#                   size of the range
+#                 - writes CSV in the loggers' format (to stdout with -o -),
+#                   binary in the baroBinary format (BAROLOG of one host only),
+#                   or Parquet as logCompactor does - CSV records of CSV hour
+#                   files are written as the lines the logger wrote
+#                 - START and END are ISO 8601 times, UTC unless they say
+#                   otherwise, END itself is not part of the range
+#                 - lines that do not parse (logger ERROR lines, torn writes) are
+#                   left out - binary and Parquet files only hold the values as
+#                   floats, so their records come out in CSV with the shortest
+#                   decimal that reads back as the same float, without any
+#                   trailing zeros the logger wrote
+#
+#   usage: ./logExtractor.py [-h] -l LOGDIR [-l LOGDIR ...] [-p {BAROLOG,WINDLOG}]
+#                            [-s SENSOR] [-f {csv,binary,parquet}] [-o OUTPUT]
+#                            START END
+#
+#   e.g.: ./logExtractor.py -l /opt -s 150000 -o out.csv 2026-10-16T14:05 2026-10-16T16:20
+#
+
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timezone
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# modules shared with the other scripts live in src/common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from baroBinary import loadRecords, packHeader, HEADER_SIZE, RECORD_SIZE, RECORD_FIELDS, NO_TIME
+from logCompression import CODECS, readRange, splitCodec
+from logTables import SCHEMAS, TIME_COLUMNS, TIMESTAMP, binaryTable, csvTables
+from timeIndex import TimeIndex, indexPath, NS_PER_SECOND, NS_PER_HOUR
+
+BATCH_RECORDS = 1 << 20
+
+# ISO time to epoch nanoseconds, naive times are UTC
+def parseTime(text):
+    moment = datetime.fromisoformat(text)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    delta = moment - datetime(1970, 1, 1, tzinfo=timezone.utc)
+    return (delta.days * 86400 + delta.seconds) * NS_PER_SECOND + delta.microseconds * 1000
+
+# the log directories of prefix in root, root itself if it is one
+def logDirs(root, prefix):
+    root = os.path.normpath(root)
+    if os.path.basename(root) == prefix:
+        return [root]
+    found = []
+    for dirPath, dirs, files in os.walk(root):
+        dirs.sort()
+        if os.path.basename(dirPath) == prefix:
+            found.append(dirPath)
+            dirs[:] = []
+        elif dirPath[len(root):].count(os.sep) >= 2:
+            dirs[:] = []
+    return found
+
+#
+# stage 1: source files
+#
+
+# sources of one hour of a day directory, from the day directory's file names
+def hourSources(names, dayPath, stem):
+    sources = []
+    plain = stem + ".txt"
+    compressed = [plain + suffix for suffix in CODECS.values() if plain + suffix in names]
+    if plain in names:
+        sources.append(plain)
+    elif compressed:
+        sources.append(compressed[0])
+    # a logger switched between formats within the hour leaves both
+    if stem + ".bin" in names:
+        sources.append(stem + ".bin")
+    if not sources and stem + ".parquet" in names:
+        sources.append(stem + ".parquet")
+    return [os.path.join(dayPath, name) for name in sources]
+
+def findSources(logDirList, prefix, startNs, endNs):
+    days = {}
+    for hour in range(startNs // NS_PER_HOUR, (endNs - 1) // NS_PER_HOUR + 1):
+        stem = prefix + "_" + time.strftime("%Y%m%d-%H", time.gmtime(hour * 3600))
+        dayName = stem[:-3]
+        for logDir in logDirList:
+            dayPath = os.path.join(logDir, dayName)
+            firstHour = dayPath not in days
+            if firstHour:
+                try:
+                    days[dayPath] = set(os.listdir(dayPath))
+                except FileNotFoundError:
+                    days[dayPath] = set()
+            # a day logCompactor --daily merged is read as a whole, once
+            if dayName + ".parquet" in days[dayPath]:
+                if firstHour:
+                    yield os.path.join(dayPath, dayName + ".parquet")
+                continue
+            yield from hourSources(days[dayPath], dayPath, stem)
+
+#
+# stage 2: Arrow tables of the records of each source that may be in the range,
+# as few as the time index allows
+#
+
+# time index of an hour file, None if it has none or it does not fit the file
+def loadIndex(path):
+    try:
+        index = TimeIndex.load(indexPath(path))
+    except (OSError, ValueError, KeyError):
+        return None
+    if splitCodec(path)[1] is None and index.bytes > os.path.getsize(path):
+        # the index of an earlier file of the same name
+        return None
+    return index
+
+# (begin, stop) bytes of path holding the records of the range, (0, None) for
+# the whole file
+def indexedRange(path, startNs, endNs, sensors):
+    index = loadIndex(path)
+    if index is None:
+        return 0, None
+    ranges = [index.byteRange(startNs, endNs, sensor) for sensor in sensors or [None]]
+    begin = min(begin for begin, stop in ranges)
+    stops = [stop for begin, stop in ranges]
+    return begin, None if None in stops else max(stops)
+
+# with keepLines the tables have the source lines as well, see logTables
+def csvBatches(path, schema, startNs, endNs, sensors, keepLines):
+    begin, stop = indexedRange(path, startNs, endNs, sensors)
+    if splitCodec(path)[1] is None:
+        # mapped, pyarrow parses straight out of the page cache
+        with pa.memory_map(path) as mapped:
+            size = mapped.size()
+            stop = size if stop is None else min(stop, size)
+            if begin < stop:
+                yield from csvTables(mapped.read_at(stop - begin, begin), schema, keepLines=keepLines)
+        return
+    with open(path, "rb") as rawFile:
+        data = readRange(rawFile, path, begin, -1 if stop is None else stop - begin)
+    yield from csvTables(data, schema, keepLines=keepLines)
+
+def binaryBatches(path, schema, startNs, endNs, sensors):
+    import numpy as np
+
+    header, records = loadRecords(path)
+    begin, stop = indexedRange(path, startNs, endNs, sensors)
+    first = max(begin - HEADER_SIZE, 0) // RECORD_SIZE
+    last = len(records) if stop is None else min((stop - HEADER_SIZE) // RECORD_SIZE, len(records))
+    wanted = None
+    if sensors:
+        wanted = np.array([index for index, sensor in enumerate(header["sensors"]) if sensor in sensors], dtype="u2")
+    for chunk in range(first, last, BATCH_RECORDS):
+        batch = records[chunk:min(chunk + BATCH_RECORDS, last)]
+        keep = (batch["ns"] != NO_TIME) & (batch["sys_ns"] >= startNs) & (batch["sys_ns"] < endNs)
+        if wanted is not None:
+            keep &= np.isin(batch["sensor"], wanted)
+        yield binaryTable(header, batch[keep], schema)
+
+def parquetBatches(path, schema, rowFilter):
+    # row groups whose statistics are out of the range are not read at all
+    for batch in ds.dataset(path, schema=schema, format="parquet").to_batches(filter=rowFilter, batch_size=BATCH_RECORDS):
+        yield pa.Table.from_batches([batch], schema=schema)
+
+def readBatches(sources, schema, startNs, endNs, sensors, rowFilter, stats, keepLines=False):
+    for path in sources:
+        stats["files"] += 1
+        plainName = splitCodec(path)[0]
+        if plainName.endswith(".txt"):
+            yield from csvBatches(path, schema, startNs, endNs, sensors, keepLines)
+        elif path.endswith(".bin"):
+            yield from binaryBatches(path, schema, startNs, endNs, sensors)
+        else:
+            yield from parquetBatches(path, schema, rowFilter)
+
+#
+# stage 3: the rows of the range and sensors
+#
+
+def rangeFilter(prefix, startNs, endNs, sensors):
+    timeColumn = pc.field(TIME_COLUMNS[prefix])
+    rowFilter = (timeColumn >= pa.scalar(startNs, TIMESTAMP)) & (timeColumn < pa.scalar(endNs, TIMESTAMP))
+    if sensors:
+        rowFilter &= pc.field("sensor_id").isin(pa.array(sensors, pa.string()))
+    return rowFilter
+
+def selectRows(tables, rowFilter, stats):
+    for table in tables:
+        table = table.filter(rowFilter)
+        if table.num_rows:
+            stats["rows"] += table.num_rows
+            yield table
+
+#
+# stage 4: writers
+#
+
+# ISO UTC text of a timestamp array as the loggers write it, microsecond
+# resolution and no fraction on whole seconds - strftime is slow, so only the
+# distinct seconds are formatted
+def isoArray(array):
+    seconds = pc.cast(array, pa.timestamp("s", tz="UTC"), safe=False)
+    distinct = pc.dictionary_encode(seconds)
+    text = pc.take(pc.strftime(distinct.dictionary, "%Y-%m-%dT%H:%M:%S"), distinct.indices)
+    micros = pc.subtract(pc.cast(pc.cast(array, pa.timestamp("us", tz="UTC"), safe=False), pa.int64()),
+                         pc.multiply(pc.cast(seconds, pa.int64()), 1000000))
+    fraction = pc.if_else(pc.equal(micros, 0), "",
+                          pc.binary_join_element_wise(".", pc.utf8_lpad(pc.cast(micros, pa.string()), 6, "0"), ""))
+    return pc.binary_join_element_wise(text, fraction, "Z", "")
+
+def textArray(array):
+    if array.type == TIMESTAMP:
+        return isoArray(array)
+    return pc.cast(array, pa.string())
+
+# CSV lines are built as one text column, or taken from the source lines of
+# tables that have them, and written with a delimiter that is never in them, so
+# pyarrow writes them as they are
+def writeCsv(tables, outFile, schema):
+    options = pacsv.WriteOptions(include_header=False, delimiter="\t", quoting_style="none")
+    for table in tables:
+        for batch in table.to_batches():
+            if "line" in batch.schema.names:
+                lines = batch.column("line")
+            else:
+                lines = pc.binary_join_element_wise(*[textArray(batch.column(name)) for name in schema.names], ",")
+            pacsv.write_csv(pa.table({"line": lines}), outFile, options)
+
+def writeParquet(tables, path, schema):
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for table in tables:
+            writer.write_table(table)
+
+def writeBinary(tables, path):
+    import numpy as np
+
+    hostname = None
+    sensors = []
+    with open(path, "wb") as binFile:
+        # the header is only known at the end, its space is kept for it
+        binFile.write(b"\0" * HEADER_SIZE)
+        for table in tables:
+            hostnames = pc.unique(pc.cast(table["hostname"], pa.string())).to_pylist()
+            if hostname is None:
+                hostname = hostnames[0]
+            if hostnames != [hostname]:
+                raise ValueError("binary output holds the records of one host, found " + ", ".join(sorted(set(hostnames + [hostname]))))
+            sensorIds = table["sensor_id"].combine_chunks()
+            for sensor in pc.cast(sensorIds.dictionary, pa.string()).to_pylist():
+                if sensor not in sensors:
+                    sensors.append(sensor)
+            indices = np.array([sensors.index(sensor) for sensor in sensorIds.dictionary.to_pylist()], dtype="u2")
+            records = np.empty(table.num_rows, dtype=np.dtype(RECORD_FIELDS))
+            records["sensor"] = indices[sensorIds.indices.to_numpy(zero_copy_only=False)]
+            records["sys_ns"] = pc.cast(table["sys_timestamp"], pa.int64()).to_numpy()
+            records["ns"] = pc.cast(table["timestamp"], pa.int64()).to_numpy()
+            records["value"] = table["value"].to_numpy()
+            binFile.write(records.tobytes())
+        binFile.seek(0)
+        binFile.write(packHeader(hostname or "", sensors))
+
+def main():
+    parser = argparse.ArgumentParser(description='Extracts the records of a time range from hourly log files.')
+    parser.add_argument("start", metavar="START", help="start of the range, ISO 8601, e.g. 2026-10-16T14:05 (UTC unless an offset is given)")
+    parser.add_argument("end", metavar="END", help="end of the range, not included, ISO 8601")
+    parser.add_argument("-l", "--logdir", help="log directory, e.g. /opt/BAROLOG, or a directory holding log directories, e.g. /opt", action="append", required=True)
+    parser.add_argument("-p", "--prefix", help="which logs to extract (default = BAROLOG)", choices=list(SCHEMAS), default="BAROLOG")
+    parser.add_argument("-s", "--sensor", help="sensor id to extract, e.g. a barometer serial number, may be repeated (default = every sensor)", action="append", default=[])
+    parser.add_argument("-f", "--format", help="output format, binary is for BAROLOG only (default = csv)", choices=["csv", "binary", "parquet"], default="csv")
+    parser.add_argument("-o", "--output", help="output file, - for stdout with csv (default = -)", default="-")
+    args = parser.parse_args()
+
+    try:
+        startNs = parseTime(args.start)
+        endNs = parseTime(args.end)
+    except ValueError as e:
+        parser.error(str(e))
+    if endNs <= startNs:
+        parser.error("END must be after START")
+    if args.format != "csv" and args.output == "-":
+        parser.error(args.format + " output needs a file, -o")
+    if args.format == "binary" and args.prefix != "BAROLOG":
+        parser.error("binary output is for BAROLOG only")
+
+    logDirList = []
+    for root in args.logdir:
+        found = logDirs(root, args.prefix)
+        if not found:
+            print("No " + args.prefix + " log directory in " + root, file=sys.stderr)
+        logDirList += found
+
+    schema = SCHEMAS[args.prefix]
+    rowFilter = rangeFilter(args.prefix, startNs, endNs, args.sensor)
+    stats = {"files": 0, "rows": 0}
+    started = time.monotonic()
+
+    sources = findSources(logDirList, args.prefix, startNs, endNs)
+    tables = selectRows(readBatches(sources, schema, startNs, endNs, args.sensor, rowFilter, stats, keepLines=args.format == "csv"), rowFilter, stats)
+    try:
+        if args.format == "csv":
+            if args.output == "-":
+                writeCsv(tables, sys.stdout.buffer, schema)
+            else:
+                with open(args.output, "wb") as outFile:
+                    writeCsv(tables, outFile, schema)
+        elif args.format == "parquet":
+            writeParquet(tables, args.output, schema)
+        else:
+            writeBinary(tables, args.output)
+    except BrokenPipeError:
+        # e.g. piped into head
+        sys.stderr.close()
+        return
+    except (OSError, ValueError, pa.ArrowException) as e:
+        print("Unable to extract: " + str(e), file=sys.stderr)
+        # a partial output file is no use to anyone
+        if args.output != "-" and os.path.exists(args.output):
+            os.remove(args.output)
+        sys.exit(1)
+
+    elapsed = time.monotonic() - started
+    print(str(stats["rows"]) + " rows from " + str(stats["files"]) + " file(s) in {0:.2f} s, {1:.0f} rows/s".format(
+        elapsed, stats["rows"] / elapsed if elapsed > 0 else 0), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
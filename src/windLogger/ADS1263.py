@@ -28,7 +28,10 @@
 #
 
 import config
-import RPi.GPIO as GPIO
+# the GPIO module of the backend config picked (RPi.GPIO, Jetson.GPIO or simulated)
+GPIO = config.GPIO
+import time
+import collections
 
 # gain
 ADS1263_GAIN = {
@@ -166,12 +169,41 @@ ADS1263_CMD = {
     'CMD_WREG2'     : 0x00, # number of registers to write minus 1, 000n nnnn
 }
 
+# Register values after reset, in register order (REG_ID is chip specific)
+ADS1263_REG_DEFAULT = [
+    None, 0x11, 0x05, 0x00, 0x80, 0x04, 0x01, 0x00, 0x00, 0x00,
+    0x00, 0x00, 0x40, 0xBB, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+    0x00, 0x00, 0x01, 0x00, 0x00, 0x00, 0x40,
+]
+# Registers left out of the integrity check: the chip ID and the GPIO data
+# register, which follows the pins
+ADS1263_REG_UNCHECKED = [ADS1263_REG['REG_ID'], ADS1263_REG['REG_GPIODAT']]
+
+# Registers changed by the calibration commands
+ADS1263_CAL_REGS = {
+    ADS1263_CMD['CMD_SYOCAL1'] : ['REG_OFCAL0', 'REG_OFCAL1', 'REG_OFCAL2'],
+    ADS1263_CMD['CMD_SYGCAL1'] : ['REG_FSCAL0', 'REG_FSCAL1', 'REG_FSCAL2'],
+    ADS1263_CMD['CMD_SFOCAL1'] : ['REG_OFCAL0', 'REG_OFCAL1', 'REG_OFCAL2'],
+    ADS1263_CMD['CMD_SYOCAL2'] : ['REG_ADC2OFC0', 'REG_ADC2OFC1'],
+    ADS1263_CMD['CMD_SYGCAL2'] : ['REG_ADC2FSC0', 'REG_ADC2FSC1'],
+    ADS1263_CMD['CMD_SFOCAL2'] : ['REG_ADC2OFC0', 'REG_ADC2OFC1'],
+}
+
+# Full duplex read frames: the command byte, then status, data and checksum are
+# clocked out by the dummy bytes. ADC1 has 4 data bytes, ADC2 has 3 and a pad byte
+ADS1263_RDATA1_FRAME = [ADS1263_CMD['CMD_RDATA1'], 0, 0, 0, 0, 0, 0]
+ADS1263_RDATA2_FRAME = [ADS1263_CMD['CMD_RDATA2'], 0, 0, 0, 0, 0, 0]
+
 class ADS1263:
     def __init__(self):
         self.rst_pin = config.RST_PIN
         self.cs_pin = config.CS_PIN
         self.drdy_pin = config.DRDY_PIN
         self.ScanMode = 1
+        # Shadow copy of every register, None where the value is not known
+        self.Registers = list(ADS1263_REG_DEFAULT)
+        self.Samples = None
+        self.SampleCount = 0
 
     # Hardware reset
     def ADS1263_reset(self):
@@ -181,18 +213,49 @@ class ADS1263:
         config.delay_ms(200)
         config.digital_write(self.rst_pin, GPIO.HIGH)
         config.delay_ms(200)
+        self.Registers = list(ADS1263_REG_DEFAULT)
     
     
     def ADS1263_WriteCmd(self, reg):
         config.digital_write(self.cs_pin, GPIO.LOW)#cs  0
         config.spi_writebyte([reg])
         config.digital_write(self.cs_pin, GPIO.HIGH)#cs 1
+        if reg in ADS1263_CAL_REGS:
+            # calibration rewrites its registers, the shadow copy no longer knows them
+            for cal in ADS1263_CAL_REGS[reg]:
+                self.Registers[ADS1263_REG[cal]] = None
     
     
     def ADS1263_WriteReg(self, reg, data):
         config.digital_write(self.cs_pin, GPIO.LOW)#cs  0
         config.spi_writebyte([ADS1263_CMD['CMD_WREG'] | reg, 0x00, data])
         config.digital_write(self.cs_pin, GPIO.HIGH)#cs 1
+        self.Registers[reg] = data
+
+
+    # Write a register only if the shadow copy says it changes. There is no read
+    # back here, ADS1263_CheckRegisters verifies everything periodically
+    def ADS1263_UpdateReg(self, reg, data):
+        if self.Registers[reg] != data:
+            self.ADS1263_WriteReg(reg, data)
+
+
+    # Read every register back in one transaction and compare with the shadow
+    # copy, returns the names of registers that did not match. Mismatches are
+    # rewritten from the shadow copy
+    def ADS1263_CheckRegisters(self):
+        count = len(self.Registers)
+        config.digital_write(self.cs_pin, GPIO.LOW)#cs  0
+        buf = config.spi_xfer2([ADS1263_CMD['CMD_RREG'], count - 1] + [0] * count)
+        config.digital_write(self.cs_pin, GPIO.HIGH)#cs 1
+        Mismatched = []
+        for name, reg in ADS1263_REG.items():
+            if reg in ADS1263_REG_UNCHECKED or self.Registers[reg] is None:
+                continue
+            if buf[2 + reg] != self.Registers[reg]:
+                Mismatched.append(name)
+                self.ADS1263_WriteReg(reg, self.Registers[reg])
+        return Mismatched
         
         
     def ADS1263_ReadData(self, reg):
@@ -285,12 +348,7 @@ class ADS1263:
         if Channal > 10:
             return 0
         INPMUX = (Channal << 4) | 0x0a
-        self.ADS1263_WriteReg(ADS1263_REG['REG_INPMUX'], INPMUX)
-        if(self.ADS1263_ReadData(ADS1263_REG['REG_INPMUX'])[0] == INPMUX):
-            # print("REG_INPMUX success")
-            pass
-        else:
-            print("REG_INPMUX unsuccess")
+        self.ADS1263_UpdateReg(ADS1263_REG['REG_INPMUX'], INPMUX)
 
 
     # Set ADC2 Measuring channel
@@ -298,12 +356,7 @@ class ADS1263:
         if Channal > 10:
             return 0
         INPMUX = (Channal << 4) | 0x0a
-        self.ADS1263_WriteReg(ADS1263_REG['REG_ADC2MUX'], INPMUX)
-        if(self.ADS1263_ReadData(ADS1263_REG['REG_ADC2MUX'])[0] == INPMUX):
-            # print("REG_ADC2MUX success")
-            pass
-        else:
-            print("REG_ADC2MUX unsuccess")
+        self.ADS1263_UpdateReg(ADS1263_REG['REG_ADC2MUX'], INPMUX)
             
 
     # Set ADC1 Measuring differential channel
@@ -318,12 +371,7 @@ class ADS1263:
             INPMUX = (6<<4) | 7 	#DiffChannal	AIN6-AIN7
         elif Channal == 4:
             INPMUX = (8<<4) | 9 	#DiffChannal	AIN8-AIN9
-        self.ADS1263_WriteReg(ADS1263_REG['REG_INPMUX'], INPMUX)
-        if(self.ADS1263_ReadData(ADS1263_REG['REG_INPMUX'])[0] == INPMUX):
-            # print("REG_INPMUX success")
-            pass
-        else:
-            print("REG_INPMUX unsuccess")
+        self.ADS1263_UpdateReg(ADS1263_REG['REG_INPMUX'], INPMUX)
             
 
     # Set ADC2 Measuring differential channel
@@ -338,12 +386,7 @@ class ADS1263:
             INPMUX = (6<<4) | 7 	#DiffChannal	AIN6-AIN7
         elif Channal == 4:
             INPMUX = (8<<4) | 9 	#DiffChannal	AIN8-AIN9
-        self.ADS1263_WriteReg(ADS1263_REG['REG_ADC2MUX'], INPMUX)
-        if(self.ADS1263_ReadData(ADS1263_REG['REG_ADC2MUX'])[0] == INPMUX):
-            # print("REG_ADC2MUX success")
-            pass
-        else:
-            print("REG_ADC2MUX unsuccess")
+        self.ADS1263_UpdateReg(ADS1263_REG['REG_ADC2MUX'], INPMUX)
             
 
     # Device initialization (ADC1)
@@ -378,6 +421,14 @@ class ADS1263:
         self.ADS1263_ConfigADC2(ADS1263_ADC2_GAIN['ADS1263_ADC2_GAIN_1'], ADS1263_ADC2_DRATE[Rate2])
         return 0
 
+
+    # Start ADC2 alongside an ADC1 that is already initialized and running,
+    # ADS1263_init_ADC2 would reset the chip and lose the ADC1 configuration
+    def ADS1263_StartADC2(self, Rate2 = 'ADS1263_ADC2_800SPS'):
+        self.ADS1263_WriteCmd(ADS1263_CMD['CMD_STOP2'])
+        self.ADS1263_ConfigADC2(ADS1263_ADC2_GAIN['ADS1263_ADC2_GAIN_1'], ADS1263_ADC2_DRATE[Rate2])
+        self.ADS1263_WriteCmd(ADS1263_CMD['CMD_START2'])
+
         
     # Read ADC data
     def ADS1263_Read_ADC_Data(self):
@@ -420,6 +471,41 @@ class ADS1263:
         return read
         
         
+    # Fast read ADC data (ADC1)
+    # One spi_xfer2 per attempt instead of separate write/read calls, and the
+    # checksum (sum of the data bytes + 0x9b) is checked straight from the bytes
+    def ADS1263_Read_ADC_Data_Fast(self):
+        while(1):
+            config.digital_write(self.cs_pin, GPIO.LOW)#cs  0
+            buf = config.spi_xfer2(ADS1263_RDATA1_FRAME)
+            config.digital_write(self.cs_pin, GPIO.HIGH)#cs 1
+            if(buf[1] & 0x40 != 0):
+                break
+        if((buf[2] + buf[3] + buf[4] + buf[5] + 0x9b) & 0xff != buf[6]):
+            print("ADC1 data read error!")
+        return (buf[2]<<24) | (buf[3]<<16) | (buf[4]<<8) | buf[5]
+
+
+    # Fast read ADC2 data
+    def ADS1263_Read_ADC2_Data_Fast(self):
+        while(1):
+            config.digital_write(self.cs_pin, GPIO.LOW)#cs  0
+            buf = config.spi_xfer2(ADS1263_RDATA2_FRAME)
+            config.digital_write(self.cs_pin, GPIO.HIGH)#cs 1
+            if(buf[1] & 0x80 != 0):
+                break
+        if((buf[2] + buf[3] + buf[4] + 0x9b) & 0xff != buf[6]):
+            print("ADC2 data read error!")
+        return (buf[2]<<16) | (buf[3]<<8) | buf[4]
+
+
+    # Read the next ADC1 conversion of the channel already selected, without any
+    # register traffic
+    def ADS1263_GetValue(self):
+        self.ADS1263_WaitDRDY()
+        return self.ADS1263_Read_ADC_Data_Fast()
+
+
     # Read ADC1 specified channel data
     def ADS1263_GetChannalValue(self, Channel):
         if(self.ScanMode == 0):# 0  Single-ended input  8 channel1 Differential input  4 channe 
@@ -430,7 +516,7 @@ class ADS1263:
             # self.ADS1263_WriteCmd(ADS1263_CMD['CMD_START1'])
             # config.delay_ms(2)
             self.ADS1263_WaitDRDY()
-            Value = self.ADS1263_Read_ADC_Data()
+            Value = self.ADS1263_Read_ADC_Data_Fast()
         else:
             if(Channel>4):
                 return 0
@@ -439,7 +525,7 @@ class ADS1263:
             # self.ADS1263_WriteCmd(ADS1263_CMD['CMD_START1'])
             # config.delay_ms(2) 
             self.ADS1263_WaitDRDY()
-            Value = self.ADS1263_Read_ADC_Data()
+            Value = self.ADS1263_Read_ADC_Data_Fast()
         return Value
 
 
@@ -460,8 +546,27 @@ class ADS1263:
             # config.delay_ms(2) 
             self.ADS1263_WriteCmd(ADS1263_CMD['CMD_START2'])
             # config.delay_ms(2) 
-            Value = self.ADS1263_Read_AD2C_Data()
+            Value = self.ADS1263_Read_ADC2_Data()
         return Value
+
+
+    # Read one single-ended channel on each ADC, converting at the same time.
+    # ADC2 is the slower one, so it is pointed at its channel and restarted first
+    # (only if its channel changes), then ADC1 converts while ADC2 is still busy
+    # and ADC2 is read last. Channel2 None reads ADC1 only, ADC2 value is None
+    def ADS1263_GetChannalPair(self, Channel1, Channel2):
+        Value2 = None
+        if Channel2 is not None:
+            INPMUX2 = (Channel2 << 4) | 0x0a
+            if self.Registers[ADS1263_REG['REG_ADC2MUX']] != INPMUX2:
+                self.ADS1263_WriteReg(ADS1263_REG['REG_ADC2MUX'], INPMUX2)
+                self.ADS1263_WriteCmd(ADS1263_CMD['CMD_START2'])
+        self.ADS1263_SetChannal(Channel1)
+        self.ADS1263_WaitDRDY()
+        Value1 = self.ADS1263_Read_ADC_Data_Fast()
+        if Channel2 is not None:
+            Value2 = self.ADS1263_Read_ADC2_Data_Fast()
+        return Value1, Value2
         
 
     def ADS1263_GetAll(self):
@@ -484,6 +589,48 @@ class ADS1263:
         return ADC_Value
         
         
+    # Interrupt driven continuous conversion (ADC1)
+    # A falling edge on DRDY means a conversion is ready, the callback reads it and
+    # appends (monotonic ns, value) to the sample buffer, nothing polls DRDY. The
+    # callback runs on the GPIO library's thread, so nothing else may use the SPI
+    # bus until ADS1263_StopContinuous
+    def ADS1263_StartContinuous(self, Channel, BufferSize = 65536):
+        if(self.ScanMode == 0):
+            if(Channel>10):
+                return -1
+            self.ADS1263_SetChannal(Channel)
+        else:
+            if(Channel>4):
+                return -1
+            self.ADS1263_SetDiffChannal(Channel)
+        self.Samples = collections.deque(maxlen = BufferSize)
+        self.SampleCount = 0
+        self.OverflowCount = 0
+        config.gpio_add_falling_callback(self.drdy_pin, self.ADS1263_DRDY_Callback)
+        return 0
+
+
+    def ADS1263_DRDY_Callback(self, pin):
+        Value = self.ADS1263_Read_ADC_Data_Fast()
+        # a full buffer drops its oldest conversion to make room
+        if len(self.Samples) == self.Samples.maxlen:
+            self.OverflowCount += 1
+        self.Samples.append((time.monotonic_ns(), Value))
+        self.SampleCount += 1
+
+
+    def ADS1263_StopContinuous(self):
+        config.gpio_remove_callback(self.drdy_pin)
+
+
+    # Take every buffered conversion, oldest first
+    def ADS1263_GetSamples(self):
+        Samples = []
+        while self.Samples:
+            Samples.append(self.Samples.popleft())
+        return Samples
+
+
     def ADS1263_RTD_Test(self):
         Delay = ADS1263_DELAY['ADS1263_DELAY_8d8ms']
         Gain = ADS1263_GAIN['ADS1263_GAIN_1']
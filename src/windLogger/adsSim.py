@@ -0,0 +1,305 @@
+#
+# adsSim.py - software model of the ADS1263 behind config.py's Simulated backend
+#
+# SimADS1263 keeps the 27 registers with their reset values and runs the SPI
+# command set byte by byte while CS is low (RESET, START1/2, STOP1/2, RDATA1/2,
+# RREG, WREG, calibration commands are accepted and ignored), so the driver can
+# use separate write/read calls or one full duplex transfer exactly as on the
+# real chip, with the same status bytes and checksums
+#
+# conversions are timed against the monotonic clock at the data rates set in
+# MODE2 (ADC1) and ADC2CFG (ADC2): a started ADC converts every 1/rate seconds,
+# the first conversion one period after START or after a write to a register
+# that restarts it (mode, mux, reference). DRDY reads low while ADC1 has a
+# conversion that has not been read, and an ADC1 falling edge callback is called
+# from a thread once per conversion, as RPi.GPIO would on the DRDY pin
+#
+# every input AINn carries a programmable waveform, a function of time in
+# seconds returning volts against AINCOM - the default on every input is set by
+# the WINDLOGGER_SIM_WAVE environment variable, "offset,amplitude,frequency,noise"
+# in volts and Hz (default 1.2,0.4,0.1,0.001), offset by 0.05 V per input
+# number so the inputs can be told apart, and setInput replaces it
+#
+# SimSPI and SimGPIO stand in for spidev.SpiDev and RPi.GPIO on top of the model
+#
+
+import os
+import math
+import time
+import random
+import threading
+
+NS_PER_SECOND = 1000000000
+
+REF = 5.08  # reference voltage the codes are scaled to, as in windLogger
+
+ADC1_RATES = [2.5, 5, 10, 16.6, 20, 50, 60, 100, 400, 1200, 2400, 4800, 7200, 14400, 19200, 38400]
+ADC2_RATES = [10, 100, 400, 800]
+
+REG_DEFAULT = [
+    0x23, 0x11, 0x05, 0x00, 0x80, 0x04, 0x01, 0x00, 0x00, 0x00,
+    0x00, 0x00, 0x40, 0xBB, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+    0x00, 0x00, 0x01, 0x00, 0x00, 0x00, 0x40,
+]
+
+REG_MODE2 = 5
+REG_INPMUX = 6
+REG_ADC2CFG = 21
+REG_ADC2MUX = 22
+
+# writes to these registers restart the conversions of ADC1 / ADC2
+ADC1_RESTART_REGS = [3, 4, 5, 6, 15]
+ADC2_RESTART_REGS = [21, 22]
+
+def waveFromEnvironment():
+    offset, amplitude, frequency, noise = [float(x) for x in os.environ.get("WINDLOGGER_SIM_WAVE", "1.2,0.4,0.1,0.001").split(",")]
+    def wave(channel):
+        return lambda t: offset + 0.05 * channel + amplitude * math.sin(2 * math.pi * frequency * t) + random.gauss(0, noise)
+    return wave
+
+#
+# one ADC's conversion timing, conversions are counted from the last (re)start
+#
+class SimConverter:
+    def __init__(self, rates):
+        self.rates = rates
+        self.startNs = None
+        self.taken = 0
+
+    def start(self, rateIndex):
+        self.periodNs = round(NS_PER_SECOND / self.rates[rateIndex])
+        self.startNs = time.monotonic_ns()
+        self.taken = 0
+
+    def stop(self):
+        self.startNs = None
+
+    # number of conversions completed so far
+    def completed(self, nowNs):
+        if self.startNs is None:
+            return 0
+        return (nowNs - self.startNs) // self.periodNs
+
+    def newData(self, nowNs):
+        return self.completed(nowNs) > self.taken
+
+    # monotonic time of the next conversion, None when stopped
+    def nextNs(self, nowNs):
+        if self.startNs is None:
+            return None
+        return self.startNs + (self.completed(nowNs) + 1) * self.periodNs
+
+    # take the newest conversion, returns its time since start in seconds or None
+    # if nothing has been converted since the start
+    def take(self, nowNs):
+        completed = self.completed(nowNs)
+        self.taken = completed
+        if completed == 0:
+            return None
+        return (self.startNs + completed * self.periodNs) / NS_PER_SECOND
+
+class SimADS1263:
+    def __init__(self, csPin, drdyPin, rstPin):
+        self.csPin = csPin
+        self.drdyPin = drdyPin
+        self.rstPin = rstPin
+        self.lock = threading.RLock()
+        wave = waveFromEnvironment()
+        self.inputs = [wave(channel) for channel in range(11)]
+        self.reset()
+
+    # replace the waveform of input AINn, func(t) -> volts, t in seconds
+    def setInput(self, channel, func):
+        self.inputs[channel] = func
+
+    def reset(self):
+        with self.lock:
+            self.registers = list(REG_DEFAULT)
+            self.adc1 = SimConverter(ADC1_RATES)
+            self.adc2 = SimConverter(ADC2_RATES)
+            self.selected = False
+            self.pending = []
+            self.output = []
+            self.values = [0, 0]
+
+    def select(self, level):
+        with self.lock:
+            self.selected = level == 0
+            self.pending = []
+            self.output = []
+
+    def drdy(self):
+        with self.lock:
+            return 0 if self.adc1.newData(time.monotonic_ns()) else 1
+
+    # code of input channel against AINCOM at time t, bits wide
+    def code(self, mux, t, bits):
+        volts = self.inputs[mux >> 4](t)
+        full = 1 << (bits - 1)
+        code = max(-full, min(full - 1, round(volts / REF * full)))
+        return code & ((1 << bits) - 1)
+
+    def status(self, nowNs):
+        status = 0x00
+        if self.adc1.newData(nowNs):
+            status |= 0x40
+        if self.adc2.newData(nowNs):
+            status |= 0x80
+        return status
+
+    def readData1(self):
+        nowNs = time.monotonic_ns()
+        status = self.status(nowNs)
+        t = self.adc1.take(nowNs)
+        if t is not None:
+            self.values[0] = self.code(self.registers[REG_INPMUX], t, 32)
+        data = list(self.values[0].to_bytes(4, "big"))
+        return [status] + data + [(sum(data) + 0x9b) & 0xff]
+
+    def readData2(self):
+        nowNs = time.monotonic_ns()
+        status = self.status(nowNs)
+        t = self.adc2.take(nowNs)
+        if t is not None:
+            self.values[1] = self.code(self.registers[REG_ADC2MUX], t, 24)
+        data = list(self.values[1].to_bytes(3, "big"))
+        return [status] + data + [0x00, (sum(data) + 0x9b) & 0xff]
+
+    def writeRegister(self, reg, value):
+        self.registers[reg] = value
+        if reg in ADC1_RESTART_REGS and self.adc1.startNs is not None:
+            self.adc1.start(self.registers[REG_MODE2] & 0x0f)
+        if reg in ADC2_RESTART_REGS and self.adc2.startNs is not None:
+            self.adc2.start(self.registers[REG_ADC2CFG] >> 6)
+
+    # one byte in on MOSI, one byte out on MISO
+    def transfer(self, byte):
+        with self.lock:
+            if not self.selected:
+                return 0xff
+            out = self.output.pop(0) if self.output else 0x00
+            self.pending.append(byte)
+            self.command()
+            return out
+
+    # run the command in pending once it is complete
+    def command(self):
+        op = self.pending[0]
+        if op & 0xe0 in (0x20, 0x40):
+            if len(self.pending) < 2:
+                return
+            reg = op & 0x1f
+            count = (self.pending[1] & 0x1f) + 1
+            if op & 0xe0 == 0x20:
+                self.output = [self.registers[r] if r < len(self.registers) else 0 for r in range(reg, reg + count)]
+            else:
+                if len(self.pending) < 2 + count:
+                    return
+                for i, value in enumerate(self.pending[2:2 + count]):
+                    if reg + i < len(self.registers):
+                        self.writeRegister(reg + i, value)
+            self.pending = []
+            return
+
+        self.pending = []
+        if op in (0x06, 0x07):
+            self.reset()
+            self.selected = True
+        elif op in (0x08, 0x09):
+            self.adc1.start(self.registers[REG_MODE2] & 0x0f)
+        elif op in (0x0a, 0x0b):
+            self.adc1.stop()
+        elif op in (0x0c, 0x0d):
+            self.adc2.start(self.registers[REG_ADC2CFG] >> 6)
+        elif op in (0x0e, 0x0f):
+            self.adc2.stop()
+        elif op in (0x12, 0x13):
+            self.output = self.readData1()
+        elif op in (0x14, 0x15):
+            self.output = self.readData2()
+        # anything else (calibration, NOP, data bytes after a read) is ignored
+
+class SimSPI:
+    def __init__(self, chip):
+        self.chip = chip
+        self.max_speed_hz = 0
+        self.mode = 0
+
+    def writebytes(self, data):
+        for byte in data:
+            self.chip.transfer(byte)
+
+    def readbytes(self, count):
+        return [self.chip.transfer(0) for i in range(count)]
+
+    def xfer2(self, data):
+        return [self.chip.transfer(byte) for byte in data]
+
+    def close(self):
+        pass
+
+class SimGPIO:
+    HIGH = 1
+    LOW = 0
+    BCM = 11
+    OUT = 0
+    IN = 1
+    PUD_UP = 22
+    FALLING = 32
+
+    def __init__(self, chip):
+        self.chip = chip
+        self.levels = {}
+        self.callbacks = {}
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None):
+        pass
+
+    def cleanup(self):
+        for pin in list(self.callbacks):
+            self.remove_event_detect(pin)
+
+    def output(self, pin, value):
+        if pin == self.chip.csPin:
+            self.chip.select(value)
+        elif pin == self.chip.rstPin and value and self.levels.get(pin) == 0:
+            # hardware reset on the rising edge of RESET
+            self.chip.reset()
+        self.levels[pin] = value
+
+    def input(self, pin):
+        if pin == self.chip.drdyPin:
+            return self.chip.drdy()
+        return self.levels.get(pin, 0)
+
+    # call callback(pin) from a thread once per ADC1 conversion, like a falling
+    # edge on DRDY - conversions that complete while the callback is still
+    # running are missed, as with an edge the GPIO library never saw
+    def add_event_detect(self, pin, edge, callback):
+        stopEvent = threading.Event()
+        self.callbacks[pin] = stopEvent
+
+        def run():
+            while not stopEvent.is_set():
+                nextNs = self.chip.adc1.nextNs(time.monotonic_ns())
+                if nextNs is None:
+                    stopEvent.wait(0.01)
+                    continue
+                delay = (nextNs - time.monotonic_ns()) / NS_PER_SECOND
+                if delay > 0:
+                    stopEvent.wait(delay)
+                if not stopEvent.is_set():
+                    callback(pin)
+
+        threading.Thread(target=run, name="SimDRDY", daemon=True).start()
+
+    def remove_event_detect(self, pin):
+        stopEvent = self.callbacks.pop(pin, None)
+        if stopEvent is not None:
+            stopEvent.set()
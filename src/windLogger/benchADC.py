@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+#
+# benchADC.py - samples/s and CPU time per sample of the ADS1263 read paths
+#             - runs the real driver on config.py's simulated backend
+#               (WINDLOGGER_BACKEND=sim, see adsSim.py), so it needs no hardware
+#               and the DRDY waits, data rates and checksums behave as on the chip
+#             - polled: ADS1263_GetChannalValue and ADS1263_GetValue for SECONDS
+#               each, every call waits for the next conversion at the data rate
+#             - interrupt: ADS1263_StartContinuous, the DRDY callback reads every
+#               conversion, reports the conversions read against those converted
+#             - CPU per sample is process time (all threads) over samples read
+#
+#   usage: ./benchADC.py [-h] [-r DRATE] [-s SECONDS]
+#
+
+import os
+import time
+import argparse
+
+os.environ["WINDLOGGER_BACKEND"] = "sim"
+
+import config
+import ADS1263
+
+def report(name, samples, elapsed, cpu):
+    print("  {0:28s} {1:8d} samples  {2:9.1f} samples/s  {3:7.1f} us CPU/sample".format(
+        name, samples, samples / elapsed, cpu / max(samples, 1) * 1e6))
+
+def polled(name, read, seconds):
+    samples = 0
+    startTime = time.monotonic()
+    startCpu = time.process_time()
+    while time.monotonic() - startTime < seconds:
+        read()
+        samples += 1
+    report(name, samples, time.monotonic() - startTime, time.process_time() - startCpu)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the ADS1263 read paths on the simulated ADC.')
+    parser.add_argument("-r", "--drate",
+                        choices=list(ADS1263.ADS1263_DRATE),
+                        default="ADS1263_1200SPS",
+                        help="ADC1 data rate (default = ADS1263_1200SPS)")
+    parser.add_argument("-s", "--seconds", help="seconds per read path (default = 2)", type=float, default=2)
+    args = parser.parse_args()
+
+    ADC = ADS1263.ADS1263()
+    if (ADC.ADS1263_init_ADC1(args.drate) == -1):
+        print("Unable to initialize ADC")
+        exit()
+    ADC.ADS1263_SetMode(0)
+    print("\nReading at " + args.drate + " for " + str(args.seconds) + " s per read path...\n")
+
+    polled("ADS1263_GetChannalValue(0)", lambda: ADC.ADS1263_GetChannalValue(0), args.seconds)
+    polled("ADS1263_GetValue()", ADC.ADS1263_GetValue, args.seconds)
+
+    converted = config.chip.adc1.completed(time.monotonic_ns())
+    startTime = time.monotonic()
+    startCpu = time.process_time()
+    ADC.ADS1263_StartContinuous(0)
+    time.sleep(args.seconds)
+    ADC.ADS1263_StopContinuous()
+    report("ADS1263_StartContinuous(0)", ADC.SampleCount, time.monotonic() - startTime, time.process_time() - startCpu)
+    print("  interrupt: " + str(ADC.SampleCount) + " of " + str(config.chip.adc1.completed(time.monotonic_ns()) - converted) + " conversions read\n")
+
+    ADC.ADS1263_Exit()
+
+if __name__ == '__main__':
+    main()
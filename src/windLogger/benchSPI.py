@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+#
+# benchSPI.py - counts SPI and GPIO calls per ADC1 sample
+#             - ADS1263_GetChannalValue on a fixed channel (mux write skipped by
+#               the shadow registers) and on alternating channels, against
+#               ADS1263_GetValue (single full duplex transfer, no register traffic)
+#             - the original mux write + read back, polled status and separate
+#               write/read path took 6 SPI calls and 6 CS writes per sample
+#             - ADS1263_GetChannalPair, two inputs per call on ADC1 and ADC2, for
+#               the multi anemometer scan of 2 and 4 inputs
+#             - runs against a counting stand-in for config and RPi.GPIO, so it
+#               needs no hardware - times are Python overhead only
+#
+#   usage: ./benchSPI.py [-h] [-s SAMPLES]
+#
+
+import sys
+import types
+import time
+import argparse
+import collections
+
+#
+# counting stand-in for the config module - answers register reads with what
+# was written and every data read with a fresh conversion and a valid checksum
+#
+
+calls = collections.Counter()
+registers = [0] * 27
+pendingRead = []
+
+def digital_write(pin, value):
+    calls["digital_write"] += 1
+
+def digital_read(pin):
+    calls["digital_read"] += 1
+    return 0
+
+def delay_ms(delaytime):
+    pass
+
+def conversion():
+    data = [0x12, 0x34, 0x56, 0x78]
+    return [0x40] + data + [(sum(data) + 0x9b) & 0xff]
+
+# ADC2 frame - status, 24 bit data, pad byte, checksum
+def conversion2():
+    data = [0x12, 0x34, 0x56]
+    return [0x80] + data + [0x00, (sum(data) + 0x9b) & 0xff]
+
+def spi_writebyte(data):
+    global pendingRead
+    calls["spi_writebyte"] += 1
+    if data[0] & 0xe0 == 0x40:
+        registers[data[0] & 0x1f] = data[2]
+    elif data[0] & 0xe0 == 0x20:
+        pendingRead = [registers[data[0] & 0x1f]]
+    elif data[0] == 0x12:
+        pendingRead = conversion()
+
+def spi_readbytes(n):
+    global pendingRead
+    calls["spi_readbytes"] += 1
+    data, pendingRead = pendingRead[:n], pendingRead[n:]
+    return data
+
+def spi_xfer2(data):
+    calls["spi_xfer2"] += 1
+    if data[0] == 0x14:
+        return [0] + conversion2()
+    return [0] + conversion()
+
+def installStandIns():
+    config = types.ModuleType("config")
+    config.RST_PIN = 18
+    config.CS_PIN = 22
+    config.DRDY_PIN = 17
+    for func in [digital_write, digital_read, delay_ms, spi_writebyte, spi_readbytes, spi_xfer2]:
+        setattr(config, func.__name__, func)
+    gpio = types.ModuleType("RPi.GPIO")
+    gpio.HIGH = 1
+    gpio.LOW = 0
+    config.GPIO = gpio
+    rpi = types.ModuleType("RPi")
+    rpi.GPIO = gpio
+    sys.modules["config"] = config
+    sys.modules["RPi"] = rpi
+    sys.modules["RPi.GPIO"] = gpio
+
+def run(name, func, samples):
+    calls.clear()
+    start = time.perf_counter()
+    for i in range(samples):
+        func()
+    elapsed = time.perf_counter() - start
+    spiCalls = calls["spi_writebyte"] + calls["spi_readbytes"] + calls["spi_xfer2"]
+    print("  {0:<26} {1:5.2f} SPI calls/sample, {2:5.2f} CS writes/sample, {3:7.2f} us/sample".format(
+        name, spiCalls / samples, calls["digital_write"] / samples, elapsed / samples * 1e6))
+
+def main():
+    parser = argparse.ArgumentParser(description='Counts SPI calls per ADS1263 sample.')
+    parser.add_argument("-s", "--samples", help="number of samples to read (default = 100000)", type=int, default=100000)
+    args = parser.parse_args()
+
+    installStandIns()
+    import ADS1263
+
+    ADC = ADS1263.ADS1263()
+    ADC.ADS1263_SetMode(0)
+    ADC.ADS1263_SetChannal(0)
+
+    print("\nReading " + str(args.samples) + " samples...\n")
+    run("ADS1263_GetChannalValue(0)", lambda: ADC.ADS1263_GetChannalValue(0), args.samples)
+    channels = [0, 1] * (args.samples // 2 + 1)
+    run("GetChannalValue(0, 1, ...)", lambda: ADC.ADS1263_GetChannalValue(channels.pop()), args.samples)
+    run("ADS1263_GetValue()", ADC.ADS1263_GetValue, args.samples)
+
+    # per call, i.e. per slot of two inputs, 4 inputs walked forwards and backwards
+    run("GetChannalPair(0, 1)", lambda: ADC.ADS1263_GetChannalPair(0, 1), args.samples)
+    slots = [(0, 1), (2, 3), (2, 3), (0, 1)] * (args.samples // 4 + 1)
+    run("GetChannalPair 4 inputs", lambda: ADC.ADS1263_GetChannalPair(*slots.pop()), args.samples)
+
+if __name__ == '__main__':
+    main()
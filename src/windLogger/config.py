@@ -58,6 +58,15 @@ class RaspberryPi:
         
     def spi_readbytes(self, reg):
         return self.SPI.readbytes(reg)
+
+    def spi_xfer2(self, data):
+        return self.SPI.xfer2(data)
+
+    def gpio_add_falling_callback(self, pin, callback):
+        self.GPIO.add_event_detect(pin, self.GPIO.FALLING, callback=callback)
+
+    def gpio_remove_callback(self, pin):
+        self.GPIO.remove_event_detect(pin)
         
     def module_init(self):
         self.GPIO.setmode(self.GPIO.BCM)
@@ -104,6 +113,15 @@ class JetsonNano:
     def spi_readbytes(self, reg):
         return self.SPI.readbytes(reg)
 
+    def spi_xfer2(self, data):
+        return self.SPI.xfer2(data)
+
+    def gpio_add_falling_callback(self, pin, callback):
+        self.GPIO.add_event_detect(pin, self.GPIO.FALLING, callback=callback)
+
+    def gpio_remove_callback(self, pin):
+        self.GPIO.remove_event_detect(pin)
+
     def module_init(self):
         self.GPIO.setmode(self.GPIO.BCM)
         self.GPIO.setwarnings(False)
@@ -121,7 +139,60 @@ class JetsonNano:
         self.GPIO.cleanup()
         
         
-if os.path.exists('/sys/bus/platform/drivers/gpiomem-bcm2835'):
+class Simulated:
+    # Pin definition
+    RST_PIN     = 18
+    CS_PIN      = 22
+    DRDY_PIN    = 17
+
+    def __init__(self):
+    # software ADS1263 on a stand-in SPI bus and GPIO, see adsSim.py
+        import adsSim
+
+        self.chip = adsSim.SimADS1263(self.CS_PIN, self.DRDY_PIN, self.RST_PIN)
+        self.GPIO = adsSim.SimGPIO(self.chip)
+        self.SPI = adsSim.SimSPI(self.chip)
+
+    def digital_write(self, pin, value):
+        self.GPIO.output(pin, value)
+
+    def digital_read(self, pin):
+        return self.GPIO.input(pin)
+
+    def delay_ms(self, delaytime):
+        time.sleep(delaytime / 1000.0)
+
+    def spi_writebyte(self, data):
+        self.SPI.writebytes(data)
+
+    def spi_readbytes(self, reg):
+        return self.SPI.readbytes(reg)
+
+    def spi_xfer2(self, data):
+        return self.SPI.xfer2(data)
+
+    def gpio_add_falling_callback(self, pin, callback):
+        self.GPIO.add_event_detect(pin, self.GPIO.FALLING, callback=callback)
+
+    def gpio_remove_callback(self, pin):
+        self.GPIO.remove_event_detect(pin)
+
+    def module_init(self):
+        self.GPIO.output(self.RST_PIN, 1)
+        self.GPIO.output(self.CS_PIN, 1)
+        return 0
+
+    def module_exit(self):
+        self.SPI.close()
+        self.GPIO.output(self.RST_PIN, 0)
+        self.GPIO.output(self.CS_PIN, 0)
+        self.GPIO.cleanup()
+
+
+# WINDLOGGER_BACKEND=sim runs everything against the simulated ADC, on any machine
+if os.environ.get('WINDLOGGER_BACKEND') == 'sim':
+    implementation = Simulated()
+elif os.path.exists('/sys/bus/platform/drivers/gpiomem-bcm2835'):
     implementation = RaspberryPi()
 else:
     implementation = JetsonNano()
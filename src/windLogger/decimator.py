@@ -0,0 +1,147 @@
+#
+# decimator.py - anti-alias FIR decimation of an oversampled ADC stream
+#
+# the ADC converts far faster than the logging rate, so instead of keeping one
+# conversion per tick every conversion is pushed through a linear phase low pass
+# FIR (windowed sinc, Blackman window, ~74 dB stopband) and the filter output is
+# evaluated once per output tick - only the outputs that are kept are computed,
+# one dot product per tick over the numTaps inputs around the output time
+#
+# conversions do not arrive at the nominal data rate - the DRDY callback misses
+# conversions it can not keep up with, and the driver's buffer drops the oldest
+# when it overflows - so each conversion comes with the monotonic time it was
+# read and the stream is resampled (linear interpolation) onto a uniform grid at
+# the rate actually measured over the first measureSeconds, and the filter is
+# designed for that rate - a gap of more than maxGapNs between two conversions
+# resets the filter, outputs are only computed from an unbroken window again
+#
+# the filter spans halfWidthPeriods output periods either side of the output
+# time, so the value for a time t can be computed once conversions up to
+# t + halfWidthPeriods output periods are in, output(now - delayNs) always can
+# be while conversions keep coming - the default cutoff of 0.4 x the
+# output rate with halfWidthPeriods = 14 gives a transition band of about 0.2 x
+# the output rate, so everything at or above the output Nyquist frequency is in
+# the stopband
+#
+
+import numpy as np
+
+NS_PER_SECOND = 1000000000
+
+def lowpassTaps(numTaps, cutoff, rate):
+    n = np.arange(numTaps) - (numTaps - 1) / 2
+    taps = np.sinc(2 * cutoff / rate * n) * np.blackman(numTaps)
+    return taps / taps.sum()
+
+class Decimator:
+    def __init__(self, outputRate, halfWidthPeriods=14, cutoff=None, measureSeconds=1.0, maxGapNs=None):
+        self.outputRate = outputRate
+        self.halfWidthPeriods = halfWidthPeriods
+        self.cutoff = 0.4 * outputRate if cutoff is None else cutoff
+        self.measureNs = round(measureSeconds * NS_PER_SECOND)
+        # a quarter output period - shorter gaps are bridged by the interpolation
+        self.maxGapNs = NS_PER_SECOND // (4 * outputRate) if maxGapNs is None else maxGapNs
+        # how far behind the newest conversion outputs can be asked for, one
+        # output period more than the filter needs for conversions still in the
+        # driver's buffer
+        self.delayNs = (halfWidthPeriods + 1) * NS_PER_SECOND // outputRate
+
+        # measured rate, the grid and the filter, set once measureSeconds are in
+        self.inputRate = None
+        self.periodNs = None
+        self.numTaps = None
+        self.taps = None
+        self.measuring = ([], [])
+
+        self.gaps = 0
+        self.lastValue = None
+        self.reset()
+
+    # forget the filter history, the grid restarts at the next conversion - grid
+    # point k is at originNs + k * periodNs, history[0] is grid point startIndex
+    def reset(self):
+        self.history = None
+        self.end = 0
+        self.originNs = None
+        self.startIndex = 0
+        self.nextIndex = 0
+        self.lastNs = None
+
+    # the typical time between conversions, not their mean, so a gap while
+    # measuring does not lower the rate
+    def configure(self, timesNs, values):
+        self.periodNs = float(np.median(np.diff(timesNs)))
+        self.inputRate = NS_PER_SECOND / self.periodNs
+        self.numTaps = 2 * round(self.halfWidthPeriods * self.inputRate / self.outputRate) + 1
+        self.taps = lowpassTaps(self.numTaps, self.cutoff, self.inputRate)
+
+    # add a block of conversions, timesNs their monotonic read times
+    def push(self, timesNs, values):
+        if len(timesNs) == 0:
+            return
+        timesNs = np.asarray(timesNs, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        if self.taps is None:
+            self.measuring[0].append(timesNs)
+            self.measuring[1].append(values)
+            allTimes = np.concatenate(self.measuring[0])
+            if allTimes[-1] - allTimes[0] < self.measureNs:
+                return
+            timesNs, values = allTimes, np.concatenate(self.measuring[1])
+            self.measuring = None
+            self.configure(timesNs, values)
+
+        # split the block at every gap, the filter restarts after each
+        previous = np.concatenate(([timesNs[0] if self.lastNs is None else self.lastNs], timesNs[:-1]))
+        breaks = np.flatnonzero(timesNs - previous > self.maxGapNs)
+        for segment, (segmentNs, segmentValues) in enumerate(zip(np.split(timesNs, breaks), np.split(values, breaks))):
+            if segment > 0:
+                self.gaps += 1
+                self.reset()
+            self.resample(segmentNs, segmentValues)
+
+    # append the grid values from the last conversion up to the newest one
+    def resample(self, timesNs, values):
+        if len(timesNs) == 0:
+            return
+        if self.originNs is None:
+            self.history = np.zeros(4 * self.numTaps)
+            self.originNs = int(timesNs[0])
+        elif self.lastNs is not None:
+            timesNs = np.concatenate(([self.lastNs], timesNs))
+            values = np.concatenate(([self.lastValue], values))
+        self.lastNs = int(timesNs[-1])
+        self.lastValue = float(values[-1])
+
+        lastIndex = int((self.lastNs - self.originNs) // self.periodNs)
+        count = lastIndex - self.nextIndex + 1
+        if count <= 0:
+            return
+        # times relative to the grid origin keep the interpolation precise
+        gridNs = np.arange(self.nextIndex, lastIndex + 1) * self.periodNs
+        block = np.interp(gridNs, (timesNs - self.originNs).astype(np.float64), values)
+        self.nextIndex = lastIndex + 1
+
+        if self.end + count > len(self.history):
+            # slide the newest numTaps values back to the front, growing the
+            # buffer for a block bigger than the room left
+            keep = min(self.end, self.numTaps)
+            self.startIndex += self.end - keep
+            if keep + count > len(self.history):
+                self.history = np.concatenate((self.history[self.end - keep:self.end], np.zeros(count + self.numTaps)))
+            else:
+                self.history[:keep] = self.history[self.end - keep:self.end]
+            self.end = keep
+        self.history[self.end:self.end + count] = block
+        self.end += count
+
+    # filtered value at monotonic time ns, None until the conversions on both
+    # sides of it are in, or if it is before the last gap
+    def output(self, ns):
+        if self.originNs is None:
+            return None
+        center = round((ns - self.originNs) / self.periodNs) - self.startIndex
+        half = self.numTaps // 2
+        if center - half < 0 or center + half >= self.end:
+            return None
+        return float(np.dot(self.taps, self.history[center - half:center + half + 1]))
@@ -0,0 +1,101 @@
+#
+# tickScheduler.py - absolute deadline scheduler for fixed rate sampling
+#
+# ticks are laid out on a fixed grid starting at the next whole second of wall
+# clock time, tick n being due at start + n/rate - deadlines are kept on the
+# monotonic clock so wall clock steps (NTP) cannot stretch or squash the grid, and
+# wait() sleeps until shortly before the deadline and only spins for the last
+# spin seconds, instead of spinning for the whole period
+#
+# the wall clock time of a tick is worked out from the grid, so it is checked
+# every tick that the wall clock has not been stepped against the monotonic one
+# (NTP setting the clock of a Pi without an RTC after the logger started) - when
+# the difference between them moves by more than a period the grid starts again
+# at the next whole second of the new wall clock time, stepNs holds the size of
+# the step for the tick after it and the steps are counted in stats() - NTP
+# slewing adjusts both clocks alike and is not a step
+#
+# every tick records its scheduling jitter (how late wait() returned) - when the
+# caller falls more than a whole period behind, the ticks it missed are either
+# all returned immediately one after the other (catchup, every grid point still
+# gets a sample, late) or skipped and counted (skip, the grid keeps only the
+# ticks that could be sampled on time)
+#
+
+import time
+
+NS_PER_SECOND = 1000000000
+
+MISSED_POLICIES = ["catchup", "skip"]
+
+class DeadlineScheduler:
+    def __init__(self, rate, spin=0.002, missedPolicy="catchup"):
+        if missedPolicy not in MISSED_POLICIES:
+            raise ValueError("unknown missed tick policy: " + missedPolicy)
+        self.periodNs = round(NS_PER_SECOND / rate)
+        self.spinNs = round(spin * NS_PER_SECOND)
+        self.missedPolicy = missedPolicy
+
+        self.stepNs = 0
+        self.anchor()
+        self.resetStats()
+
+    # start the grid at the next whole second of wall clock time
+    def anchor(self):
+        wallNs = time.time_ns()
+        monotonicNs = time.monotonic_ns()
+        self.offsetNs = wallNs - monotonicNs
+        self.startWallNs = (wallNs // NS_PER_SECOND + 1) * NS_PER_SECOND
+        self.startMonotonicNs = monotonicNs + self.startWallNs - wallNs
+        self.tick = -1
+
+    def resetStats(self):
+        self.ticks = 0
+        self.jitterSumNs = 0
+        self.maxJitterNs = 0
+        self.lateTicks = 0
+        self.missedTicks = 0
+        self.clockSteps = 0
+
+    # wait for the next tick, returns its wall clock time and its monotonic
+    # deadline in ns and the number of ticks skipped just before it (always 0
+    # with catchup)
+    def wait(self):
+        self.stepNs = time.time_ns() - time.monotonic_ns() - self.offsetNs
+        if abs(self.stepNs) > self.periodNs:
+            self.clockSteps += 1
+            self.anchor()
+        else:
+            self.stepNs = 0
+        self.tick += 1
+        deadline = self.startMonotonicNs + self.tick * self.periodNs
+        now = time.monotonic_ns()
+
+        missed = 0
+        if now - deadline >= self.periodNs:
+            if self.missedPolicy == "skip":
+                missed = (now - deadline) // self.periodNs
+                self.tick += missed
+                deadline += missed * self.periodNs
+                self.missedTicks += missed
+            else:
+                self.lateTicks += 1
+
+        # sleep most of the way, then spin up to the deadline
+        remaining = deadline - now
+        if remaining > self.spinNs:
+            time.sleep((remaining - self.spinNs) / NS_PER_SECOND)
+        now = time.monotonic_ns()
+        while now < deadline:
+            now = time.monotonic_ns()
+
+        jitter = now - deadline
+        self.ticks += 1
+        self.jitterSumNs += jitter
+        self.maxJitterNs = max(self.maxJitterNs, jitter)
+        return self.startWallNs + self.tick * self.periodNs, deadline, missed
+
+    def stats(self):
+        meanJitter = self.jitterSumNs / self.ticks if self.ticks else 0.0
+        return "{0} ticks, jitter mean {1:.3f} ms, max {2:.3f} ms, {3} more than a period late, {4} skipped, {5} wall clock steps".format(
+            self.ticks, meanJitter / 1e6, self.maxJitterNs / 1e6, self.lateTicks, self.missedTicks, self.clockSteps)
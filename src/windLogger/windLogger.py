@@ -1,4 +1,6 @@
 import os
+import sys
+import time
 import argparse
 import json
 import socket
@@ -6,7 +8,15 @@ import socket
 from datetime import datetime,timedelta
 from time import sleep
 
+import numpy as np
+
 import ADS1263
+from decimator import Decimator
+from tickScheduler import DeadlineScheduler, MISSED_POLICIES
+
+# modules shared with the other loggers live in src/common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from logWriter import addWriterArguments, writerFromArgs
 
 #
 # Deployment Parameters
@@ -20,9 +30,47 @@ MAX_V = 2.0  # Max voltage of anemometer output
 
 REF = 5.08  # ADC reference voltage
 
-ADC_INPUT = 0  # ADC input channel
+EPOCH = datetime(1970, 1, 1)
+
+ADC_INPUT = 0  # ADC input channel (first anemometer)
 FS = 20  # ADC sampling rate
 
+#
+# ADC1 data rate in samples per second from its ADS1263_DRATE name, e.g.
+# ADS1263_7200SPS -> 7200, ADS1263_16d6SPS -> 16.6
+#
+def dataRate(drate):
+    return float(drate[len("ADS1263_"):-len("SPS")].replace("d", "."))
+
+#
+# vectorized conversion of a block of raw ADC codes to volts, two's complement of
+# bits bits - 32 for ADC1, 24 for ADC2
+#
+def codesToVolts(codes, bits=32):
+    codes = np.array(codes, dtype=np.int64)
+    codes[codes >= 1 << (bits - 1)] -= 1 << bits
+    return codes * (REF / ((1 << (bits - 1)) - 1))
+
+#
+# raw ADC1 code (unsigned, as the ADC sends it) of a voltage
+#
+def voltsToCode(volts):
+    return round(volts / (REF / 0x7fffffff)) & 0xffffffff
+
+#
+# vectorized conversion of a block of anemometer voltages to wind speeds
+#
+def voltsToSpeeds(volts):
+    speeds = (np.asarray(volts, dtype=np.float64) - MIN_V) / (MAX_V - MIN_V) * (MAX_WIND - MIN_WIND)
+    return np.maximum(speeds, 0)
+
+#
+# split the anemometer inputs into slots of (ADC1 input, ADC2 input or None) -
+# the two inputs of a slot convert at the same time, slots are read in turn
+#
+def scanSlots(inputs):
+    return [(inputs[i], inputs[i + 1] if i + 1 < len(inputs) else None) for i in range(0, len(inputs), 2)]
+
 #
 # Main method
 #
@@ -33,17 +81,54 @@ def main():
                         action="store",
                         default="./",
                         help="top level directory for log files, use \"\" around names with white space (default = ./)")
+    parser.add_argument("-n", "--numanem",
+                        type=int,
+                        default=1,
+                        help="number of anemometers, wired to consecutive inputs from AIN" + str(ADC_INPUT) + " - more than one are read on ADC1 and ADC2 in parallel and can not be combined with --interrupt (default = 1)")
+    parser.add_argument("-r", "--drate",
+                        choices=list(ADS1263.ADS1263_DRATE),
+                        default="ADS1263_7200SPS",
+                        help="ADC1 data rate (default = ADS1263_7200SPS)")
+    parser.add_argument("--adc2rate",
+                        choices=list(ADS1263.ADS1263_ADC2_DRATE),
+                        default="ADS1263_ADC2_800SPS",
+                        help="ADC2 data rate with more than one anemometer (default = ADS1263_ADC2_800SPS)")
+    parser.add_argument("-i", "--interrupt",
+                        help="run ADC1 in continuous conversion and read each conversion from a DRDY interrupt instead of polling DRDY every sample - use a data rate the callback can keep up with, e.g. ADS1263_400SPS",
+                        action="store_true")
+    parser.add_argument("-o", "--oversample",
+                        help="log every 1/FS the output of an anti-alias FIR filter run over every ADC1 conversion instead of a single conversion, resampled at the conversion rate actually measured (implies --interrupt)",
+                        action="store_true")
+    parser.add_argument("-c", "--regcheck",
+                        type=float,
+                        default=60,
+                        help="seconds between ADC register integrity checks when polling, 0 to disable (default = 60)")
+    parser.add_argument("-m", "--missed",
+                        choices=MISSED_POLICIES,
+                        default="catchup",
+                        help="when sampling falls a whole period behind, catch up on the missed samples or skip them (default = catchup)")
+    parser.add_argument("-s", "--stats",
+                        type=float,
+                        default=3600,
+                        help="seconds between scheduling jitter reports, 0 to disable (default = 3600)")
+    addWriterArguments(parser)
 
     #
     # parse user input
     #
 
     args = parser.parse_args()
+    if args.oversample:
+        args.interrupt = True
+    if args.numanem < 1 or ADC_INPUT + args.numanem > 10:
+        parser.error("numanem must be between 1 and " + str(10 - ADC_INPUT))
+    if args.numanem > 1 and args.interrupt:
+        parser.error("more than one anemometer can not be combined with --interrupt or --oversample")
 
     # initialize ADC
     ADC = ADS1263.ADS1263()
 
-    if (ADC.ADS1263_init_ADC1('ADS1263_7200SPS') == -1):
+    if (ADC.ADS1263_init_ADC1(args.drate) == -1):
         print("Unable to initialize ADC")
         exit(1)
     else:
@@ -51,65 +136,144 @@ def main():
 
     ADC.ADS1263_SetMode(0)
 
+    # in interrupt mode every conversion lands in the driver's sample buffer and
+    # each tick logs the newest one
+    if args.interrupt:
+        ADC.ADS1263_StartContinuous(ADC_INPUT)
+        print("DRDY interrupt acquisition started")
+    elif args.numanem > 1:
+        # several anemometers - ADC2 converts one input while ADC1 converts another
+        ADC.ADS1263_StartADC2(args.adc2rate)
+        slots = scanSlots(list(range(ADC_INPUT, ADC_INPUT + args.numanem)))
+        print("Scanning " + str(args.numanem) + " anemometers in " + str(len(slots)) + " ADC1/ADC2 slot(s)")
+    else:
+        # the input never changes, so select it once rather than every sample
+        ADC.ADS1263_SetChannal(ADC_INPUT)
+    staleTicks = 0
+    scanTicks = 0
+    emptyOutputs = 0
+    filterFilled = False
+
+    # in oversampling mode the conversions are decimated to FS - every row is the
+    # filter output a fixed whole number of output periods back, so it is logged
+    # at its true time and stays on the 1/FS grid
+    if args.oversample:
+        decimator = Decimator(FS)
+        print("Oversampling " + args.drate + ", measuring the conversion rate the DRDY callback keeps up with")
+
     #
     # get system info
     #
     cur_hostname = socket.gethostname()
 
-    try:
-        logFile = None
+    # log files are opened and rotated hourly by the writer, with the next hour's
+    # file pre-created in the background so rotation never holds up sampling
+    logWriter = writerFromArgs(args, args.logDir, "WINDLOG", precreate=True)
 
-        logDirectoryName = os.path.join(args.logDir, "WINDLOG_{0:%Y%m%d}".format(datetime.utcnow()))
-        if not os.path.exists(logDirectoryName):
-            os.makedirs(logDirectoryName)
-        
+    try:
         print("\nWind logging started\nQuit with CTRL+C")
 
-        # start at the next second
-        lastTimestamp = datetime.utcnow()
-        lastTimestamp += timedelta(seconds=1)
-        lastTimestamp = lastTimestamp.replace(microsecond=0)
+        # sample on a fixed 1/FS grid starting at the next second
+        scheduler = DeadlineScheduler(FS, missedPolicy=args.missed)
+        lastStatsTime = time.monotonic()
+        lastCheckTime = lastStatsTime
         while True:
             # wait for timestamp
-            newTimestamp = lastTimestamp + timedelta(seconds=1/FS)
-            if datetime.utcnow() < newTimestamp:
-                continue
+            sampleNs, monotonicNs, missed = scheduler.wait()
+            if scheduler.stepNs:
+                print("  WALL CLOCK STEPPED BY {0:+.3f} s, SAMPLING RESTARTED AT: ".format(scheduler.stepNs / 1e9) + (EPOCH + timedelta(microseconds=sampleNs // 1000)).isoformat() + "\n")
+            if missed:
+                print("  MISSED " + str(missed) + " SAMPLE(S) BEFORE: " + (EPOCH + timedelta(microseconds=sampleNs // 1000)).isoformat() + "\n")
 
-            if newTimestamp.date() != lastTimestamp.date():
-                logDirectoryName = os.path.join(args.logDir, "WINDLOG_{0:%Y%m%d}".format(datetime.utcnow()))
-                if not os.path.exists(logDirectoryName):
-                    os.makedirs(logDirectoryName)
+            if args.stats > 0 and time.monotonic() - lastStatsTime >= args.stats:
+                lastStatsTime = time.monotonic()
+                print("  scheduler: " + scheduler.stats() + "\n")
+                scheduler.resetStats()
+                if args.interrupt:
+                    print("  interrupt: " + str(ADC.SampleCount) + " conversions, " + str(staleTicks) + " sample(s) with no new conversion\n")
+                    staleTicks = 0
+                if args.oversample:
+                    print("  oversampling: " + str(ADC.OverflowCount) + " conversion(s) lost to buffer overflow, " + str(decimator.gaps) + " gap(s) that reset the filter, " + str(emptyOutputs) + " sample(s) with no filter output\n")
+                    emptyOutputs = 0
 
-            lastTimestamp = newTimestamp
+            # the driver only writes registers that change and does not read them
+            # back, so compare them all against its shadow copy now and then - not
+            # in interrupt mode, where the DRDY callback owns the SPI bus
+            if not args.interrupt and args.regcheck > 0 and time.monotonic() - lastCheckTime >= args.regcheck:
+                lastCheckTime = time.monotonic()
+                mismatched = ADC.ADS1263_CheckRegisters()
+                if mismatched:
+                    print("  ADC REGISTER(S) " + ", ".join(mismatched) + " DID NOT MATCH, REWRITTEN\n")
 
-            ADC_value = ADC.ADS1263_GetChannalValue(ADC_INPUT)
-            ADC_voltage = ADC_value * (REF / 0x7fffffff)
+            if args.interrupt:
+                samples = ADC.ADS1263_GetSamples()
+                if not samples:
+                    staleTicks += 1
+                    # the filter still has an output for this tick
+                    if not args.oversample:
+                        continue
 
-            wind_speed = (ADC_voltage - MIN_V) / (MAX_V - MIN_V)
-            wind_speed *= MAX_WIND - MIN_WIND
+            # (input, ADC value, voltage) of every anemometer this tick
+            if args.oversample:
+                configured = decimator.taps is not None
+                gaps = decimator.gaps
+                decimator.push([sample[0] for sample in samples], codesToVolts([sample[1] for sample in samples]))
+                if not configured and decimator.taps is not None:
+                    print("  measured {0:.1f} conversions/s of a nominal {1:g}, {2} tap anti-alias filter\n".format(
+                        decimator.inputRate, dataRate(args.drate), decimator.numTaps))
+                if decimator.gaps > gaps:
+                    print("  GAP IN ADC CONVERSIONS BEFORE: " + (EPOCH + timedelta(microseconds=sampleNs // 1000)).isoformat() + ", filter restarted\n")
+                    filterFilled = False
+                # the row is the filter output delayNs back, on the monotonic clock
+                # of the conversions
+                sampleNs -= decimator.delayNs
+                ADC_voltage = decimator.output(monotonicNs - decimator.delayNs)
+                if ADC_voltage is None:
+                    # filter still filling up, or refilling after a gap - once it
+                    # has filled there should always be an output
+                    if filterFilled:
+                        emptyOutputs += 1
+                    continue
+                filterFilled = True
+                readings = [(ADC_INPUT, voltsToCode(ADC_voltage), ADC_voltage)]
+            elif args.interrupt:
+                readings = [(ADC_INPUT, samples[-1][1], codesToVolts([samples[-1][1]]).tolist()[0])]
+            elif args.numanem > 1:
+                # walk the slots forwards and backwards on alternate ticks, so the
+                # last slot of a tick is the first of the next and its inputs are
+                # still selected - one mux write per ADC less every tick
+                scanTicks += 1
+                readings = []
+                for input1, input2 in (slots if scanTicks % 2 else reversed(slots)):
+                    value1, value2 = ADC.ADS1263_GetChannalPair(input1, input2)
+                    readings.append((input1, value1, codesToVolts([value1]).tolist()[0]))
+                    if input2 is not None:
+                        # ADC2 is 24 bit
+                        readings.append((input2, value2, codesToVolts([value2], bits=24).tolist()[0]))
+                readings.sort()
+            else:
+                ADC_value = ADC.ADS1263_GetValue()
+                readings = [(ADC_INPUT, ADC_value, codesToVolts([ADC_value]).tolist()[0])]
 
-            if wind_speed < 0:
-                wind_speed = 0
+            cur_timestamp = (EPOCH + timedelta(microseconds=sampleNs // 1000)).isoformat() + "Z"
 
-            cur_timestamp = lastTimestamp.isoformat() + "Z"
+            wind_speeds = voltsToSpeeds([reading[2] for reading in readings]).tolist()
+            for (ADC_channel, ADC_value, ADC_voltage), wind_speed in zip(readings, wind_speeds):
+                # a single anemometer keeps the original sensor id
+                sensor_id = "anemometer" if args.numanem == 1 else "anemometer" + str(ADC_channel)
 
-            #
-            # Send to log file
-            #
-            logFilePath = os.path.join(logDirectoryName, "WINDLOG_{0:%Y%m%d-%H}.txt".format(lastTimestamp))
-
-            logFile = open(logFilePath, "a")
-
-            logstring = cur_hostname + ",anemometer," + cur_timestamp + "," + str(ADC_value) + "," + str(ADC_voltage) + "," + str(wind_speed) + "\n"
-            logFile.write(logstring)
+                #
+                # Send to log file
+                #
+                logstring = cur_hostname + "," + sensor_id + "," + cur_timestamp + "," + str(ADC_value) + "," + str(ADC_voltage) + "," + str(wind_speed) + "\n"
+                logWriter.write(sampleNs, logstring, sensor_id)
+            logWriter.poll()
     finally:
         print("Quitting...\n")
-        logFile.close()
+        logWriter.close()
+        if args.interrupt:
+            ADC.ADS1263_StopContinuous()
         ADC.ADS1263_Exit()
 
-    # close rabbitmq connection
-    if args.hostname != "":
-        connection.close()
-
 if __name__ == "__main__":
     main()
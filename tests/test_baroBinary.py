@@ -0,0 +1,46 @@
+import os
+import sys
+import math
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src", "common"))
+from baroBinary import BinaryLogWriter, loadRecords, csvLines, HEADER_SIZE, RECORD_SIZE, NO_TIME
+
+HOUR_NS = 1760000400 * 1000000000
+
+def writeSamples(logDir, samples, sensors=("150000", "150001")):
+    writer = BinaryLogWriter(str(logDir), "BAROLOG", "box1", list(sensors), fsyncPolicy="none")
+    for sensor, sysNs, ns, value in samples:
+        writer.writeSample(sensor, sysNs, ns, value)
+    writer.close()
+    return writer.hourPath(HOUR_NS // (3600 * 1000000000))[1]
+
+def test_torn_record_is_cut_before_appending(tmp_path):
+    path = writeSamples(tmp_path, [(0, HOUR_NS, HOUR_NS - 5000, 14.62), (1, HOUR_NS + 1000, HOUR_NS, 14.7)])
+    with open(path, "ab") as binFile:
+        binFile.write(b"\x01" * (RECORD_SIZE // 2))
+
+    writeSamples(tmp_path, [(1, HOUR_NS + 2000, HOUR_NS + 1000, 14.8)])
+
+    assert (os.path.getsize(path) - HEADER_SIZE) % RECORD_SIZE == 0
+    header, records = loadRecords(path)
+    assert len(records) == 3
+    assert list(records["value"]) == [14.62, 14.7, 14.8]
+    assert [header["sensors"][sensor] for sensor in records["sensor"]] == ["150000", "150001", "150001"]
+
+def test_torn_header_starts_a_new_file(tmp_path):
+    path = writeSamples(tmp_path, [(0, HOUR_NS, HOUR_NS, 14.62)])
+    with open(path, "r+b") as binFile:
+        binFile.truncate(HEADER_SIZE // 2)
+
+    writeSamples(tmp_path, [(0, HOUR_NS + 1000, HOUR_NS + 1000, 14.7)])
+
+    header, records = loadRecords(path)
+    assert list(records["value"]) == [14.7]
+
+def test_csv_lines(tmp_path):
+    path = writeSamples(tmp_path, [(0, HOUR_NS, HOUR_NS - 5000, 14.62), (1, HOUR_NS + 1000, NO_TIME, math.nan)])
+    with open(path, "rb") as binFile:
+        assert list(csvLines(binFile)) == [
+            "box1,150000,2025-10-09T09:00:00Z,2025-10-09T08:59:59.999995Z,14.62\n",
+            "box1,150001,2025-10-09T09:00:00.000001Z,ERROR,\n",
+        ]